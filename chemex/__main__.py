@@ -3,11 +3,14 @@
 import os
 import shutil
 import random
-from copy import deepcopy
+from functools import partial
 from math import log10
 
-from . import fitting, writing, parsing, reading, utils
-from .experiments.reading import read_file_exp
+import scipy as sp
+
+from . import caching, fitting, writing, parsing, reading, utils
+from .experiments.dataset import Dataset
+from .experiments.reading import read_file_exp, set_data_cache
 from .experiments.misc import format_experiment_help
 
 
@@ -39,34 +42,34 @@ def make_bootstrap_dataset(data):
 
     from random import choice
 
-    profiles = {}
+    profiles = []
 
-    for data_point in data:
-        # The reference attribute is added to the profile id to separate the
-        # reference points from the rest and make sure they are always present
-        # in the bootstrapped sample
-        reference = data_point.par.get('reference', False)
-        profile_id = (data_point.par['profile_id'], reference)
+    for profile in data.profiles:
+        # The reference points are resampled separately from the rest to make
+        # sure they are always present in the bootstrapped sample
+        reference = profile.get_par('reference', False).astype(bool)
 
-        profiles.setdefault(profile_id, []).append(data_point)
+        indexes = []
 
-    data_bs = []
+        for subset in (reference, ~reference):
+            subset_indexes = sp.flatnonzero(subset)
+            indexes.extend(choice(subset_indexes) for _ in subset_indexes)
 
-    for profile in profiles.values():
-        data_bs.extend(
-            [choice(profile) for _ in xrange(len(profile))]
-        )
+        profiles.append(profile.take(indexes))
 
-    return data_bs
+    return Dataset(profiles)
 
 
 def make_montecarlo_dataset(data):
     """Creates a new dataset to run a Monte-Carlo simulation"""
 
-    data_mc = deepcopy(data)
+    data_mc = data.copy()
+
+    # The generator is seeded from 'random', which is seeded for each replica
+    generator = sp.random.RandomState(random.getrandbits(32))
 
-    for data_pt in data_mc:
-        data_pt.val = random.gauss(data_pt.cal, data_pt.err)
+    for profile in data_mc.profiles:
+        profile.val = generator.normal(profile.cal, profile.err)
 
     return data_mc
 
@@ -83,12 +86,13 @@ def read_data(args):
         print("\nFile(s):")
         for index, filename in enumerate(args.experiments, 1):
             print("  {}. {}".format(index, filename))
-            data.extend(read_file_exp(filename, args.res_incl, args.res_excl))
+            data.extend(read_file_exp(filename, args.res_incl, args.res_excl,
+                                      args.jobs))
 
     if not data:
         exit("\nNo Data to fit!\n")
 
-    return data
+    return Dataset.from_data_points(data)
 
 
 def write_results(par, par_err, par_indexes, par_fixed, data, method,
@@ -132,7 +136,8 @@ def plot_results(par, par_indexes, par_fixed, data, output_dir):
 def fit_write_plot(args, par, par_indexes, par_fixed, data, output_dir):
     # Fit the data to the model
     par_fit, par_err, par_indexes, par_fixed = \
-        fitting.run_fit(args.method, par, par_indexes, par_fixed, data)
+        fitting.run_fit(args.method, par, par_indexes, par_fixed, data,
+                        args.jobs, args.sparse)
 
     utils.make_dir(output_dir)
 
@@ -153,6 +158,76 @@ def fit_write_plot(args, par, par_indexes, par_fixed, data, output_dir):
     return par_fit, par_err, par_indexes, par_fixed
 
 
+def make_replica_dataset(data, bootstrap, seed):
+    """Creates the bootstrap or Monte-Carlo replica of the dataset drawn
+    from 'seed'"""
+
+    # Each replica has its own seed so that the replicas do not depend on
+    # the worker process they are fitted in, and so that the main process can
+    # rebuild them to write the results
+    random.seed(seed)
+
+    if bootstrap:
+        return make_bootstrap_dataset(data)
+
+    return make_montecarlo_dataset(data)
+
+
+def fit_replica(args, par, par_indexes, par_fixed, data, seed):
+    """Fits a bootstrap or Monte-Carlo replica of the dataset"""
+
+    data_replica = make_replica_dataset(data, bool(args.bs), seed)
+
+    return fitting.run_fit(args.method, par, par_indexes, par_fixed,
+                           data_replica, sparse=args.sparse)
+
+
+def run_simulations(args, par, par_indexes, par_fixed, data, output_dir):
+    """Runs the bootstrap or Monte-Carlo simulations, writes the results of
+    each replica in its own sub-directory and the fitted parameters of all
+    the replicas in a single file"""
+
+    bootstrap = bool(args.bs)
+    n = int(args.bs) if bootstrap else int(args.mc)
+    simulation = 'bootstrap' if bootstrap else 'montecarlo'
+    formatter_output_dir = ''.join(['{:0', str(int(log10(n)) + 1), 'd}'])
+
+    seeds = [random.getrandbits(32) for _ in range(n)]
+
+    tasks = [
+        partial(fit_replica, args, par, par_indexes, par_fixed, data, seed)
+        for seed in seeds
+    ]
+
+    pars = []
+
+    results = utils.run_tasks(tasks, args.jobs)
+
+    for index, (seed, result) in enumerate(zip(seeds, results), 1):
+        par_fit, par_err, par_indexes_fit, par_fixed_fit = result
+        data_replica = make_replica_dataset(data, bootstrap, seed)
+
+        output_dir_ = os.path.join(output_dir,
+                                   formatter_output_dir.format(index))
+        utils.make_dir(output_dir_)
+
+        write_results(par_fit, par_err, par_indexes_fit, par_fixed_fit,
+                      data_replica, args.method, output_dir_)
+
+        if not args.noplot:
+            plot_results(par_fit, par_indexes_fit, par_fixed_fit,
+                         data_replica, output_dir_)
+
+        pars.append(par_fit)
+
+    utils.header1("Writing Results")
+
+    print("\nFile(s):")
+
+    writing.write_par_simulations(pars, par_indexes_fit, output_dir=output_dir,
+                                  filename='.'.join([simulation, 'fit']))
+
+
 def main():
     """All the magic"""
 
@@ -166,6 +241,25 @@ def main():
 
     elif args.commands == 'fit':
 
+        for pattern, maxsize in args.cache_size:
+            caching.set_maxsize(pattern, maxsize)
+        for pattern, rtol in args.cache_rtol:
+            caching.set_rtol(pattern, rtol)
+            if rtol > 1e-2 * caching.FINITE_DIFFERENCE_STEP:
+                print("Warning: the numerical derivatives of the caches "
+                      "matching '{}' may be off by up to {:.0%}".format(
+                          pattern, rtol / caching.FINITE_DIFFERENCE_STEP))
+        if args.disk_cache:
+            caching.set_disk_cache('chemex.experiments.*._calc_observables',
+                                   args.disk_cache,
+                                   args.disk_cache_size * 2 ** 20)
+        elif args.shared_cache:
+            caching.set_shared_cache('chemex.experiments.*._calc_observables',
+                                     args.disk_cache_size * 2 ** 20)
+
+        if args.data_cache:
+            set_data_cache(args.data_cache)
+
         # Read experimental points
         data = read_data(args)
 
@@ -180,6 +274,8 @@ def main():
             if len(args.res_incl) == 1:
                 output_dir = os.path.join(output_dir, args.res_incl[0].upper())
 
+        # The bootstrap replicas start from the initial parameters, the
+        # Monte-Carlo ones need the best fit to draw the replicas from
         if not args.bs:
             par, par_err, par_indexes, par_fixed = \
                 fit_write_plot(
@@ -192,29 +288,13 @@ def main():
                 )
 
         if args.bs or args.mc:
+            run_simulations(args, par, par_indexes, par_fixed, data,
+                            output_dir)
 
-            n = int(args.bs) if args.bs else int(args.mc)
-            formatter_output_dir = \
-                ''.join(['{:0', str(int(log10(n)) + 1), 'd}'])
-
-            for index in range(1, n + 1):
-
-                if args.bs:
-                    data_index = make_bootstrap_dataset(data)
-                else:
-                    data_index = make_montecarlo_dataset(data)
-
-                output_dir_ = \
-                    os.path.join(output_dir, formatter_output_dir.format(index))
-
-                fit_write_plot(
-                    args,
-                    par,
-                    par_indexes,
-                    par_fixed,
-                    data_index,
-                    output_dir_
-                )
+        if args.cache_stats:
+            utils.header1("Cache Statistics")
+            print("")
+            print(caching.format_cache_stats())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,182 @@
+"""
+Assembly of the Liouvillians from the basis matrices.
+
+The basis matrices a Liouvillian is made of are stacked once in a coefficient
+tensor of shape (n_terms, d, d), so that the Liouvillian is then obtained with
+a single product of the parameters against the stack, instead of allocating a
+new array for each term of the sum.
+
+The same stacks give the sparsity pattern of the Liouvillians, from which the
+subspaces that are left invariant by the propagators are found.
+"""
+
+# Imports
+from scipy import (asarray, dot, rollaxis, broadcast_arrays, flatnonzero, in1d,
+                   unique)
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+
+
+def make_compute_liouvillian(*basis_matrices):
+    """
+    Makes the function computing the linear combination of 'basis_matrices'.
+
+    Parameters
+    ----------
+    basis_matrices : ndarray
+        Basis matrices (e.g. R_IXY, DR_IXY, R_IZ, CS, DW), shape (d, d).
+
+    Returns
+    -------
+    out : function
+        Function computing the Liouvillian from the coefficients of the basis
+        matrices, given in the same order. With floats, the Liouvillian is
+        returned, shape (d, d). With arrays (e.g. one value per residue or per
+        set of parameters), a batch of Liouvillians is returned, shape
+        (..., d, d); floats are then shared by the whole batch.
+
+    """
+
+    stack = asarray(basis_matrices, dtype=float)
+    shape = stack.shape[1:]
+
+    # The tensor product with the (n_terms, d, d) stack is carried out as a
+    # single matrix product with its (n_terms, d * d) view
+    stack = stack.reshape(len(basis_matrices), -1)
+    stack.flags.writeable = False
+
+    def compute_liouvillian(*coefficients):
+        """
+        Computes sum(coefficient * basis_matrix).
+
+        Parameters
+        ----------
+        coefficients : float or ndarray
+            Coefficients of the basis matrices.
+
+        Returns
+        -------
+        out : ndarray
+            Liouvillian, or batch of Liouvillians.
+
+        """
+
+        try:
+            coefficients = asarray(coefficients, dtype=float)
+        except ValueError:
+            coefficients = asarray(broadcast_arrays(*coefficients))
+
+        if coefficients.ndim > 1:
+            # Batch of Liouvillians: the terms go along the last axis
+            coefficients = rollaxis(coefficients, 0, coefficients.ndim)
+
+        return dot(coefficients, stack).reshape(coefficients.shape[:-1] + shape)
+
+    compute_liouvillian.stack = stack.reshape((-1,) + shape)
+
+    return compute_liouvillian
+
+
+def stack_parameters(kwargs_list, names):
+    """
+    Gathers the parameters of several residues, e.g. to build their
+    Liouvillians in a single call (see 'make_compute_liouvillian').
+
+    Parameters
+    ----------
+    kwargs_list : list of dict
+        Parameters of each residue.
+    names : sequence of str
+        Names of the parameters to gather.
+
+    Returns
+    -------
+    out : list
+        Values of each parameter, in the order of 'names': an array with one
+        value per residue, or a single value if all the residues share it
+        (e.g. the populations and exchange rates of a global fit, whose
+        exchange block is then cached as usual).
+
+    """
+
+    parameters = []
+
+    for name in names:
+        values = [kwargs[name] for kwargs in kwargs_list]
+
+        if all(value == values[0] for value in values):
+            parameters.append(values[0])
+        else:
+            parameters.append(asarray(values, dtype=float))
+
+    return parameters
+
+
+def find_invariant_subspace(indexes, *matrices):
+    """
+    Finds the smallest subspace containing the basis elements 'indexes' that is
+    left invariant by all the linear combinations of 'matrices'.
+
+    Two basis elements are coupled whenever one of the matrices has a non-zero
+    element connecting them. The subspace is made of the connected components
+    of the coupling graph that contain 'indexes', so that the propagation of
+    a magnetization starting in (and detected in) 'indexes' can be done with
+    the restriction of the Liouvillian to that subspace.
+
+    Parameters
+    ----------
+    indexes : sequence of int
+        Basis elements of the initial magnetization and of the observable.
+    matrices : ndarray
+        Matrices (e.g. basis matrices or stacks of them), shape (..., d, d).
+
+    Returns
+    -------
+    out : ndarray
+        Sorted indexes of the basis elements spanning the subspace.
+
+    """
+
+    labels = _label_coupled_elements(matrices)
+
+    return flatnonzero(in1d(labels, labels[list(indexes)]))
+
+
+def find_invariant_subspaces(*matrices):
+    """
+    Splits the basis into the smallest subspaces that are left invariant by
+    all the linear combinations of 'matrices' (see 'find_invariant_subspace').
+
+    The Liouvillians made of 'matrices' are block diagonal in these subspaces,
+    so that they can be exponentiated block by block (e.g. the longitudinal
+    and transverse elements during free precession).
+
+    Parameters
+    ----------
+    matrices : ndarray
+        Matrices (e.g. basis matrices or stacks of them), shape (..., d, d).
+
+    Returns
+    -------
+    out : list of ndarray
+        Sorted indexes of the basis elements spanning each subspace.
+
+    """
+
+    labels = _label_coupled_elements(matrices)
+
+    return [flatnonzero(labels == label) for label in unique(labels)]
+
+
+def _label_coupled_elements(matrices):
+    """Labels the basis elements by connected component of the coupling graph
+    of 'matrices'"""
+
+    pattern = sum(
+        (asarray(matrix) != 0.0).reshape((-1,) + asarray(matrix).shape[-2:]).any(axis=0)
+        for matrix in matrices
+    )
+
+    _, labels = connected_components(csr_matrix(pattern), connection='weak')
+
+    return labels
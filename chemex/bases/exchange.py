@@ -0,0 +1,167 @@
+"""
+Exchange blocks of the Liouvillians.
+
+The exchange block only depends on the populations and exchange rates, which
+are usually shared by all the residues of a global fit. It is cached here,
+independently of the back-calculation closures of the residues, so that it is
+built once per set of global parameters.
+"""
+
+# Imports
+from scipy import ndarray
+
+from chemex.bases.assembly import make_compute_liouvillian
+from chemex.caching import lru_cache
+
+
+def make_compute_exchange_matrix_2st(kab_matrix, kba_matrix):
+    """
+    Makes the function computing the exchange block of a 2-site (A <-> B)
+    exchanging system in the basis of 'kab_matrix' and 'kba_matrix'.
+
+    Parameters
+    ----------
+    kab_matrix, kba_matrix : ndarray
+        Exchange rate matrices (e.g. KAB and KBA) of the basis.
+
+    Returns
+    -------
+    out : function
+        Function computing the exchange block from 'pb' and 'kex'.
+
+    """
+
+    compute_exchange_matrices = make_compute_liouvillian(kab_matrix, kba_matrix)
+
+    @lru_cache(100)
+    def _compute_exchange_matrix(pb=0.0, kex=0.0):
+        kab = kex * pb
+        kba = kex - kab
+
+        exchange_matrix = kab_matrix * kab + kba_matrix * kba
+        exchange_matrix.flags.writeable = False
+
+        return exchange_matrix
+
+    def compute_exchange_matrix(pb=0.0, kex=0.0):
+        """
+        Computes the exchange block KAB * kab + KBA * kba.
+
+        Parameters
+        ----------
+        pb : float or ndarray
+            Fractional population of state B.
+            0.0 for 0%, 1.0 for 100%.
+        kex : float or ndarray
+            Exchange rate between state A and B in /s.
+
+        Returns
+        -------
+        out : ndarray
+            Exchange block of the Liouvillian (read-only, as it is shared),
+            or batch of exchange blocks (not cached) if any of the parameters
+            is an array.
+
+        """
+
+        if isinstance(pb, ndarray) or isinstance(kex, ndarray):
+            kab = kex * pb
+            return compute_exchange_matrices(kab, kex - kab)
+
+        return _compute_exchange_matrix(pb, kex)
+
+    compute_exchange_matrix.stack = compute_exchange_matrices.stack
+
+    return compute_exchange_matrix
+
+
+def make_compute_exchange_matrix_3st(kab_matrix, kba_matrix, kbc_matrix,
+                                     kcb_matrix, kac_matrix, kca_matrix):
+    """
+    Makes the function computing the exchange block of a 3-site
+    (A <-> B <-> C <-> A) exchanging system in the basis of the given exchange
+    rate matrices.
+
+    Parameters
+    ----------
+    kab_matrix, kba_matrix, kbc_matrix, kcb_matrix, kac_matrix, kca_matrix : ndarray
+        Exchange rate matrices (e.g. KAB, KBA, ...) of the basis.
+
+    Returns
+    -------
+    out : function
+        Function computing the exchange block from 'pb', 'pc', 'kex_ab',
+        'kex_bc' and 'kex_ac'.
+
+    """
+
+    compute_exchange_matrices = make_compute_liouvillian(
+        kab_matrix, kba_matrix, kbc_matrix, kcb_matrix, kac_matrix, kca_matrix
+    )
+
+    def compute_rates(pb, pc, kex_ab, kex_bc, kex_ac):
+        """Computes the rates kab, kba, kbc, kcb, kac and kca"""
+
+        pa = 1.0 - pb - pc
+
+        kab = kex_ab * pb / (pa + pb)
+        kba = kex_ab * pa / (pa + pb)
+
+        kbc = kex_bc * pc / (pb + pc)
+        kcb = kex_bc * pb / (pb + pc)
+
+        kac = kex_ac * pc / (pa + pc)
+        kca = kex_ac * pa / (pa + pc)
+
+        return kab, kba, kbc, kcb, kac, kca
+
+    @lru_cache(100)
+    def _compute_exchange_matrix(pb=0.0, pc=0.0, kex_ab=0.0, kex_bc=0.0,
+                                 kex_ac=0.0):
+        kab, kba, kbc, kcb, kac, kca = compute_rates(pb, pc, kex_ab, kex_bc,
+                                                     kex_ac)
+
+        exchange_matrix = (
+            kab_matrix * kab +
+            kba_matrix * kba +
+            kbc_matrix * kbc +
+            kcb_matrix * kcb +
+            kac_matrix * kac +
+            kca_matrix * kca
+        )
+        exchange_matrix.flags.writeable = False
+
+        return exchange_matrix
+
+    def compute_exchange_matrix(pb=0.0, pc=0.0, kex_ab=0.0, kex_bc=0.0,
+                                kex_ac=0.0):
+        """
+        Computes the exchange block KAB * kab + KBA * kba + ... + KCA * kca.
+
+        Parameters
+        ----------
+        pb, pc : float or ndarray
+            Fractional populations of states B and C.
+            0.0 for 0%, 1.0 for 100%.
+        kex_ab, kex_bc, kex_ac : float or ndarray
+            Exchange rates between states A and B, B and C, and A and C in /s.
+
+        Returns
+        -------
+        out : ndarray
+            Exchange block of the Liouvillian (read-only, as it is shared),
+            or batch of exchange blocks (not cached) if any of the parameters
+            is an array.
+
+        """
+
+        parameters = (pb, pc, kex_ab, kex_bc, kex_ac)
+
+        if any(isinstance(parameter, ndarray) for parameter in parameters):
+            return compute_exchange_matrices(*compute_rates(*parameters))
+
+        return _compute_exchange_matrix(*parameters)
+
+    compute_exchange_matrix.stack = compute_exchange_matrices.stack
+
+    return compute_exchange_matrix
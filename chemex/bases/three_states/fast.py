@@ -7,6 +7,8 @@ Created on 2013-10-03
 # Imports
 from scipy import eye, kron, diag
 
+from chemex.bases.exchange import make_compute_exchange_matrix_3st
+
 
 # Define the basis for the liouvillian
 # States: B, C or all states
@@ -57,3 +59,6 @@ KCA = kron([[+0.0, +0.0, +1.0],
 
 # 180 degree y pulse
 P_180Y = diag([1.0, -1.0, 1.0, -1.0, 1.0, -1.0])
+
+# Exchange block, cached across residues
+compute_exchange_matrix = make_compute_exchange_matrix_3st(KAB, KBA, KBC, KCB, KAC, KCA)
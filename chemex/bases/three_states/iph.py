@@ -1,5 +1,7 @@
 from scipy import eye, kron, diag
 
+from chemex.bases.exchange import make_compute_exchange_matrix_3st
+
 
 # Define the basis for the liouvillian
 # Axes: _XY, __Z
@@ -63,3 +65,6 @@ KCA = kron([[+0.0, +0.0, +1.0],
 W1X = kron(_ABC, [[+0.0, +0.0, +0.0],
                   [+0.0, +0.0, -1.0],
                   [+0.0, +1.0, +0.0]])
+
+# Exchange block, cached across residues
+compute_exchange_matrix = make_compute_exchange_matrix_3st(KAB, KBA, KBC, KCB, KAC, KCA)
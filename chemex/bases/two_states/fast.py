@@ -1,5 +1,7 @@
 from scipy import eye, kron, diag
 
+from chemex.bases.exchange import make_compute_exchange_matrix_2st
+
 
 # Define the basis for the liouvillian
 # States: B or both A & B
@@ -28,3 +30,6 @@ KBA = kron([[0.0, +1.0],
 
 # 180 degree y pulse
 P_180Y = diag([1.0, -1.0, 1.0, -1.0])
+
+# Exchange block, cached across residues
+compute_exchange_matrix = make_compute_exchange_matrix_2st(KAB, KBA)
@@ -1,5 +1,7 @@
 from scipy import array, zeros, ones, kron, eye
 
+from chemex.bases.exchange import make_compute_exchange_matrix_2st
+
 # Temporary matrices to help build the liouvillian basis
 TMP1 = array([[+0.0, -1.0],
               [+1.0, +0.0]])
@@ -116,3 +118,6 @@ W1Y_N[15:30, 15:30] += W1Y_N[0:15, 0:15]
 # Some cleaning
 del TMP1
 del TMP2
+
+# Exchange block, cached across residues
+compute_exchange_matrix = make_compute_exchange_matrix_2st(KAB, KBA)
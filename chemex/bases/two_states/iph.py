@@ -7,6 +7,8 @@ Created on 2013-10-03
 # Imports
 from scipy import eye, kron, diag
 
+from chemex.bases.exchange import make_compute_exchange_matrix_2st
+
 
 # Define the basis for the liouvillian
 # Axes: _XY, __Z
@@ -55,4 +57,5 @@ W1Y = kron(eye(2), [[+0.0, +0.0, +1.0],
                     [+0.0, +0.0, +0.0],
                     [-1.0, +0.0, +0.0]])
 
-
+# Exchange block, cached across residues
+compute_exchange_matrix = make_compute_exchange_matrix_2st(KAB, KBA)
@@ -7,6 +7,8 @@ Created on 2013-10-03
 # Imports
 from scipy import eye, kron, diag
 
+from chemex.bases.exchange import make_compute_exchange_matrix_2st
+
 
 # Define the basis for the liouvillian
 # Axes: _XY, __Z
@@ -69,4 +71,5 @@ W1Y = kron(_AB, kron(_IA, [[+0.0, +0.0, +1.0],
 # 180 degree pulse on S
 P180_S = kron(eye(2), kron(diag([+1.0, -1.0]), eye(3)))
 
-
+# Exchange block, cached across residues
+compute_exchange_matrix = make_compute_exchange_matrix_2st(KAB, KBA)
@@ -7,6 +7,8 @@ Created on 2013-10-03
 # Imports
 from scipy import eye, kron, diag
 
+from chemex.bases.exchange import make_compute_exchange_matrix_2st
+
 
 # Define the basis for the liouvillian
 # States: B or both A & B
@@ -34,3 +36,5 @@ KAB = kron([[-1.0, 0.0],
 KBA = kron([[0.0, +1.0],
             [0.0, -1.0]], eye(4))
 
+# Exchange block, cached across residues
+compute_exchange_matrix = make_compute_exchange_matrix_2st(KAB, KBA)
@@ -1,7 +1,21 @@
 # # {{{ http://code.activestate.com/recipes/578078-py26-and-py30-backport-of-python-33s-lru-cache/
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
+from fnmatch import fnmatch
 from functools import update_wrapper
-from threading import RLock
+from hashlib import sha1
+from math import frexp
+from threading import RLock, local
+from time import time
+import atexit
+import cPickle as pickle
+import os
+import sqlite3
+import tempfile
+
+from numpy import ndarray, asarray, ascontiguousarray
+
+from chemex.version import __version__
 
 _CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
 
@@ -38,6 +52,156 @@ def _make_key(args, kwds, typed,
     return _HashedSeq(key)
 
 
+# Relative step of the finite differences used for the Jacobian (sqrt(epsfcn)
+# in 'Profile.calc_jacobian'): a tolerance at least as large would make the
+# perturbed calls hit the results of the unperturbed ones.
+FINITE_DIFFERENCE_STEP = 1e-5
+
+# One inexact hit out of '_ERROR_SAMPLING' is evaluated again to estimate the
+# error of the results returned in tolerance mode.
+_ERROR_SAMPLING = 16
+
+
+def _quantize(value, rtol, frexp=frexp, float=float):
+    """Rounds a float to a relative tolerance 'rtol' (other values are
+    returned unchanged)"""
+    if isinstance(value, float) and value:
+        step = rtol * 2.0 ** frexp(value)[1]
+        return value.__class__(round(value / step) * step)
+    return value
+
+
+def _make_quantized_key(args, kwds, typed, rtol):
+    """Make a cache key in which the floats are rounded to the relative
+    tolerance 'rtol', so that nearly identical calls share the same key"""
+    args = tuple(_quantize(value, rtol) for value in args)
+    kwds = dict((name, _quantize(value, rtol)) for name, value in kwds.items())
+    return _HashedSeq((_make_key(args, kwds, typed),))
+
+
+def _calc_deviation(args_1, args_2):
+    """Returns the largest relative difference between the floats of two
+    (args, kwds) pairs"""
+    values_1 = list(args_1[0]) + [value for _, value in sorted(args_1[1].items())]
+    values_2 = list(args_2[0]) + [value for _, value in sorted(args_2[1].items())]
+    deviation = 0.0
+    for value_1, value_2 in zip(values_1, values_2):
+        if isinstance(value_1, float) and value_1 != value_2:
+            deviation = max(deviation, abs(value_1 - value_2) /
+                            max(abs(value_1), abs(value_2)))
+    return deviation
+
+
+def _calc_error(result_1, result_2):
+    """Returns the largest difference between two results relative to their
+    magnitude, or None if they are not (sequences of) floats or arrays"""
+    if isinstance(result_1, (tuple, list)):
+        errors = [_calc_error(item_1, item_2)
+                  for item_1, item_2 in zip(result_1, result_2)]
+        if not errors or None in errors:
+            return None
+        return max(errors)
+    elif isinstance(result_1, (float, ndarray)):
+        values_1, values_2 = asarray(result_1), asarray(result_2)
+        if not values_1.size:
+            return 0.0
+        scale = max(abs(values_1).max(), abs(values_2).max())
+        if not scale:
+            return 0.0
+        return float(abs(values_1 - values_2).max() / scale)
+    return None
+
+
+# Calls of the cached functions being evaluated in the current thread. The
+# functions decorated during one of these calls (e.g. the closures made by
+# the 'make_calc_observables' factories) remember it as their context, so
+# that the experimental setup they depend on becomes part of their disk key.
+_local = local()
+
+
+def _get_contexts():
+    """Returns the stack of the cached calls being evaluated in this thread"""
+    try:
+        return _local.contexts
+    except AttributeError:
+        _local.contexts = []
+        return _local.contexts
+
+
+def _get_context():
+    """Returns the innermost cached call being evaluated, if any"""
+    contexts = _get_contexts()
+    return contexts[-1] if contexts else None
+
+
+@contextmanager
+def finite_differences():
+    """Marks the calls made in the block as finite-difference evaluations.
+    Their results are still cached in memory and can be read from the shared
+    cache, but they are not written to it: the perturbed parameters are
+    unlikely to be evaluated again by another process."""
+    _local.finite_differences = getattr(_local, 'finite_differences', 0) + 1
+    try:
+        yield
+    finally:
+        _local.finite_differences -= 1
+
+
+def _encode(value):
+    """Encodes a value as a string that does not depend on the process (floats
+    are encoded exactly), raises TypeError for unsupported types"""
+    if isinstance(value, float):
+        return float.hex(value)
+    elif value is None or isinstance(value, (bool, int, long, str, unicode)):
+        return repr(value)
+    elif isinstance(value, (tuple, list)):
+        return '({})'.format(','.join(_encode(item) for item in value))
+    elif isinstance(value, dict):
+        return '{{{}}}'.format(','.join(
+            ':'.join([_encode(name), _encode(item)])
+            for name, item in sorted(value.items())))
+    elif isinstance(value, ndarray):
+        return 'array({},{},{})'.format(value.dtype.str, value.shape,
+                                        sha1(ascontiguousarray(value)).hexdigest())
+    raise TypeError('cannot encode {!r}'.format(type(value)))
+
+
+_source_hash = []
+
+
+def get_source_hash():
+    """Returns the hash of the source files of the package (computed once), so
+    that the results stored on disk are not reused after the code changed,
+    e.g. a Liouvillian or a propagator the cached function calls, or the
+    reading of the data files (see 'set_data_cache')"""
+    if not _source_hash:
+        digest = sha1()
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        for dirpath, dirnames, filenames in os.walk(package_dir):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.endswith('.py'):
+                    with open(os.path.join(dirpath, filename), 'rb') as source:
+                        digest.update(source.read())
+        _source_hash.append(digest.hexdigest())
+    return _source_hash[0]
+
+
+def _make_disk_key(record, context, args, kwds, rtol):
+    """Makes the key of a call in the disk cache from the name and the code of
+    the function, the source of the package, the calls of the enclosing
+    factories and the arguments. Returns None if the call cannot be
+    encoded."""
+    if rtol:
+        args = tuple(_quantize(value, rtol) for value in args)
+        kwds = dict((key, _quantize(value, rtol)) for key, value in kwds.items())
+    try:
+        return sha1(_encode((__version__, get_source_hash(), record.name,
+                             record.code, context, args, kwds))).hexdigest()
+    except TypeError:
+        return None
+
+
 def lru_cache(maxsize=100, typed=False):
     """Least-recently-used cache decorator.
 
@@ -54,6 +218,14 @@ def lru_cache(maxsize=100, typed=False):
     f.cache_info().  Clear the cache and statistics with f.cache_clear().
     Access the underlying function with f.__wrapped__.
 
+    The cache joins the registry of this module, which aggregates the hits,
+    misses, evictions and time saved of all the caches of a function (see
+    'format_cache_stats') and lets their maximum size be changed at run time
+    (see 'set_maxsize'). The float arguments can also be compared within a
+    relative tolerance (see 'set_rtol'), the results can be stored on disk
+    to be reused by later runs (see 'set_disk_cache') or shared by worker
+    processes (see 'set_shared_cache').
+
     See:  http://en.wikipedia.org/wiki/Cache_algorithms#Least_Recently_Used
 
     """
@@ -65,94 +237,172 @@ def lru_cache(maxsize=100, typed=False):
 
     def decorating_function(user_function):
 
+        record = _register(user_function, maxsize)
+        context = _get_context()  # call of the enclosing factory, if any
+        # a closure made outside of a cached factory call depends on a setup
+        # that cannot be told apart on disk
+        disk_allowed = context is not None or not getattr(
+            user_function, '__closure__', None)
         cache = dict()
         stats = [0, 0]  # make statistics updateable non-locally
         HITS, MISSES = 0, 1  # names for the stats fields
         make_key = _make_key
         cache_get = cache.get  # bound method to lookup key or return None
         _len = len  # localize the global len() function
+        _timer = time  # localize the global time() function
         lock = RLock()  # because linkedlist updates aren't threadsafe
         root = []  # root of the circular doubly linked list
-        root[:] = [root, root, None, None]  # initialize by pointing to self
+        root[:] = [root, root, None, None, 0.0, None]  # initialize by pointing to self
         nonlocal_root = [root]  # make updateable non-locally
-        PREV, NEXT, KEY, RESULT = 0, 1, 2, 3  # names for the link fields
+        PREV, NEXT, KEY, RESULT, ELAPSED, ARGS = 0, 1, 2, 3, 4, 5  # names for the link fields
 
-        if maxsize == 0:
-
-            def wrapper(*args, **kwds):
-                # no caching, just do a statistics update after a successful call
-                result = user_function(*args, **kwds)
-                stats[MISSES] += 1
+        def wrapper(*args, **kwds):
+            # size limited caching that tracks accesses by recency, the size
+            # being read from the registry at each call so that it can be
+            # changed at run time
+            maxsize = record.maxsize
+            if maxsize == 0:
+                # no caching, just do a statistics update after a successful
+                # call (the call is still the context of the functions it
+                # creates, e.g. the closures of a factory)
+                contexts = _get_contexts()
+                contexts.append((record.name, args, kwds, context))
+                try:
+                    result = user_function(*args, **kwds)
+                finally:
+                    contexts.pop()
+                with lock:
+                    stats[MISSES] += 1
+                    record.misses += 1
                 return result
-
-        elif maxsize is None:
-
-            def wrapper(*args, **kwds):
-                # simple caching without ordering or size limit
-                key = make_key(args, kwds, typed)
-                result = cache_get(key,
-                                   root)  # root used here as a unique not-found sentinel
-                if result is not root:
+            rtol = record.rtol
+            if rtol:
+                # opt-in: floats are compared within a relative tolerance
+                key = _make_quantized_key(args, kwds, typed, rtol)
+            else:
+                key = make_key(args, kwds, typed) if kwds or typed else args
+            check = False
+            with lock:
+                link = cache_get(key)
+                if link is not None:
+                    # record recent use of the key by moving it to the front of the list
+                    root, = nonlocal_root
+                    link_prev, link_next, key, result, elapsed, link_args = link
+                    if link_args is not None:
+                        deviation = _calc_deviation(link_args, (args, kwds))
+                        if deviation:
+                            record.max_deviation = max(record.max_deviation,
+                                                       deviation)
+                            # the error of the results is estimated on a
+                            # sample of the inexact hits
+                            check = record.inexact_hits % _ERROR_SAMPLING == 0
+                            record.inexact_hits += 1
+                    link_prev[NEXT] = link_next
+                    link_next[PREV] = link_prev
+                    last = root[PREV]
+                    last[NEXT] = root[PREV] = link
+                    link[PREV] = last
+                    link[NEXT] = root
                     stats[HITS] += 1
-                    return result
-                result = user_function(*args, **kwds)
-                cache[key] = result
-                stats[MISSES] += 1
+                    record.hits += 1
+                    if not check:
+                        record.time_saved += elapsed
+                        return result
+            if check:
+                contexts = _get_contexts()
+                contexts.append((record.name, args, kwds, context))
+                try:
+                    exact = user_function(*args, **kwds)
+                finally:
+                    contexts.pop()
+                error = _calc_error(result, exact)
+                if error is not None:
+                    with lock:
+                        record.max_error = max(record.max_error, error)
                 return result
+            start = _timer()
+            disk, disk_key, found = record.disk, None, None
+            if disk is not None and disk_allowed:
+                disk_key = _make_disk_key(record, context, args, kwds, rtol)
+                if disk_key is not None:
+                    found = disk.get(disk_key)
+            if found is not None:
+                result, elapsed = found
+                with lock:
+                    record.disk_hits += 1
+                    record.time_saved += elapsed
+            else:
+                contexts = _get_contexts()
+                contexts.append((record.name, args, kwds, context))
+                try:
+                    result = user_function(*args, **kwds)
+                finally:
+                    contexts.pop()
+                elapsed = _timer() - start
+                if disk_key is not None and not (
+                        disk.temporary and getattr(_local, 'finite_differences', 0)):
+                    disk.set(disk_key, result, elapsed)
+            with lock:
+                if key in cache:
+                    # getting here means that this same key was added to the
+                    # cache while the lock was released.  since the link
+                    # update is already done, we need only return the
+                    # computed result and update the count of misses.
+                    pass
+                else:
+                    add_link(key, result, elapsed,
+                             (args, kwds) if rtol else None, maxsize)
+                stats[MISSES] += 1
+                record.misses += 1
+            return result
 
-        else:
+        def add_link(key, result, elapsed, link_args, maxsize):
+            """Puts a result in a new link at the front of the list (to be
+            called with the lock held)"""
+            root, = nonlocal_root
+            while maxsize is not None and _len(cache) >= maxsize:
+                # empty the oldest link and remove it from the list
+                oldest = root[NEXT]
+                root[NEXT] = oldest[NEXT]
+                oldest[NEXT][PREV] = root
+                del cache[oldest[KEY]]
+                record.evictions += 1
+            last = root[PREV]
+            link = [last, root, key, result, elapsed, link_args]
+            last[NEXT] = root[PREV] = cache[key] = link
 
-            def wrapper(*args, **kwds):
-                # size limited caching that tracks accesses by recency
-                key = make_key(args, kwds, typed) if kwds or typed else args
-                with lock:
-                    link = cache_get(key)
-                    if link is not None:
-                        # record recent use of the key by moving it to the front of the list
-                        root, = nonlocal_root
-                        link_prev, link_next, key, result = link
-                        link_prev[NEXT] = link_next
-                        link_next[PREV] = link_prev
-                        last = root[PREV]
-                        last[NEXT] = root[PREV] = link
-                        link[PREV] = last
-                        link[NEXT] = root
-                        stats[HITS] += 1
-                        return result
-                result = user_function(*args, **kwds)
-                with lock:
-                    root, = nonlocal_root
-                    if key in cache:
-                        # getting here means that this same key was added to the
-                        # cache while the lock was released.  since the link
-                        # update is already done, we need only return the
-                        # computed result and update the count of misses.
-                        pass
-                    elif _len(cache) >= maxsize:
-                        # use the old root to store the new key and result
-                        oldroot = root
-                        oldroot[KEY] = key
-                        oldroot[RESULT] = result
-                        # empty the oldest link and make it the new root
-                        root = nonlocal_root[0] = oldroot[NEXT]
-                        oldkey = root[KEY]
-                        oldvalue = root[RESULT]
-                        root[KEY] = root[RESULT] = None
-                        # now update the cache dictionary for the new links
-                        del cache[oldkey]
-                        cache[key] = oldroot
-                    else:
-                        # put result in a new link at the front of the list
-                        last = root[PREV]
-                        link = [last, root, key, result]
-                        last[NEXT] = root[PREV] = cache[key] = link
-                    stats[MISSES] += 1
-                return result
+        def get_key(args, kwds):
+            """Returns the key of a call (None if caching is off)"""
+            if record.maxsize == 0:
+                return None
+            if record.rtol:
+                return _make_quantized_key(args, kwds, typed, record.rtol)
+            return make_key(args, kwds, typed) if kwds or typed else args
+
+        def cache_contains(args, kwds):
+            """Tells whether the result of a call is cached"""
+            key = get_key(args, kwds)
+            with lock:
+                return key is not None and key in cache
+
+        def cache_insert(args, kwds, result, elapsed=0.0):
+            """Stores the result of a call computed elsewhere (e.g. together
+            with the calls of other caches, see 'fill_caches')"""
+            key = get_key(args, kwds)
+            if key is None:
+                return
+            with lock:
+                if key not in cache:
+                    add_link(key, result, elapsed,
+                             (args, kwds) if record.rtol else None,
+                             record.maxsize)
+                stats[MISSES] += 1
+                record.misses += 1
 
         def cache_info():
             """Report cache statistics"""
             with lock:
-                return _CacheInfo(stats[HITS], stats[MISSES], maxsize,
+                return _CacheInfo(stats[HITS], stats[MISSES], record.maxsize,
                                   len(cache))
 
         def cache_clear():
@@ -160,14 +410,335 @@ def lru_cache(maxsize=100, typed=False):
             with lock:
                 cache.clear()
                 root = nonlocal_root[0]
-                root[:] = [root, root, None, None]
+                root[:] = [root, root, None, None, 0.0, None]
                 stats[:] = [0, 0]
 
         wrapper.__wrapped__ = user_function
         wrapper.cache_info = cache_info
         wrapper.cache_clear = cache_clear
+        wrapper.cache_contains = cache_contains
+        wrapper.cache_insert = cache_insert
         return update_wrapper(wrapper, user_function)
 
     return decorating_function
 
 # # end of http://code.activestate.com/recipes/578078-py26-and-py30-backport-of-python-33s-lru-cache/ }}}
+
+
+def fill_caches(functions, kwargs_list, calc_batch):
+    """Computes at once the results of the calls 'functions[i](**kwargs_list[i])'
+    that are not cached yet with 'calc_batch', which takes the list of their
+    keyword arguments and returns the list of their results, and stores them
+    in the caches of 'functions' (e.g. the back-calculation functions of the
+    residues of an experiment). The calls then just look the results up.
+    Nothing is computed unless at least two results are missing, and the
+    functions whose cache is off are left out."""
+
+    missing = [(function, kwargs)
+               for function, kwargs in zip(functions, kwargs_list)
+               if function.cache_info().maxsize != 0 and
+               not function.cache_contains((), kwargs)]
+
+    if len(missing) < 2:
+        return
+
+    start = time()
+    results = calc_batch([kwargs for _, kwargs in missing])
+    elapsed = (time() - start) / len(missing)
+
+    for (function, kwargs), result in zip(missing, results):
+        function.cache_insert((), kwargs, result, elapsed)
+
+
+# Registry of the caches
+#
+# All the functions decorated with 'lru_cache' join the registry. The
+# statistics are aggregated by function name, e.g. the many '_calc_observables'
+# caches created by the 'make_calc_observables' factory of an experiment
+# module (one per residue and experiment) share a single record.
+
+class _CacheRecord(object):
+    """Statistics and settings shared by the caches of a function"""
+
+    __slots__ = ('name', 'code', 'maxsize', 'rtol', 'disk',
+                 'hits', 'misses', 'evictions', 'disk_hits', 'time_saved',
+                 'max_deviation', 'inexact_hits', 'max_error')
+
+    def __init__(self, name, code, maxsize):
+        self.name = name
+        self.code = code
+        self.maxsize = maxsize
+        self.rtol = self.disk = None
+        self.hits = self.misses = self.evictions = self.disk_hits = 0
+        self.inexact_hits = 0
+        self.time_saved = self.max_deviation = self.max_error = 0.0
+
+
+_registry = OrderedDict()
+_settings = []
+
+
+def _register(user_function, maxsize):
+    """Returns the record of 'user_function', creating it if needed"""
+
+    name = '.'.join([user_function.__module__, user_function.__name__])
+
+    if name not in _registry:
+        code = getattr(user_function, '__code__', None)
+        code = sha1(code.co_code).hexdigest() if code is not None else None
+        record = _registry[name] = _CacheRecord(name, code, maxsize)
+        for pattern, setting, value in _settings:
+            if fnmatch(name, pattern):
+                setattr(record, setting, value)
+
+    return _registry[name]
+
+
+def _set(pattern, setting, value):
+    """Changes a setting of the caches whose name matches 'pattern', including
+    the caches created afterwards"""
+
+    _settings.append((pattern, setting, value))
+
+    for name, record in _registry.items():
+        if fnmatch(name, pattern):
+            setattr(record, setting, value)
+
+
+def set_maxsize(pattern, maxsize):
+    """Sets the maximum size of the caches whose name (module and function
+    name, e.g. 'chemex.experiments.cpmg.n_cw.back_calculation.make_propagators')
+    matches the shell-style 'pattern'. This also applies to the caches
+    created afterwards. A size of None makes the caches unbounded, 0 disables
+    them."""
+
+    _set(pattern, 'maxsize', maxsize)
+
+
+def set_rtol(pattern, rtol):
+    """Makes the caches whose name matches the shell-style 'pattern' compare
+    their float arguments within the relative tolerance 'rtol' (None to
+    compare them exactly, the default). Calls whose arguments only differ by
+    less than 'rtol' then share the same result. The largest relative
+    difference between the requested and the cached arguments, and the largest
+    error of the returned results (estimated by evaluating a sample of these
+    calls again), are reported by 'format_cache_stats'.
+
+    Raises ValueError if 'rtol' is not below the relative step of the finite
+    differences ('FINITE_DIFFERENCE_STEP'), as the numerical derivatives
+    would then be wrong or zero. Even below it, they are off by up to about
+    rtol / FINITE_DIFFERENCE_STEP (relative error)."""
+
+    if rtol is not None and not 0.0 <= rtol < FINITE_DIFFERENCE_STEP:
+        raise ValueError(
+            "The relative tolerance must be below the relative step of the "
+            "finite differences ({:.0e}): {!r}".format(
+                FINITE_DIFFERENCE_STEP, rtol))
+
+    _set(pattern, 'rtol', rtol)
+
+
+def set_disk_cache(pattern, filename, max_size=512 * 2 ** 20):
+    """Stores the results of the caches whose name matches the shell-style
+    'pattern' in the file 'filename' as well, so that they can be reused by
+    later runs. The file is limited to about 'max_size' bytes, the least
+    recently used results being removed first. The closures made outside of
+    a call of a cached factory are never stored, as the setup they capture
+    is not part of their key."""
+
+    _set(pattern, 'disk', _DiskCache(filename, max_size))
+
+
+def set_shared_cache(pattern, max_size=512 * 2 ** 20):
+    """Stores the results of the caches whose name matches the shell-style
+    'pattern' in a temporary file in shared memory (/dev/shm when available),
+    so that the worker processes forked afterwards reuse the results computed
+    by each other. The file is removed when the process that created it
+    exits."""
+
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else None
+    handle, filename = tempfile.mkstemp(prefix='chemex-', suffix='.db',
+                                        dir=directory)
+    os.close(handle)
+
+    _set(pattern, 'disk', _DiskCache(filename, max_size, temporary=True))
+
+
+def get_cache_stats():
+    """Returns the statistics of the caches (hits, misses, evictions, disk
+    hits, time saved, largest argument deviation, inexact hits and largest
+    result error), by name"""
+
+    return dict(
+        (name, (record.hits, record.misses, record.evictions,
+                record.disk_hits, record.time_saved, record.max_deviation,
+                record.inexact_hits, record.max_error))
+        for name, record in _registry.items()
+    )
+
+
+def reset_cache_stats():
+    """Resets the statistics of all the caches"""
+
+    for record in _registry.values():
+        record.hits = record.misses = record.evictions = record.disk_hits = 0
+        record.inexact_hits = 0
+        record.time_saved = record.max_deviation = record.max_error = 0.0
+
+
+def merge_cache_stats(cache_stats):
+    """Adds statistics returned by 'get_cache_stats' (e.g. in a worker process)
+    to the statistics of the caches"""
+
+    for name, (hits, misses, evictions, disk_hits, time_saved, max_deviation,
+               inexact_hits, max_error) in cache_stats.items():
+        if name not in _registry:
+            _registry[name] = _CacheRecord(name, None, None)
+        record = _registry[name]
+        record.hits += hits
+        record.misses += misses
+        record.evictions += evictions
+        record.disk_hits += disk_hits
+        record.time_saved += time_saved
+        record.max_deviation = max(record.max_deviation, max_deviation)
+        record.inexact_hits += inexact_hits
+        record.max_error = max(record.max_error, max_error)
+
+
+def format_cache_stats():
+    """Formats the statistics of the caches that have been used"""
+
+    lines = ['{:<60s} {:>7s} {:>10s} {:>10s} {:>10s} {:>10s} {:>14s} {:>9s} {:>13s} {:>9s}'.format(
+        'Cache', 'Size', 'Hits', 'Misses', 'Evictions', 'Disk hits',
+        'Time saved (s)', 'Tolerance', 'Max deviation', 'Max error')]
+
+    for name in sorted(_registry):
+        record = _registry[name]
+        if not record.hits and not record.misses:
+            continue
+        if name.startswith('chemex.experiments.'):
+            name = name[len('chemex.experiments.'):]
+        lines.append(
+            '{:<60s} {:>7s} {:>10d} {:>10d} {:>10d} {:>10d} {:>14.2f} {:>9s} {:>13.3e} {:>9s}'
+            .format(name, str(record.maxsize), record.hits, record.misses,
+                    record.evictions, record.disk_hits, record.time_saved,
+                    '{:.0e}'.format(record.rtol) if record.rtol else '-',
+                    record.max_deviation,
+                    '{:.3e}'.format(record.max_error) if record.inexact_hits else '-'))
+
+    return '\n'.join(lines)
+
+
+class _DiskCache(object):
+    """Results of cached functions stored in a (memory-mapped) SQLite database,
+    shared by successive runs and by the worker processes, with a size cap and
+    LRU eviction. A temporary database is removed when the process that
+    created it exits."""
+
+    def __init__(self, filename, max_size, temporary=False):
+        self.filename = filename
+        self.max_size = max_size
+        self.temporary = temporary
+        self.local = local()
+        self.inserts = 0
+
+        if temporary:
+            atexit.register(self.remove, os.getpid())
+
+    def __getstate__(self):
+        return self.filename, self.max_size, self.temporary
+
+    def __setstate__(self, state):
+        # the copy does not remove the database
+        filename, max_size, temporary = state
+        self.__init__(filename, max_size)
+        self.temporary = temporary
+
+    def remove(self, pid):
+        """Removes the database if called from the process 'pid'"""
+
+        if os.getpid() != pid:
+            return
+
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.remove(self.filename + suffix)
+            except OSError:
+                pass
+
+    def connect(self):
+        """Returns the connection to the database of the current thread (a
+        connection must not be shared by threads or forked processes)"""
+
+        if getattr(self.local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.filename, timeout=60.0,
+                                         isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute('PRAGMA mmap_size={:d}'.format(int(self.max_size)))
+            connection.execute('CREATE TABLE IF NOT EXISTS cache ('
+                               'key TEXT PRIMARY KEY, value BLOB, '
+                               'size INTEGER, elapsed REAL, atime REAL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS cache_atime '
+                               'ON cache (atime)')
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+
+        return self.local.connection
+
+    def get(self, key):
+        """Returns the (result, elapsed time) stored for 'key' or None"""
+
+        try:
+            connection = self.connect()
+            row = connection.execute('SELECT value, elapsed FROM cache '
+                                     'WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            connection.execute('UPDATE cache SET atime = ? WHERE key = ?',
+                               (time(), key))
+        except sqlite3.Error:
+            return None
+
+        return pickle.loads(str(row[0])), row[1]
+
+    def set(self, key, result, elapsed):
+        """Stores 'result' for 'key'"""
+
+        value = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+
+        try:
+            connection = self.connect()
+            connection.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)',
+                               (key, sqlite3.Binary(value), len(value), elapsed,
+                                time()))
+            self.inserts += 1
+            if self.inserts % 100 == 1:
+                self.evict()
+        except sqlite3.Error:
+            pass
+
+    def evict(self):
+        """Removes the least recently used results down to 90% of the maximum
+        size, if the maximum size is exceeded"""
+
+        connection = self.connect()
+        size = connection.execute('SELECT TOTAL(size) FROM cache').fetchone()[0]
+
+        if size <= self.max_size:
+            return
+
+        excess = size - 0.9 * self.max_size
+        keys = []
+
+        cursor = connection.execute('SELECT key, size FROM cache ORDER BY atime')
+
+        for key, a_size in cursor:
+            keys.append((key,))
+            excess -= a_size
+            if excess <= 0:
+                break
+
+        cursor.close()
+
+        connection.executemany('DELETE FROM cache WHERE key = ?', keys)
@@ -6,40 +6,44 @@ Created on Mar 30, 2011
 
 import sys
 import scipy as sc
+import scipy.sparse
 
 # ChemEx Libraries
+from chemex import caching
 from chemex.writing import dump_parameters
+from chemex.experiments.base_profile import fill_profile_caches
+from chemex.experiments.dataset import Dataset
 
 
 def make_calc_residuals(verbose=True, threshold=1e-3):
-    def calc_residuals(par, par_indexes, par_fixed, data):
+    def calc_residuals(par, par_indexes, par_fixed, profiles):
         """
         Calculate the residuals for all values knowing the parameters par
         """
 
         try:
-            residuals = [
-                a_data_point.calc_residual(par, par_indexes, par_fixed)
-                for a_data_point in data]
+            fill_profile_caches(profiles, par, par_indexes, par_fixed)
+
+            residuals = sc.concatenate([
+                profile.calc_residuals(par, par_indexes, par_fixed)
+                for profile in profiles])
 
         except KeyboardInterrupt:
             sys.stderr.write("\n -- Keyboard Interrupt: calculation stopped")
-            dump_parameters(par, par_indexes, par_fixed, data)
+            dump_parameters(par, par_indexes, par_fixed, Dataset(profiles))
             sys.exit()
 
         if verbose:
 
-            chi2 = sum(sc.asarray(residuals) ** 2)
+            chi2 = sum(residuals ** 2)
 
             if (
                 calc_residuals.old_chi2 - chi2) / calc_residuals.old_chi2 > \
                     threshold:
+                data_nb = len(residuals)
+                par_nb = len(par)
                 sys.stdout.write('  * {:.3e} / {:.3e}\n'.format(chi2,
-                                                                calc_reduced_chi2(
-                                                                    par,
-                                                                    par_indexes,
-                                                                    par_fixed,
-                                                                    data)))
+                                                                chi2 / (data_nb - par_nb)))
                 sys.stdout.flush()
                 calc_residuals.old_chi2 = chi2
 
@@ -50,13 +54,145 @@ def make_calc_residuals(verbose=True, threshold=1e-3):
     return calc_residuals
 
 
+def calc_jacobian(par, par_indexes, par_fixed, profiles):
+    """
+    Calculate the derivatives of the residuals with respect to the fitted
+    parameters, profile by profile (to be used as 'Dfun' by 'leastsq')
+    """
+
+    jacobian = sc.zeros((sum(len(profile) for profile in profiles), len(par)))
+
+    start = 0
+
+    for profile in profiles:
+        stop = start + len(profile)
+
+        for index, derivatives in profile.calc_jacobian(par, par_indexes, par_fixed):
+            jacobian[start:stop, index] += derivatives
+
+        start = stop
+
+    return jacobian
+
+
+def calc_sparse_jacobian(par, par_indexes, par_fixed, profiles, epsfcn=1e-10):
+    """
+    Calculate the derivatives of the residuals with respect to the fitted
+    parameters as a sparse matrix. Only the blocks of the parameters each
+    profile depends on are computed and stored, which keeps the cost linear
+    in the number of residues for global fits.
+
+    The derivatives that are not known in closed form are obtained by forward
+    differences, the parameters that no profile has in common (see
+    'group_columns') being stepped together in a single evaluation
+    """
+
+    par = sc.asarray(par, dtype=float)
+
+    step_factor = sc.sqrt(epsfcn)
+    steps = step_factor * abs(par)
+    steps[steps == 0.0] = step_factor
+
+    rows, cols, values = [], [], []
+    numerical = []
+
+    start = 0
+
+    for profile in profiles:
+        profile_rows = sc.arange(start, start + len(profile))
+
+        jacobian, indexes = profile.calc_closed_form_jacobian(par, par_indexes, par_fixed)
+
+        for index, derivatives in jacobian:
+            rows.append(profile_rows)
+            cols.append(sc.repeat(index, len(profile)))
+            values.append(derivatives)
+
+        if indexes:
+            numerical.append((profile, profile_rows, list(indexes)))
+
+        start += len(profile)
+
+    fill_profile_caches([profile for profile, _, _ in numerical],
+                        par, par_indexes, par_fixed)
+
+    cals = [profile.back_calculate(par, par_indexes, par_fixed)
+            for profile, _, _ in numerical]
+
+    with caching.finite_differences():
+        for group in group_columns([indexes for _, _, indexes in numerical]):
+            indexes = list(set(index for _, index in group))
+            par_step = par.copy()
+            par_step[indexes] += steps[indexes]
+
+            fill_profile_caches([numerical[position][0] for position, _ in group],
+                                par_step, par_indexes, par_fixed)
+
+            for position, index in group:
+                profile, profile_rows, _ = numerical[position]
+                cal_step = profile.back_calculate(par_step, par_indexes, par_fixed)
+                derivatives = (cal_step - cals[position]) / steps[index]
+
+                rows.append(profile_rows)
+                cols.append(sc.repeat(index, len(profile)))
+                values.append(-derivatives / profile.err)
+
+    if values:
+        rows, cols, values = (sc.concatenate(_) for _ in (rows, cols, values))
+
+    jacobian = scipy.sparse.coo_matrix((values, (rows, cols)), shape=(start, len(par)))
+
+    return jacobian.tocsr()
+
+
+def group_columns(indexes):
+    """
+    Groups the columns of the Jacobian that can be obtained from the same
+    evaluation of the residuals, i.e. the parameters that no profile depends
+    on together (greedy coloring of the column intersection graph, as in
+    Curtis, Powell and Reid).
+
+    'indexes' holds, for each profile, the indexes of the parameters to
+    differentiate. Returns the groups as lists of (position of the profile in
+    'indexes', index of the parameter), each profile appearing at most once
+    per group.
+    """
+
+    profiles = {}
+
+    for position, profile_indexes in enumerate(indexes):
+        for index in profile_indexes:
+            profiles.setdefault(index, []).append(position)
+
+    groups = []
+    group_profiles = []
+
+    # The parameters shared by the most profiles (e.g. 'pb' or 'kex') are
+    # placed first
+    for index in sorted(profiles, key=lambda index: (-len(profiles[index]), index)):
+        positions = profiles[index]
+
+        for group, used in zip(groups, group_profiles):
+            if used.isdisjoint(positions):
+                break
+        else:
+            group, used = [], set()
+            groups.append(group)
+            group_profiles.append(used)
+
+        group.extend((position, index) for position in positions)
+        used.update(positions)
+
+    return groups
+
+
 def calc_chi2(par, par_indexes, par_fixed, data):
     """
     Calculate the residuals for all values knowing the parameters par
     """
 
-    chi2 = sum(data_point.calc_residual(par, par_indexes, par_fixed) ** 2
-               for data_point in data)
+    chi2 = sum(sum(profile.calc_residuals(par, par_indexes, par_fixed) ** 2)
+               for profile in data.profiles)
 
     return chi2
 
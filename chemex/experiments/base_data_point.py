@@ -19,7 +19,10 @@ class BaseDataPoint(object):
         self.fitting_parameter_names = set()
         self.fixed_parameter_names = set()
         self.kwargs_default = dict()
+        self.kwargs_profile = dict()
         self.calc_observable = calc_observable
+        self.calc_observables = None
+        self.calc_derivatives = None
         self.plot_data = plot_data
 
         self.check_parameters(par_conv)
@@ -59,9 +62,13 @@ class BaseDataPoint(object):
         kwargs = dict((short_name, get_par(long_name, par, par_indexes, par_fixed))
                       for short_name, long_name in self.short_long_par_names)
 
-        kwargs.update(self.kwargs_default)
+        if self.calc_observables is not None:
+            kwargs.update((name, (value,)) for name, value in self.kwargs_profile.items())
+            self.cal = self.calc_observables(**kwargs)[0]
 
-        self.cal = self.calc_observable(**kwargs)
+        else:
+            kwargs.update(self.kwargs_default)
+            self.cal = self.calc_observable(**kwargs)
 
     def calc_residual(self, par, par_indexes, par_fixed=None):
         """Calculates the residual between the experimental and back-calculated values."""
@@ -0,0 +1,413 @@
+"""Groups data points into profiles that are back-calculated in one call."""
+
+import copy
+from collections import OrderedDict
+
+from scipy import asarray, sqrt, zeros, arange, empty
+
+from chemex import caching
+
+
+class Profile(object):
+    """Group of data points back-calculated together in a single call.
+
+    All the data points of a profile share the same back-calculation function
+    and depend on the same parameters. Only the experimental variables listed
+    in 'kwargs_profile' (e.g. 'ncyc' or 'b1_offset') change from one point to
+    the other.
+
+    The profile stores the points by column: the values, uncertainties and
+    back-calculated values are arrays, the parameters shared by all the points
+    are kept once in 'par' and the others in the arrays of 'columns'. The
+    data points themselves are only kept as light views (see
+    'DataPointView'), built on demand for writing and plotting.
+    """
+
+    def __init__(self, data_points):
+        """Constructor"""
+
+        data_points = list(data_points)
+
+        # The first data point holds everything the points have in common
+        # (class, back-calculation functions, parameter names, ...)
+        self.template = data_point = data_points[0]
+
+        self.short_long_par_names = data_point.short_long_par_names
+        self.calc_observables = data_point.calc_observables
+        self.calc_derivatives = data_point.calc_derivatives
+        self.calc_observable = data_point.calc_observable
+
+        self.val = asarray([a_data_point.val for a_data_point in data_points])
+        self.err = asarray([a_data_point.err for a_data_point in data_points])
+        self.cal = None
+        self.compiled = None
+        self.compiled_pars = None
+
+        self.par = {}
+        self.columns = {}
+
+        names = set()
+        for a_data_point in data_points:
+            names.update(a_data_point.par)
+
+        for name in names:
+            values = [a_data_point.par.get(name) for a_data_point in data_points]
+
+            if all(value == values[0] for value in values):
+                self.par[name] = values[0]
+            else:
+                self.columns[name] = make_column(values)
+
+        self.kwargs_profile = dict(
+            (name, tuple(a_data_point.kwargs_profile[name] for a_data_point in data_points))
+            for name in data_point.kwargs_profile
+        )
+
+        self.kwargs_defaults = [a_data_point.kwargs_default for a_data_point in data_points]
+
+    def __len__(self):
+        """Number of data points in the profile"""
+
+        return len(self.val)
+
+    def calc_val(self, par, par_indexes, par_fixed=None):
+        """Back-calculates the values of all the data points of the profile."""
+
+        self.cal = self.back_calculate(par, par_indexes, par_fixed)
+
+        return self.cal
+
+    def back_calculate(self, par, par_indexes, par_fixed=None):
+        """Back-calculates the values of the profile without storing them
+        in 'cal'."""
+
+        return self._calc_val(self.get_kwargs(par, par_indexes, par_fixed))
+
+    def get_kwargs(self, par, par_indexes, par_fixed=None):
+        """Returns the parameters of the back-calculation function."""
+
+        if self.compiled_pars is None or \
+                self.compiled_pars[0] is not par_indexes or \
+                self.compiled_pars[1] is not par_fixed:
+            self.compile_parameters(par_indexes, par_fixed)
+
+        short_names, values, positions, indexes = self.compiled
+
+        values = values.copy()
+        values[positions] = asarray(par)[indexes]
+
+        return dict(zip(short_names, values))
+
+    def compile_parameters(self, par_indexes, par_fixed=None):
+        """
+        Resolves the parameters of the profile once for a given set of fitted
+        and fixed parameters, so that the values can then be gathered from
+        'par' with an index array instead of looking up each (tuple) name in
+        'par_indexes' and 'par_fixed' at every evaluation.
+        """
+
+        short_names = [short_name for short_name, _ in self.short_long_par_names]
+        values = zeros(len(short_names))
+        positions, indexes = [], []
+
+        for position, (_, long_name) in enumerate(self.short_long_par_names):
+            if long_name in par_indexes:
+                positions.append(position)
+                indexes.append(par_indexes[long_name])
+            else:
+                values[position] = par_fixed[long_name]
+
+        self.compiled = (short_names, values,
+                         asarray(positions, dtype=int), asarray(indexes, dtype=int))
+        self.compiled_pars = (par_indexes, par_fixed)
+
+    def _calc_val(self, kwargs):
+        """Back-calculates the values of the profile from the parameters in 'kwargs'."""
+
+        if self.calc_observables is not None:
+            return self.calc_observables(**dict(kwargs, **self.kwargs_profile))
+
+        else:
+            # Experiments without a profile-wide back-calculation are still
+            # evaluated point by point, but the parameters are only looked up
+            # once
+            return asarray([
+                self.calc_observable(**dict(kwargs, **kwargs_default))
+                for kwargs_default in self.kwargs_defaults
+            ])
+
+    def calc_residuals(self, par, par_indexes, par_fixed=None):
+        """Calculates the residuals between the experimental and back-calculated values."""
+
+        return (self.val - self.calc_val(par, par_indexes, par_fixed)) / self.err
+
+    def calc_jacobian(self, par, par_indexes, par_fixed=None, epsfcn=1e-10):
+        """
+        Calculates the derivatives of the residuals with respect to the fitted
+        parameters the profile depends on.
+
+        The derivatives provided by the experiment through 'calc_derivatives'
+        are used when available. The others are obtained by forward
+        differences, as 'leastsq' would do, but only the profile is
+        back-calculated again.
+
+        Returns a list of (index of the parameter in 'par', derivatives)
+        """
+
+        jacobian, numerical = self.calc_closed_form_jacobian(par, par_indexes,
+                                                             par_fixed)
+
+        if not numerical:
+            return jacobian
+
+        kwargs = self.get_kwargs(par, par_indexes, par_fixed)
+        cal = self._calc_val(kwargs)
+        step_factor = sqrt(epsfcn)
+
+        with caching.finite_differences():
+            for index, names in numerical.items():
+                step = step_factor * abs(par[index]) or step_factor
+                kwargs_step = dict(kwargs)
+
+                for name in names:
+                    kwargs_step[name] += step
+
+                derivative = (self._calc_val(kwargs_step) - cal) / step
+
+                jacobian.append((index, -derivative / self.err))
+
+        return jacobian
+
+    def calc_closed_form_jacobian(self, par, par_indexes, par_fixed=None):
+        """
+        Calculates the derivatives of the residuals known in closed form (see
+        'calc_derivatives').
+
+        Returns a list of (index of the parameter in 'par', derivatives) and
+        the short names of the other fitted parameters the profile depends on,
+        whose derivatives have to be obtained numerically, keyed by their index
+        in 'par'
+        """
+
+        kwargs = self.get_kwargs(par, par_indexes, par_fixed)
+
+        if self.calc_derivatives is not None:
+            derivatives = self.calc_derivatives(**dict(kwargs, **self.kwargs_profile))
+        else:
+            derivatives = dict()
+
+        short_names = OrderedDict()
+
+        for short_name, long_name in self.short_long_par_names:
+            if long_name in par_indexes:
+                short_names.setdefault(par_indexes[long_name], []).append(short_name)
+
+        jacobian = []
+        numerical = OrderedDict()
+
+        for index, names in short_names.items():
+
+            if all(name in derivatives for name in names):
+                derivative = sum(derivatives[name] for name in names)
+                jacobian.append((index, -derivative / self.err))
+
+            else:
+                numerical[index] = names
+
+        return jacobian, numerical
+
+    def get_par(self, name, default=None):
+        """Returns the values of the parameter 'name' of all the points."""
+
+        if name in self.columns:
+            return self.columns[name]
+
+        return make_column([self.par.get(name, default)] * len(self))
+
+    def get_fitting_parameter_names(self):
+        """Provide the parameters that are needed to back-calculate the profile."""
+
+        return self.template.get_fitting_parameter_names()
+
+    def get_fixed_parameter_names(self):
+        """Provide the parameters that are needed to back-calculate the profile."""
+
+        return self.template.get_fixed_parameter_names()
+
+    @property
+    def data_points(self):
+        """Views of the data points of the profile."""
+
+        return [DataPointView(self, index) for index in range(len(self))]
+
+    def take(self, indexes):
+        """
+        Makes a new profile out of the points at 'indexes' (e.g. to filter
+        or resample the profile). The arrays are copied, everything else is
+        shared with the original profile.
+        """
+
+        indexes = asarray(indexes, dtype=int)
+
+        profile = copy.copy(self)
+
+        profile.val = self.val[indexes]
+        profile.err = self.err[indexes]
+        profile.cal = None if self.cal is None else self.cal[indexes]
+
+        profile.columns = dict(
+            (name, column[indexes]) for name, column in self.columns.items()
+        )
+        profile.kwargs_profile = dict(
+            (name, tuple(values[index] for index in indexes))
+            for name, values in self.kwargs_profile.items()
+        )
+        profile.kwargs_defaults = [self.kwargs_defaults[index] for index in indexes]
+
+        return profile
+
+    def copy(self):
+        """Makes a copy of the profile (only the arrays are copied)."""
+
+        return self.take(arange(len(self)))
+
+
+class DataPointView(object):
+    """
+    View of a data point stored in a profile.
+
+    It has the attributes of the data points used by the rest of the program
+    ('val', 'err', 'cal', 'par', ...): the values are read from (and written
+    to) the arrays of the profile, the rest comes from the first data point
+    of the profile.
+    """
+
+    __slots__ = ('profile', 'index')
+
+    def __init__(self, profile, index):
+        """Constructor"""
+
+        self.profile = profile
+        self.index = index
+
+    def __getattr__(self, name):
+        return getattr(self.profile.template, name)
+
+    def __repr__(self):
+        return type(self.profile.template).__repr__.__func__(self)
+
+    def filter(self, par, par_indexes, par_fixed=None):
+        return type(self.profile.template).filter.__func__(self, par, par_indexes, par_fixed)
+
+    @property
+    def par(self):
+        par = dict(self.profile.par)
+        par.update(
+            (name, column.item(self.index))
+            for name, column in self.profile.columns.items()
+        )
+        return par
+
+    @property
+    def kwargs_profile(self):
+        return dict(
+            (name, values[self.index])
+            for name, values in self.profile.kwargs_profile.items()
+        )
+
+    @property
+    def kwargs_default(self):
+        return self.profile.kwargs_defaults[self.index]
+
+    def _get_val(self):
+        return self.profile.val[self.index]
+
+    def _set_val(self, val):
+        self.profile.val[self.index] = val
+
+    def _get_err(self):
+        return self.profile.err[self.index]
+
+    def _set_err(self, err):
+        self.profile.err[self.index] = err
+
+    def _get_cal(self):
+        if self.profile.cal is None:
+            return None
+        return self.profile.cal[self.index]
+
+    val = property(_get_val, _set_val)
+    err = property(_get_err, _set_err)
+    cal = property(_get_cal)
+
+
+# Functions
+
+def make_column(values):
+    """Makes the array of a column of a profile, an array of objects if the
+    values are not numbers (e.g. tuples or strings)."""
+
+    column = asarray(values)
+
+    if column.ndim != 1 or column.dtype.kind not in 'biuf':
+        column = empty(len(values), dtype=object)
+
+        for index, value in enumerate(values):
+            column[index] = value
+
+    return column
+
+
+def fill_profile_caches(profiles, par, par_indexes, par_fixed=None):
+    """
+    Back-calculates together the profiles whose back-calculation functions
+    have a batched version, e.g. the residues of an experiment, whose
+    Liouvillians are then stacked and exponentiated in a single call.
+
+    The experiments opt in by giving their 'calc_observables' functions two
+    attributes: 'unscaled', the cached function of the intensities for an
+    initial intensity of 1.0, and 'calc_batch', the function computing them
+    for a list of profiles (shared by the profiles that can be computed
+    together). The values are stored in the caches of the 'unscaled'
+    functions, where 'calc_val' then finds them (see 'caching.fill_caches').
+    """
+
+    groups = OrderedDict()
+
+    for profile in profiles:
+        calc_batch = getattr(profile.calc_observables, 'calc_batch', None)
+
+        if calc_batch is None:
+            continue
+
+        kwargs = profile.get_kwargs(par, par_indexes, par_fixed)
+        kwargs.update(profile.kwargs_profile)
+        del kwargs['i0']
+
+        functions, kwargs_list = groups.setdefault(calc_batch, ([], []))
+        functions.append(profile.calc_observables.unscaled)
+        kwargs_list.append(kwargs)
+
+    for calc_batch, (functions, kwargs_list) in groups.items():
+        caching.fill_caches(functions, kwargs_list, calc_batch)
+
+
+def make_profiles(data):
+    """Groups the data points that can be back-calculated in a single call.
+
+    The points are grouped by experiment, profile (i.e. data file) and
+    resonance rather than by back-calculation function: the functions made by
+    the cached factories are only shared between the points while the cache
+    is on (see '--cache-size').
+    """
+
+    profiles = OrderedDict()
+
+    for data_point in data:
+        par = data_point.par
+        key = (type(data_point), par.get('experiment_name'),
+               par.get('profile_id'), par.get('resonance_id'),
+               data_point.short_long_par_names)
+        profiles.setdefault(key, []).append(data_point)
+
+    return [Profile(data_points) for data_points in profiles.values()]
@@ -12,8 +12,7 @@ from math import pi
 from chemex.parsing import parse_assignment
 from chemex.experiments.base_data_point import BaseDataPoint
 from chemex.constants import xi_ratio
-from .back_calculation import make_calc_observable
-from ..plotting import plot_data
+from .back_calculation import make_calc_observables
 
 # Constants
 RATIO_C = xi_ratio['C']
@@ -71,7 +70,7 @@ class DataPoint(BaseDataPoint):
     """Intensity measured during a cpmg pulse train of frequency frq"""
 
     def __init__(self, val, err, par):
-        BaseDataPoint.__init__(self, val, err, par, PAR_DICT['par_conv'], plot_data)
+        BaseDataPoint.__init__(self, val, err, par, PAR_DICT['par_conv'], 'cest')
 
         self.par['ppm_to_rads'] = TWO_PI * self.par['h_larmor_frq'] * RATIO_C
 
@@ -86,8 +85,10 @@ class DataPoint(BaseDataPoint):
 
         self.par['_id'] = tuple((temperature, nucleus_name, h_larmor_frq))
 
-        args = (self.par[arg] for arg in getargspec(make_calc_observable.__wrapped__).args)
-        self.calc_observable = make_calc_observable(*args)
+        args = (self.par[arg] for arg in getargspec(make_calc_observables.__wrapped__).args)
+        self.calc_observables, self.calc_derivatives = make_calc_observables(*args)
+
+        self.kwargs_profile = {'b1_offset': self.par['b1_offset']}
 
         self.short_long_par_names = (
             ('pb', ('pb', temperature)),
@@ -129,11 +130,3 @@ class DataPoint(BaseDataPoint):
             output.append('{:8.5f}'.format(self.cal))
 
         return ' '.join(output)
-
-    def update_b1_offset(self, b1_offset):
-        """Update b1_offset value"""
-
-        self.par['b1_offset'] = b1_offset
-        args = (self.par[arg] for arg in getargspec(make_calc_observable.__wrapped__).args)
-        self.calc_observable = make_calc_observable(*args)
-
@@ -5,8 +5,7 @@ from chemex.parsing import parse_assignment
 from chemex.experiments.base_data_point import BaseDataPoint
 from chemex.constants import xi_ratio
 from chemex.experiments.misc import calc_multiplet
-from .back_calculation import make_calc_observable
-from ..plotting import plot_data
+from .back_calculation import make_calc_observables
 
 
 
@@ -37,7 +36,7 @@ class DataPoint(BaseDataPoint):
 
     def __init__(self, val, err, par):
         BaseDataPoint.__init__(self, val, err, par, PAR_DICT['par_conv'],
-                               plot_data)
+                               'cest')
 
         self.par['ppm_to_rads'] = TWO_PI * self.par['h_larmor_frq'] * RATIO_N
         self.par['multiplet'] = calc_multiplet(J_COUPLINGS)
@@ -56,9 +55,11 @@ class DataPoint(BaseDataPoint):
         self.par['_id'] = tuple((temperature, nucleus_name, h_larmor_frq))
 
         args = (self.par[arg] for arg in
-                getargspec(make_calc_observable.__wrapped__).args)
+                getargspec(make_calc_observables.__wrapped__).args)
 
-        self.calc_observable = make_calc_observable(*args)
+        self.calc_observables, self.calc_derivatives = make_calc_observables(*args)
+
+        self.kwargs_profile = {'b1_offset': self.par['b1_offset']}
 
         self.short_long_par_names = (
             ('pb', ('pb', temperature)),
@@ -100,12 +101,3 @@ class DataPoint(BaseDataPoint):
             output.append('{:8.5f}'.format(self.cal))
 
         return ' '.join(output)
-
-    def update_b1_offset(self, b1_offset):
-        """Update b1_offset value"""
-
-        self.par['b1_offset'] = b1_offset
-        args = (self.par[arg] for arg in
-                getargspec(make_calc_observable.__wrapped__).args)
-        self.calc_observable = make_calc_observable(*args)
-
@@ -4,9 +4,8 @@ from math import pi
 from chemex.parsing import parse_assignment
 from chemex.experiments.base_data_point import BaseDataPoint, get_par
 from chemex.constants import xi_ratio
-from .back_calculation import make_calc_observable
+from .back_calculation import make_calc_observables
 from chemex.experiments.misc import calc_multiplet
-from ..plotting import plot_data
 
 
 
@@ -36,7 +35,7 @@ class DataPoint(BaseDataPoint):
 
     def __init__(self, val, err, par):
         BaseDataPoint.__init__(self, val, err, par, PAR_DICT['par_conv'],
-                               plot_data)
+                               'cest')
 
         self.par['ppm_to_rads'] = TWO_PI * self.par['h_larmor_frq'] * RATIO_N
         self.par['multiplet'] = calc_multiplet(J_COUPLINGS)
@@ -53,8 +52,10 @@ class DataPoint(BaseDataPoint):
         self.par['_id'] = tuple((temperature, nucleus_name, h_larmor_frq))
 
         args = (self.par[arg] for arg in
-                getargspec(make_calc_observable.__wrapped__).args)
-        self.calc_observable = make_calc_observable(*args)
+                getargspec(make_calc_observables.__wrapped__).args)
+        self.calc_observables, self.calc_derivatives = make_calc_observables(*args)
+
+        self.kwargs_profile = {'b1_offset': self.par['b1_offset']}
 
         self.short_long_par_names = (
             ('pb', ('pb', temperature)),
@@ -97,14 +98,6 @@ class DataPoint(BaseDataPoint):
 
         return ' '.join(output)
 
-    def update_b1_offset(self, b1_offset):
-        """Update b1_offset value"""
-
-        self.par['b1_offset'] = b1_offset
-        args = (self.par[arg] for arg in
-                getargspec(make_calc_observable.__wrapped__).args)
-        self.calc_observable = make_calc_observable(*args)
-
     def filter(self, par, par_indexes, par_fixed=None):
         filter_range = float(self.par.get('on_resonance_filter', 0.0))
 
@@ -117,4 +110,3 @@ class DataPoint(BaseDataPoint):
         2.0 * pi) - self.par['b1_offset']
 
         return abs(cs_offset_hz) < filter_range * 0.5
-
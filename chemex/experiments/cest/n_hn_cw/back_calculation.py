@@ -1,12 +1,14 @@
-from scipy import linspace, pi
+from scipy import asarray, linspace, pi, repeat, tile, zeros_like
 from scipy.stats import norm
 
 import chemex.caching as caching
+from chemex.experiments.propagators import compute_averaged_propagators
 from chemex.experiments.misc import correct_chemical_shift
 from chemex.constants import scalar_couplings
 from liouvillian import set_nz, \
     compute_liouvillian_free_precession, \
-    make_pulse_nh, \
+    compute_liouvillian_pulse_nh, \
+    compute_nz_subspace, \
     get_nz
 
 
@@ -16,16 +18,30 @@ JHN = scalar_couplings['amide_HN']
 
 
 @caching.lru_cache()
-def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, b1_frq_h=0.0,
-                         b1_inh=0.0, b1_inh_res=5, carrier=0.0, carrier_h=0.0,
-                         ppm_to_rads=0.0, ppm_to_rads_h=0.0, _id=None):
+def make_calc_observables(time_t1=0.0, b1_frq=0.0, b1_frq_h=0.0, b1_inh=0.0,
+                          b1_inh_res=5, carrier=0.0, carrier_h=0.0,
+                          ppm_to_rads=0.0, ppm_to_rads_h=0.0, _id=None):
+
+    # Only the part of the basis coupled to Nz by the Liouvillian is
+    # propagated (e.g. 12 out of the 30 elements without 1H field)
+    subspace = compute_nz_subspace(w1_h=b1_frq_h, w1_n=b1_frq)
+    subspace_2d = subspace[:, None], subspace
+
     @caching.lru_cache(5)
-    def _calc_observable(pb=0.0, kex=0.0, dw_h=0.0, dw_n=0.0, r_nxy=5.0,
-                         dr_nxy=None, r_nz=1.5, r_2hznz=None, r_2hxynxy=0.0,
-                         r_hxy=10.0, r_hz=1.0, etaxy=0.0, etaz=0.0, j_hn=JHN,
-                         cs_n=0.0, cs_h=0.0):
+    def _get_saturated_offsets(b1_offset=()):
+        # The reference points (far off-resonance) are not affected by the B1
+        # field: the mask and the offsets of the others are computed once
+        # per profile
+        saturated = abs(asarray(b1_offset)) <= 9999.0
+        return saturated, asarray(b1_offset)[saturated]
+
+    @caching.lru_cache(5)
+    def _calc_observables(pb=0.0, kex=0.0, dw_h=0.0, dw_n=0.0, r_nxy=5.0,
+                          dr_nxy=None, r_nz=1.5, r_2hznz=None, r_2hxynxy=0.0,
+                          r_hxy=10.0, r_hz=1.0, etaxy=0.0, etaz=0.0, j_hn=JHN,
+                          cs_n=0.0, cs_h=0.0, b1_offset=()):
         """
-        Calculate the intensity in presence of exchange during a cpmg-type pulse train.
+        Calculate the intensities in presence of exchange during a cpmg-type pulse train.
 
         Keyword arguments:
         I0 -- Initial intensity,
@@ -45,8 +61,8 @@ def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, b1_frq_h=0.0,
                 1.5 (default)
         cs_offset -- chemical shift from the carrier in rad/s,
                      0.0 (default)
-        B1_offset -- frequency offset of the applied B1 field in Hz,
-                     0.0 Hz (default)
+        B1_offset -- frequency offsets of the applied B1 field in Hz,
+                     () (default)
         B1_frq -- strength of the applied B1 field in Hz,
                   0.0 Hz (default)
         B1_inh -- B1 field inhomogeneity in Hz,
@@ -56,7 +72,7 @@ def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, b1_frq_h=0.0,
 
 
 
-        Returns: float
+        Returns: ndarray
         """
 
         wg_h = (cs_h - carrier_h) * ppm_to_rads_h
@@ -66,21 +82,27 @@ def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, b1_frq_h=0.0,
 
         mag_eq = set_nz(pb)
 
-        if abs(b1_offset) > 9999.0:
+        exchange_induced_shift_n, _ = correct_chemical_shift(
+            pb=pb,
+            kex=kex,
+            dw=dw_n_rads,
+            r_ixy=r_nxy,
+            dr_ixy=dr_nxy
+        )
 
-            mag = mag_eq
+        b1_frq_n_list = linspace(-2.0, 2.0, b1_inh_res) * b1_inh + b1_frq
+        b1_frq_n_scales = norm.pdf(b1_frq_n_list, b1_frq, b1_inh)
+        b1_frq_n_scales /= b1_frq_n_scales.sum()
 
-        else:
+        # The magnetization is not affected by the B1 field far off-resonance
+        observables = repeat(get_nz(mag_eq)[0], len(b1_offset))
+        saturated, saturated_offsets = _get_saturated_offsets(b1_offset)
 
-            exchange_induced_shift_n, _ = correct_chemical_shift(
-                pb=pb,
-                kex=kex,
-                dw=dw_n_rads,
-                r_ixy=r_nxy,
-                dr_ixy=dr_nxy
-            )
+        liouvillians = []
+
+        for a_b1_offset in saturated_offsets:
 
-            offset_n = wg_n - exchange_induced_shift_n - b1_offset * 2.0 * pi
+            offset_n = wg_n - exchange_induced_shift_n - a_b1_offset * 2.0 * pi
 
             liouvillian = compute_liouvillian_free_precession(
                 pb=pb,
@@ -101,42 +123,71 @@ def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, b1_frq_h=0.0,
                 j_hn=j_hn
             )
 
-            b1_frq_n_list = linspace(-2.0, 2.0, b1_inh_res) * b1_inh + b1_frq
-            b1_frq_n_scales = norm.pdf(b1_frq_n_list, b1_frq, b1_inh)
-            b1_frq_n_scales /= b1_frq_n_scales.sum()
-
-            mag = sum(
-                scale *
-                make_pulse_nh(
+            liouvillians.append([
+                compute_liouvillian_pulse_nh(
                     liouvillian=liouvillian,
                     w1_h=TWO_PI * b1_frq_h,
                     phase_h=0.0,
                     w1_n=TWO_PI * b1_frq_n,
-                    phase_n=0.0,
-                    pw=time_t1
-                ).dot(mag_eq)
-                for b1_frq_n, scale in zip(b1_frq_n_list, b1_frq_n_scales)
+                    phase_n=0.0
+                )
+                for b1_frq_n in b1_frq_n_list
+            ])
+
+        if liouvillians:
+
+            # The propagators of all the offsets and B1 inhomogeneity samples are
+            # computed in a single batched operation
+            propagators = compute_averaged_propagators(
+                asarray(liouvillians)[(Ellipsis,) + subspace_2d],
+                tile(b1_frq_n_scales, (len(liouvillians), 1)),
+                time_t1
             )
 
-        return get_nz(mag)[0]
+            mag = zeros_like(mag_eq)
+            mags = []
+
+            for propagator in propagators:
+                mag[subspace] = propagator.dot(mag_eq[subspace])
+                mags.append(get_nz(mag)[0])
 
-    def calc_observable(i0=0.0, **kwargs):
+            observables[saturated] = mags
+
+        return observables
+
+    def calc_observables(i0=0.0, **kwargs):
         """
-        Calculate the intensity in presence of exchange after a CEST block.
+        Calculate the intensities in presence of exchange after a CEST block.
 
         Parameters
         ----------
         i0 : float
             Initial intensity.
+        b1_offset : tuple of float
+            Frequency offsets of the applied B1 field in Hz.
+
+        Returns
+        -------
+        out : ndarray
+            Intensities after the CEST block
+
+        """
+
+        return i0 * _calc_observables(**kwargs)
+
+    def calc_derivatives(i0=0.0, **kwargs):
+        """
+        Calculate the derivatives of the intensities with respect to the
+        parameters for which a closed form is known.
 
         Returns
         -------
-        out : float
-            Intensity after the CEST block
+        out : dict
+            Derivatives of the intensities, keyed by parameter name
 
         """
 
-        return i0 * _calc_observable(**kwargs)
+        return {'i0': _calc_observables(**kwargs)}
 
-    return calc_observable
+    return calc_observables, calc_derivatives
 
@@ -4,8 +4,7 @@ from math import pi
 from chemex import parsing
 from chemex.experiments.base_data_point import BaseDataPoint
 from chemex.constants import xi_ratio
-from .back_calculation import make_calc_observable
-from ..plotting import plot_data
+from .back_calculation import make_calc_observables
 
 
 TWO_PI = 2.0 * pi
@@ -32,7 +31,7 @@ class DataPoint(BaseDataPoint):
 
     def __init__(self, val, err, par):
         BaseDataPoint.__init__(self, val, err, par, PAR_DICT['par_conv'],
-                               plot_data)
+                               'cest')
 
         self.par['ppm_to_rads_h'] = TWO_PI * self.par['h_larmor_frq']
         self.par['ppm_to_rads'] = TWO_PI * self.par['h_larmor_frq'] * RATIO_N
@@ -53,10 +52,12 @@ class DataPoint(BaseDataPoint):
 
         args = (
             self.par[arg]
-            for arg in getargspec(make_calc_observable.__wrapped__).args
+            for arg in getargspec(make_calc_observables.__wrapped__).args
         )
 
-        self.calc_observable = make_calc_observable(*args)
+        self.calc_observables, self.calc_derivatives = make_calc_observables(*args)
+
+        self.kwargs_profile = {'b1_offset': self.par['b1_offset']}
 
         self.short_long_par_names = (
             ('i0', ('i0', resonance_id, experiment_name)),
@@ -108,12 +109,3 @@ class DataPoint(BaseDataPoint):
             output.append('{:8.5f}'.format(self.cal))
 
         return ' '.join(output)
-
-    def update_b1_offset(self, b1_offset):
-        """Update b1_offset value"""
-
-        self.par['b1_offset'] = b1_offset
-        args = (self.par[arg] for arg in
-                getargspec(make_calc_observable.__wrapped__).args)
-        self.calc_observable = make_calc_observable(*args)
-
@@ -1,6 +1,6 @@
 from math import pi
 
-from scipy import zeros, cos, sin
+from scipy import zeros, cos, sin, ndarray
 from scipy.linalg import expm2 as expm
 
 from chemex import caching
@@ -8,7 +8,16 @@ from chemex.constants import scalar_couplings
 from chemex.bases.two_states.full import (
     R_HXY, R_HZ, R_NXY_A, R_NXY_B, R_NZ, R_2HXYNZ, R_2HZNXY_A, R_2HZNXY_B,
     R_2HXYNXY, R_2HZNZ, CS_H_A, CS_H_B, CS_N_A, CS_N_B, J_HN, ETAZ, ETAXY,
-    W1X_H, W1Y_H, W1X_N, W1Y_N, KAB, KBA
+    W1X_H, W1Y_H, W1X_N, W1Y_N, compute_exchange_matrix
+)
+from chemex.bases.assembly import make_compute_liouvillian, find_invariant_subspace
+
+
+# Terms of the Liouvillian that are linear in the parameters (the exchange
+# block is shared by the residues, see 'compute_exchange_matrix')
+_compute_linear_terms = make_compute_liouvillian(
+    R_HXY, R_HZ, R_NXY_A, R_NXY_B, R_NZ, R_2HXYNZ, R_2HZNXY_A, R_2HZNXY_B,
+    R_2HXYNXY, R_2HZNZ, CS_H_A, CS_H_B, CS_N_A, CS_N_B, J_HN, ETAXY, ETAZ
 )
 
 
@@ -16,6 +25,28 @@ JHN = scalar_couplings['amide_HN']
 
 
 @caching.lru_cache()
+def _compute_liouvillian_free_precession(pb, kex, dw_h, dw_n, r_nxy,
+                                         dr_nxy, r_nz, r_2hznz,
+                                         r_2hxynxy, r_hxy, r_hz,
+                                         etaxy, etaz, cs_offset_h,
+                                         cs_offset_n, j_hn):
+    """Cached computation of the Liouvillian, see
+    'compute_liouvillian_free_precession'"""
+
+    r_2sf = r_2hznz - r_nz
+    r_2hznxy = r_nxy + r_2sf
+    r_2hxynz = r_hxy - r_nz
+
+    liouvillian = _compute_linear_terms(
+        r_hxy, r_hz, r_nxy, r_nxy + dr_nxy, r_nz, r_2hxynz, r_2hznxy,
+        r_2hznxy + dr_nxy, r_2hxynxy, r_2hznz, cs_offset_h, cs_offset_h + dw_h,
+        cs_offset_n, cs_offset_n + dw_n, pi * j_hn, etaxy, etaz
+    )
+    liouvillian = liouvillian + compute_exchange_matrix(pb, kex)
+
+    return liouvillian
+
+
 def compute_liouvillian_free_precession(pb=0.0, kex=0.0, dw_h=0.0, dw_n=0.0,
                                         r_nxy=5.0, dr_nxy=0.0, r_nz=1.5,
                                         r_2hznz=0.0, r_2hxynxy=0.0, r_hxy=10.0,
@@ -52,39 +83,19 @@ def compute_liouvillian_free_precession(pb=0.0, kex=0.0, dw_h=0.0, dw_n=0.0,
     atom_name -- nucleus that is considered
                  atom_name = 'N' (default)
 
-    Returns: numpy.matrix
+    Returns: numpy.matrix, or batch of matrices (not cached) if any of
+    the parameters is an array, e.g. one value per residue
     """
 
-    kab = kex * pb
-    kba = kex - kab
-
-    r_2sf = r_2hznz - r_nz
-    r_2hznxy = r_nxy + r_2sf
-    r_2hxynz = r_hxy - r_nz
-
-    liouvillian = (
-        R_HXY * r_hxy +
-        R_HZ * r_hz +
-        R_NXY_A * r_nxy +
-        R_NXY_B * (r_nxy + dr_nxy) +
-        R_NZ * r_nz +
-        R_2HXYNZ * r_2hxynz +
-        R_2HZNXY_A * r_2hznxy +
-        R_2HZNXY_B * (r_2hznxy + dr_nxy) +
-        R_2HXYNXY * r_2hxynxy +
-        R_2HZNZ * r_2hznz +
-        CS_H_A * cs_offset_h +
-        CS_H_B * (cs_offset_h + dw_h) +
-        CS_N_A * cs_offset_n +
-        CS_N_B * (cs_offset_n + dw_n) +
-        J_HN * pi * j_hn +
-        ETAXY * etaxy +
-        ETAZ * etaz +
-        KAB * kab +
-        KBA * kba
+    parameters = (
+        pb, kex, dw_h, dw_n, r_nxy, dr_nxy, r_nz, r_2hznz, r_2hxynxy,
+        r_hxy, r_hz, etaxy, etaz, cs_offset_h, cs_offset_n, j_hn
     )
 
-    return liouvillian
+    if any(isinstance(parameter, ndarray) for parameter in parameters):
+        return _compute_liouvillian_free_precession.__wrapped__(*parameters)
+
+    return _compute_liouvillian_free_precession(*parameters)
 
 
 def set_nz(pb):
@@ -103,8 +114,24 @@ def get_nz(mag):
     return ia, ib
 
 
-def make_pulse_nh(liouvillian, w1_h=0.0, phase_h=0.0, w1_n=0.0, phase_n=0.0,
-                  pw=0.0):
+def compute_nz_subspace(w1_h=0.0, w1_n=0.0):
+    """Indexes of the basis elements coupled to Nz{A,B} in presence of the given
+    1H and 15N B1 fields (without 1H field, e.g., the proton transverse
+    coherences are left out)."""
+
+    matrices = [_compute_linear_terms.stack, compute_exchange_matrix.stack]
+
+    if w1_h:
+        matrices.extend([W1X_H, W1Y_H])
+
+    if w1_n:
+        matrices.extend([W1X_N, W1Y_N])
+
+    return find_invariant_subspace([5, 5 + 15], *matrices)
+
+
+def compute_liouvillian_pulse_nh(liouvillian, w1_h=0.0, phase_h=0.0, w1_n=0.0,
+                                 phase_n=0.0):
     phase_rad_h = 0.5 * phase_h * pi
     phase_rad_n = 0.5 * phase_n * pi
 
@@ -122,4 +149,17 @@ def make_pulse_nh(liouvillian, w1_h=0.0, phase_h=0.0, w1_n=0.0, phase_n=0.0,
         w1y_n * W1Y_N
     )
 
+    return new_liouvillian
+
+
+def make_pulse_nh(liouvillian, w1_h=0.0, phase_h=0.0, w1_n=0.0, phase_n=0.0,
+                  pw=0.0):
+    new_liouvillian = compute_liouvillian_pulse_nh(
+        liouvillian=liouvillian,
+        w1_h=w1_h,
+        phase_h=phase_h,
+        w1_n=w1_n,
+        phase_n=phase_n
+    )
+
     return expm(new_liouvillian * pw)
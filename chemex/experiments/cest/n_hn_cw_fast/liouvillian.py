@@ -1,11 +1,23 @@
 from math import pi
 
+from scipy import ndarray
+
 from chemex import caching
 from chemex.constants import scalar_couplings
 from chemex.bases.two_states.full import (
     R_HXY, R_HZ, R_NXY_A, R_NXY_B, R_NZ, R_2HXYNZ, R_2HZNXY_A, R_2HZNXY_B,
     R_2HXYNXY, R_2HZNZ, CS_H_A, CS_H_B, CS_N_A, CS_N_B, J_HN, ETAZ, ETAXY,
-    W1X_H, W1X_N, KAB, KBA
+    W1X_H, W1X_N, compute_exchange_matrix
+)
+from chemex.bases.assembly import make_compute_liouvillian
+
+
+# Terms of the Liouvillian that are linear in the parameters (the exchange
+# block is shared by the residues, see 'compute_exchange_matrix')
+_compute_linear_terms = make_compute_liouvillian(
+    R_HXY, R_HZ, R_NXY_A, R_NXY_B, R_NZ, R_2HXYNZ, R_2HZNXY_A, R_2HZNXY_B,
+    R_2HXYNXY, R_2HZNZ, CS_H_A, CS_H_B, CS_N_A, CS_N_B, J_HN, ETAXY, ETAZ,
+    W1X_H, W1X_N
 )
 
 
@@ -13,6 +25,25 @@ JHN = scalar_couplings['amide_HN']
 
 
 @caching.lru_cache()
+def _compute_liouvillian(pb, kex, dw_h, dw_n, r_nxy, dr_nxy, r_nz,
+                         r_2hznz, r_2hxynxy, r_hxy, r_hz, etaxy, etaz,
+                         cs_offset_h, cs_offset_n, j_hn, w1_h, w1_n):
+    """Cached computation of the Liouvillian, see 'compute_liouvillian'"""
+
+    r_2sf = r_2hznz - r_nz
+    r_2hznxy = r_nxy + r_2sf
+    r_2hxynz = r_hxy - r_nz
+
+    liouvillian = _compute_linear_terms(
+        r_hxy, r_hz, r_nxy, r_nxy + dr_nxy, r_nz, r_2hxynz, r_2hznxy,
+        r_2hznxy + dr_nxy, r_2hxynxy, r_2hznz, cs_offset_h, cs_offset_h + dw_h,
+        cs_offset_n, cs_offset_n + dw_n, pi * j_hn, etaxy, etaz, w1_h, w1_n
+    )
+    liouvillian = liouvillian + compute_exchange_matrix(pb, kex)
+
+    return liouvillian
+
+
 def compute_liouvillian(pb=0.0, kex=0.0, dw_h=0.0, dw_n=0.0, r_nxy=5.0,
                         dr_nxy=0.0, r_nz=1.5, r_2hznz=0.0, r_2hxynxy=0.0,
                         r_hxy=10.0, r_hz=1.0, etaxy=0.0, etaz=0.0,
@@ -48,38 +79,17 @@ def compute_liouvillian(pb=0.0, kex=0.0, dw_h=0.0, dw_n=0.0, r_nxy=5.0,
     atom_name -- nucleus that is considered
                  atom_name = 'N' (default)
 
-    Returns: numpy.matrix
+    Returns: numpy.matrix, or batch of matrices (not cached) if any of
+    the parameters is an array, e.g. one value per residue
     """
 
-    kab = kex * pb
-    kba = kex - kab
-
-    r_2sf = r_2hznz - r_nz
-    r_2hznxy = r_nxy + r_2sf
-    r_2hxynz = r_hxy - r_nz
-
-    liouvillian = (
-        R_HXY * r_hxy +
-        R_HZ * r_hz +
-        R_NXY_A * r_nxy +
-        R_NXY_B * (r_nxy + dr_nxy) +
-        R_NZ * r_nz +
-        R_2HXYNZ * r_2hxynz +
-        R_2HZNXY_A * r_2hznxy +
-        R_2HZNXY_B * (r_2hznxy + dr_nxy) +
-        R_2HXYNXY * r_2hxynxy +
-        R_2HZNZ * r_2hznz +
-        CS_H_A * cs_offset_h +
-        CS_H_B * (cs_offset_h + dw_h) +
-        CS_N_A * cs_offset_n +
-        CS_N_B * (cs_offset_n + dw_n) +
-        J_HN * pi * j_hn +
-        ETAXY * etaxy +
-        ETAZ * etaz +
-        KAB * kab +
-        KBA * kba +
-        w1_h * W1X_H +
-        w1_n * W1X_N
+    parameters = (
+        pb, kex, dw_h, dw_n, r_nxy, dr_nxy, r_nz, r_2hznz, r_2hxynxy,
+        r_hxy, r_hz, etaxy, etaz, cs_offset_h, cs_offset_n, j_hn,
+        w1_h, w1_n
     )
 
-    return liouvillian
+    if any(isinstance(parameter, ndarray) for parameter in parameters):
+        return _compute_liouvillian.__wrapped__(*parameters)
+
+    return _compute_liouvillian(*parameters)
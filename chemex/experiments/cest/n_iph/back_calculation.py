@@ -5,26 +5,24 @@ Created on Aug 15, 2011
 """
 
 import scipy as sc
-from scipy.linalg import expm2 as expm
 
 from chemex.experiments.misc import correct_chemical_shift
 from chemex.caching import lru_cache
+from chemex.experiments.propagators import compute_averaged_propagators
 from .liouvillian import compute_nz_eq, compute_base_liouvillians, compute_free_liouvillian, get_nz
 
 
 @lru_cache()
-def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, b1_inh=0.0, b1_inh_res=5, carrier=0.0, ppm_to_rads=0.0,
-                         _id=None):
+def make_calc_observables(time_t1=0.0, b1_frq=0.0, b1_inh=0.0, b1_inh_res=5, carrier=0.0, ppm_to_rads=0.0,
+                          _id=None):
     """
-    Factory to make "calc_observable" function to calculate the intensity in presence
+    Factory to make "calc_observables" function to calculate the intensities in presence
     of exchange after a CEST block.
 
     Parameters
     ----------
     time_t1 : float
         Duration of the CW block.
-    b1_offset : float
-        Frequency offset of the applied B1 field in Hz.
     b1_frq : float
         Strength of the applied B1 field in Hz.
     b1_inh : float
@@ -40,17 +38,31 @@ def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, b1_inh=0.0, b1_
 
     Returns
     -------
-    out : function
-        Calculate intensity after the CEST block
+    out : tuple of function
+        Calculate intensities after the CEST block,
+        and the derivatives of the intensities known in closed form
 
     """
 
-    base_liouvillians, weights = compute_base_liouvillians(b1_offset, b1_frq, b1_inh, b1_inh_res)
+    @lru_cache(5)
+    def _compute_base_liouvillians(b1_offset=()):
+        # The reference points (far off-resonance) are not affected by the B1
+        # field and do not need any Liouvillian
+        saturated = abs(sc.asarray(b1_offset)) < 10000.0
+        if not saturated.any():
+            return saturated, None, None
+        base_liouvillians, weights = zip(*[
+            compute_base_liouvillians(a_b1_offset, b1_frq, b1_inh, b1_inh_res)
+            for a_b1_offset in sc.asarray(b1_offset)[saturated]
+        ])
+        weights = sc.asarray(weights)
+        return saturated, sc.asarray(base_liouvillians), weights / weights.sum(axis=1)[:, sc.newaxis]
 
     @lru_cache(5)
-    def _calc_observable(pb=0.0, kex=0.0, dw=0.0, r_nz=1.5, r_nxy=0.0, dr_nxy=0.0, cs=0.0):
+    def _calc_observables(pb=0.0, kex=0.0, dw=0.0, r_nz=1.5, r_nxy=0.0, dr_nxy=0.0, cs=0.0,
+                          b1_offset=()):
         """
-        Calculate the intensity in presence of exchange after a CEST block assuming
+        Calculate the intensities in presence of exchange after a CEST block assuming
         initial intensity of 1.0.
 
         Parameters
@@ -70,55 +82,79 @@ def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, b1_inh=0.0, b1_
             Transverse relaxation rate difference between states a and b in /s.
         cs : float
             Resonance position in rad/s.
+        b1_offset : tuple of float
+            Frequency offsets of the applied B1 field in Hz.
 
         Returns
         -------
-        out : float
-            Intensity after the CEST block
+        out : ndarray
+            Intensities after the CEST block
 
         """
 
-        if abs(b1_offset) >= 10000.0:
+        dw *= ppm_to_rads
+        mag_eq = compute_nz_eq(pb)
+        exchange_induced_shift, _ = correct_chemical_shift(pb=pb, kex=kex, dw=dw,
+                                                           r_ixy=r_nxy, dr_ixy=dr_nxy)
+        wg = (cs - carrier) * ppm_to_rads - exchange_induced_shift
 
-            return 1.0 - pb
+        l_free = compute_free_liouvillian(pb=pb, kex=kex, dw=dw,
+                                          r_nxy=r_nxy, dr_nxy=dr_nxy,
+                                          r_nz=r_nz, cs_offset=wg)
 
-        else:
+        saturated, base_liouvillians, weights = _compute_base_liouvillians(b1_offset)
 
-            dw *= ppm_to_rads
-            mag_eq = compute_nz_eq(pb)
-            exchange_induced_shift, _ = correct_chemical_shift(pb=pb, kex=kex, dw=dw,
-                                                               r_ixy=r_nxy, dr_ixy=dr_nxy)
-            wg = (cs - carrier) * ppm_to_rads - exchange_induced_shift
+        # The magnetization is not affected by the B1 field far off-resonance
+        observables = sc.repeat(1.0 - pb, len(b1_offset))
 
-            liouvillians = base_liouvillians + compute_free_liouvillian(pb=pb, kex=kex, dw=dw,
-                                                                        r_nxy=r_nxy, dr_nxy=dr_nxy,
-                                                                        r_nz=r_nz, cs_offset=wg)
+        if saturated.any():
 
-            propagator = sc.zeros_like(liouvillians[0])
-            for liouvillian, weight in zip(liouvillians, weights):
-                propagator += weight * expm(liouvillian * time_t1)
-            propagator /= sum(weights)
+            # The propagators of all the offsets and B1 inhomogeneity samples are
+            # computed in a single batched operation
+            propagators = compute_averaged_propagators(
+                base_liouvillians + l_free,
+                weights,
+                time_t1
+            )
 
-            magz_a, _ = get_nz(sc.dot(propagator, mag_eq))
+            observables[saturated] = [
+                get_nz(propagator.dot(mag_eq))[0] for propagator in propagators
+            ]
 
-            return magz_a
+        return observables
 
-    def calc_observable(i0=0.0, **kwargs):
+    def calc_observables(i0=0.0, **kwargs):
         """
-        Calculate the intensity in presence of exchange after a CEST block.
+        Calculate the intensities in presence of exchange after a CEST block.
 
         Parameters
         ----------
         i0 : float
             Initial intensity.
+        b1_offset : tuple of float
+            Frequency offsets of the applied B1 field in Hz.
+
+        Returns
+        -------
+        out : ndarray
+            Intensities after the CEST block
+
+        """
+
+        return i0 * _calc_observables(**kwargs)
+
+    def calc_derivatives(i0=0.0, **kwargs):
+        """
+        Calculate the derivatives of the intensities with respect to the
+        parameters for which a closed form is known.
 
         Returns
         -------
-        out : float
-            Intensity after the CEST block
+        out : dict
+            Derivatives of the intensities, keyed by parameter name
 
         """
 
-        return i0 * _calc_observable(**kwargs)
+        return {'i0': _calc_observables(**kwargs)}
 
-    return calc_observable
+    return calc_observables, calc_derivatives
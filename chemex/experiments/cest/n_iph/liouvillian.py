@@ -1,8 +1,14 @@
 from scipy import pi, zeros, linspace, asarray
 from scipy.stats import norm
 
-from chemex.bases.two_states.iph import R_IXY, DR_IXY, R_IZ, CS, DW, KAB, KBA, \
-    W1X
+from chemex.bases.two_states.iph import R_IXY, DR_IXY, R_IZ, CS, DW, \
+    compute_exchange_matrix, W1X
+from chemex.bases.assembly import make_compute_liouvillian
+
+
+# Terms of the Liouvillian that are linear in the parameters (the exchange
+# block is shared by the residues, see 'compute_exchange_matrix')
+_compute_linear_terms = make_compute_liouvillian(R_IXY, DR_IXY, R_IZ, CS, DW)
 
 
 def compute_base_liouvillians(b1_offset=0.0, b1_frq=0.0, b1_inh=0.0,
@@ -54,16 +60,8 @@ def compute_free_liouvillian(pb=0.0, kex=0.0, dw=0.0, r_nz=1.5, r_nxy=5.0,
 
     """
 
-    kab = kex * pb
-    kba = kex - kab
-
-    l_free = R_IXY * r_nxy
-    l_free += DR_IXY * dr_nxy
-    l_free += R_IZ * r_nz
-    l_free += CS * cs_offset
-    l_free += DW * dw
-    l_free += KAB * kab
-    l_free += KBA * kba
+    l_free = _compute_linear_terms(r_nxy, dr_nxy, r_nz, cs_offset, dw)
+    l_free = l_free + compute_exchange_matrix(pb, kex)
 
     return l_free
 
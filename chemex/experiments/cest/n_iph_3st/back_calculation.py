@@ -1,24 +1,22 @@
 import scipy as sc
-from scipy.linalg import expm2 as expm
 
 from ....caching import lru_cache
+from ...propagators import compute_averaged_propagators
 from .liouvillian import compute_nz_eq, compute_base_liouvillians, \
     compute_free_liouvillian, get_nz
 
 
 @lru_cache()
-def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, b1_inh=0.0,
-                         b1_inh_res=5, carrier=0.0, ppm_to_rads=0.0, _id=None):
+def make_calc_observables(time_t1=0.0, b1_frq=0.0, b1_inh=0.0, b1_inh_res=5,
+                          carrier=0.0, ppm_to_rads=0.0, _id=None):
     """
-    Factory to make "calc_observable" function to calculate the intensity in presence
+    Factory to make "calc_observables" function to calculate the intensities in presence
     of exchange after a CEST block.
 
     Parameters
     ----------
     time_t1 : float
         Duration of the CW block.
-    b1_offset : float
-        Frequency offset of the applied B1 field in Hz.
     b1_frq : float
         Strength of the applied B1 field in Hz.
     b1_inh : float
@@ -34,19 +32,32 @@ def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, b1_inh=0.0,
 
     Returns
     -------
-    out : function
-        Calculate intensity after the CEST block
+    out : tuple of function
+        Calculate intensities after the CEST block,
+        and the derivatives of the intensities known in closed form
 
     """
 
-    base_liouvillians, weights = \
-        compute_base_liouvillians(b1_offset, b1_frq, b1_inh, b1_inh_res)
+    @lru_cache(5)
+    def _compute_base_liouvillians(b1_offset=()):
+        # The reference points (far off-resonance) are not affected by the B1
+        # field and do not need any Liouvillian
+        saturated = abs(sc.asarray(b1_offset)) < 10000.0
+        if not saturated.any():
+            return saturated, None, None
+        base_liouvillians, weights = zip(*[
+            compute_base_liouvillians(a_b1_offset, b1_frq, b1_inh, b1_inh_res)
+            for a_b1_offset in sc.asarray(b1_offset)[saturated]
+        ])
+        weights = sc.asarray(weights)
+        return saturated, sc.asarray(base_liouvillians), weights / weights.sum(axis=1)[:, sc.newaxis]
 
     @lru_cache(5)
-    def _calc_observable(pb=0.0, pc=0.0, kex_ab=0.0, kex_bc=0.0, kex_ac=0.0,
-                         dw_ab=0.0, dw_ac=0.0, r_nz=1.5, r_nxy=0.0, dr_nxy_ab=0.0, dr_nxy_ac=0.0, cs=0.0):
+    def _calc_observables(pb=0.0, pc=0.0, kex_ab=0.0, kex_bc=0.0, kex_ac=0.0,
+                          dw_ab=0.0, dw_ac=0.0, r_nz=1.5, r_nxy=0.0, dr_nxy_ab=0.0, dr_nxy_ac=0.0, cs=0.0,
+                          b1_offset=()):
         """
-        Calculate the intensity in presence of exchange after a CEST block.
+        Calculate the intensities in presence of exchange after a CEST block.
 
         Parameters
         ----------
@@ -76,70 +87,92 @@ def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, b1_inh=0.0,
             Transverse relaxation rate difference between states a and c in /s.
         cs : float
             Resonance position in rad/s.
+        b1_offset : tuple of float
+            Frequency offsets of the applied B1 field in Hz.
 
         Returns
         -------
-        out : float
-            Intensity after the CEST block
+        out : ndarray
+            Intensities after the CEST block
 
         """
 
-        if abs(b1_offset) >= 10000.0:
-
-            return 1.0 - pb - pc
-
-        else:
-
-            dw_ab *= ppm_to_rads
-            dw_ac *= ppm_to_rads
-
-            mag_eq = compute_nz_eq(pb, pc)
-
-            exchange_induced_shift = 0.0  # TODO
-            wg = (cs - carrier) * ppm_to_rads - exchange_induced_shift
-
-            liouvillians = \
-                base_liouvillians + \
-                compute_free_liouvillian(
-                    pb=pb,
-                    pc=pc,
-                    kex_ab=kex_ab,
-                    kex_bc=kex_bc,
-                    kex_ac=kex_ac,
-                    dw_ab=dw_ab,
-                    dw_ac=dw_ac,
-                    r_nxy=r_nxy,
-                    r_nz=r_nz,
-                    dr_nxy_ab=dr_nxy_ab,
-                    dr_nxy_ac=dr_nxy_ac,
-                    cs_offset=wg
+        dw_ab *= ppm_to_rads
+        dw_ac *= ppm_to_rads
+
+        mag_eq = compute_nz_eq(pb, pc)
+
+        exchange_induced_shift = 0.0  # TODO
+        wg = (cs - carrier) * ppm_to_rads - exchange_induced_shift
+
+        l_free = compute_free_liouvillian(
+            pb=pb,
+            pc=pc,
+            kex_ab=kex_ab,
+            kex_bc=kex_bc,
+            kex_ac=kex_ac,
+            dw_ab=dw_ab,
+            dw_ac=dw_ac,
+            r_nxy=r_nxy,
+            r_nz=r_nz,
+            dr_nxy_ab=dr_nxy_ab,
+            dr_nxy_ac=dr_nxy_ac,
+            cs_offset=wg
+        )
+
+        saturated, base_liouvillians, weights = _compute_base_liouvillians(b1_offset)
+
+        # The magnetization is not affected by the B1 field far off-resonance
+        observables = sc.repeat(1.0 - pb - pc, len(b1_offset))
+
+        if saturated.any():
+
+            # The propagators of all the offsets and B1 inhomogeneity samples are
+            # computed in a single batched operation
+            propagators = compute_averaged_propagators(
+                base_liouvillians + l_free,
+                weights,
+                time_t1
             )
 
-            propagator = sc.zeros_like(liouvillians[0])
-            for liouvillian, weight in zip(liouvillians, weights):
-                propagator += weight * expm(liouvillian * time_t1)
-            propagator /= sum(weights)
-
-            magz_a, _, _ = get_nz(sc.dot(propagator, mag_eq))
+            observables[saturated] = [
+                get_nz(propagator.dot(mag_eq))[0] for propagator in propagators
+            ]
 
-            return magz_a
+        return observables
 
-    def calc_observable(i0=0.0, **kwargs):
+    def calc_observables(i0=0.0, **kwargs):
         """
-        Calculate the intensity in presence of exchange after a CEST block.
+        Calculate the intensities in presence of exchange after a CEST block.
 
         Parameters
         ----------
         i0 : float
             Initial intensity.
+        b1_offset : tuple of float
+            Frequency offsets of the applied B1 field in Hz.
+
+        Returns
+        -------
+        out : ndarray
+            Intensities after the CEST block
+
+        """
+
+        return i0 * _calc_observables(**kwargs)
+
+    def calc_derivatives(i0=0.0, **kwargs):
+        """
+        Calculate the derivatives of the intensities with respect to the
+        parameters for which a closed form is known.
 
         Returns
         -------
-        out : float
-            Intensity after the CEST block
+        out : dict
+            Derivatives of the intensities, keyed by parameter name
 
         """
 
-        return i0 * _calc_observable(**kwargs)
+        return {'i0': _calc_observables(**kwargs)}
 
-    return calc_observable
+    return calc_observables, calc_derivatives
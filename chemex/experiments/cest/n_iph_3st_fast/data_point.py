@@ -4,8 +4,7 @@ from math import pi
 from ....parsing import parse_assignment
 from ....constants import xi_ratio
 from ...base_data_point import BaseDataPoint
-from ..plotting import plot_data
-from .back_calculation import make_calc_observable
+from .back_calculation import make_calc_observables
 
 
 RATIO_N = xi_ratio['N']
@@ -30,7 +29,7 @@ class DataPoint(BaseDataPoint):
 
     def __init__(self, val, err, par):
         BaseDataPoint.__init__(self, val, err, par, PAR_DICT['par_conv'],
-                               plot_data)
+                               'cest')
 
         self.par['ppm_to_rads'] = TWO_PI * self.par['h_larmor_frq'] * RATIO_N
 
@@ -47,10 +46,12 @@ class DataPoint(BaseDataPoint):
 
         args = (
             self.par[arg]
-            for arg in getargspec(make_calc_observable.__wrapped__).args
+            for arg in getargspec(make_calc_observables.__wrapped__).args
         )
 
-        self.calc_observable = make_calc_observable(*args)
+        self.calc_observables, self.calc_derivatives = make_calc_observables(*args)
+
+        self.kwargs_profile = {'b1_offset': self.par['b1_offset']}
 
         self.short_long_par_names = (
             ('pb', ('pb', temperature)),
@@ -99,15 +100,3 @@ class DataPoint(BaseDataPoint):
             output.append('{:8.5f}'.format(self.cal))
 
         return ' '.join(output)
-
-    def update_b1_offset(self, b1_offset):
-        """Update b1_offset value"""
-
-        self.par['b1_offset'] = b1_offset
-
-        args = (
-            self.par[arg]
-            for arg in getargspec(make_calc_observable.__wrapped__).args
-        )
-
-        self.calc_observable = make_calc_observable(*args)
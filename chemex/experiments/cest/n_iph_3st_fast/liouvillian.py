@@ -1,5 +1,13 @@
 from ....bases.three_states.iph import R_IXY, DR_IXY_AB, DR_IXY_AC, R_IZ, CS, \
-    DW_AB, DW_AC, KAB, KBA, KAC, KCA, KBC, KCB, W1X
+    DW_AB, DW_AC, compute_exchange_matrix, W1X
+from ....bases.assembly import make_compute_liouvillian
+
+
+# Terms of the Liouvillian that are linear in the parameters (the exchange
+# block is shared by the residues, see 'compute_exchange_matrix')
+_compute_linear_terms = make_compute_liouvillian(
+    R_IXY, DR_IXY_AB, DR_IXY_AC, R_IZ, CS, DW_AB, DW_AC, W1X
+)
 
 
 def compute_liouvillian(pb=0.0, pc=0.0, kex_ab=0.0, kex_bc=0.0, kex_ac=0.0,
@@ -49,33 +57,10 @@ def compute_liouvillian(pb=0.0, pc=0.0, kex_ab=0.0, kex_bc=0.0, kex_ac=0.0,
 
     """
 
-    pa = 1.0 - pb - pc
-
-    kab = kex_ab * pb / (pa + pb)
-    kba = kex_ab * pa / (pa + pb)
-
-    kbc = kex_bc * pc / (pb + pc)
-    kcb = kex_bc * pb / (pb + pc)
-
-    kac = kex_ac * pc / (pa + pc)
-    kca = kex_ac * pa / (pa + pc)
-
-    liouvillian = (
-        R_IXY * r_nxy +
-        DR_IXY_AB * dr_nxy_ab +
-        DR_IXY_AC * dr_nxy_ac +
-        R_IZ * r_nz +
-        CS * cs_offset +
-        DW_AB * dw_ab +
-        DW_AC * dw_ac +
-        w1 * W1X +
-        KAB * kab +
-        KBA * kba +
-        KBC * kbc +
-        KCB * kcb +
-        KAC * kac +
-        KCA * kca
+    liouvillian = _compute_linear_terms(
+        r_nxy, dr_nxy_ab, dr_nxy_ac, r_nz, cs_offset, dw_ab, dw_ac, w1
     )
+    liouvillian = liouvillian + compute_exchange_matrix(pb, pc, kex_ab, kex_bc, kex_ac)
 
     return liouvillian
 
@@ -12,17 +12,15 @@ exp = sc.exp
 
 
 @lru_cache()
-def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, carrier=0.0, ppm_to_rads=0.0, _id=None):
+def make_calc_observables(time_t1=0.0, b1_frq=0.0, carrier=0.0, ppm_to_rads=0.0, _id=None):
     """
-    Factory to make "calc_observable" function to calculate the intensity in presence
+    Factory to make "calc_observables" function to calculate the intensities in presence
     of exchange after a CEST block.
 
     Parameters
     ----------
     time_t1 : float
         Duration of the CW block.
-    b1_offset : float
-        Frequency offset of the applied B1 field in Hz.
     b1_frq : float
         Strength of the applied B1 field in Hz.
     b1_inh : float
@@ -38,16 +36,17 @@ def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, carrier=0.0, pp
 
     Returns
     -------
-    out : function
-        Calculate intensity after the CEST block
+    out : tuple of function
+        Calculate intensities after the CEST block,
+        and the derivatives of the intensities known in closed form
 
     """
 
     w1 = b1_frq * 2.0 * sc.pi
-    w1_offset = b1_offset * 2.0 * sc.pi
 
     @lru_cache(5)
-    def _calc_observable(pb=0.0, kex=0.0, dw=0.0, r_nz=1.5, r_nxy=0.0, dr_nxy=0.0, cs=0.0):
+    def _calc_observables(pb=0.0, kex=0.0, dw=0.0, r_nz=1.5, r_nxy=0.0, dr_nxy=0.0, cs=0.0,
+                          b1_offset=()):
         """
         Calculate the intensity in presence of exchange after a CEST block assuming
         initial intensity of 1.0.
@@ -69,79 +68,106 @@ def make_calc_observable(time_t1=0.0, b1_offset=0.0, b1_frq=0.0, carrier=0.0, pp
             Transverse relaxation rate difference between states a and b in /s.
         cs : float
             Resonance position in rad/s.
+        b1_offset : tuple of float
+            Frequency offsets of the applied B1 field in Hz.
 
         Returns
         -------
-        out : float
-            Intensity after the CEST block
+        out : ndarray
+            Intensities after the CEST block
 
         """
 
-        if abs(b1_offset) >= 10000.0:
+        dw *= ppm_to_rads
 
-            magz_a = (1.0 - pb)
+        exchange_induced_shift, _ = correct_chemical_shift(
+            pb=pb,
+            kex=kex,
+            dw=dw,
+            r_ixy=r_nxy,
+            dr_ixy=dr_nxy
+        )
 
-        else:
+        magz_eq = sc.asarray([[1 - pb], [pb]])
 
-            dw *= ppm_to_rads
+        observables = []
 
-            exchange_induced_shift, _ = correct_chemical_shift(
-                pb=pb,
-                kex=kex,
-                dw=dw,
-                r_ixy=r_nxy,
-                dr_ixy=dr_nxy
-            )
+        for a_b1_offset in b1_offset:
 
-            wg = (
-                (cs - carrier) * ppm_to_rads -
-                exchange_induced_shift -
-                w1_offset
-            )
+            if abs(a_b1_offset) >= 10000.0:
 
-            liouvillian = compute_liouvillian(
-                pb=pb,
-                kex=kex,
-                dw=dw,
-                r_nxy=r_nxy,
-                dr_nxy=dr_nxy,
-                r_nz=r_nz,
-                cs_offset=wg,
-                w1=w1
-            )
+                magz_a = (1.0 - pb)
 
-            s, vr = eig(liouvillian)
-            vri = inv(vr)
+            else:
 
-            sl1 = [2, 5]
-            sl2 = [i for i, w in enumerate(s.imag) if abs(w) < 1.0e-6]
-            sl3 = [2]
+                w1_offset = a_b1_offset * 2.0 * sc.pi
 
-            vri = vri[sc.ix_(sl2, sl1)].real
-            t = diag(exp(s[sl2].real * time_t1))
-            vr = vr[sc.ix_(sl3, sl2)].real
-            magz_eq = sc.asarray([[1 - pb], [pb]])
+                wg = (
+                    (cs - carrier) * ppm_to_rads -
+                    exchange_induced_shift -
+                    w1_offset
+                )
 
-            magz_a = dot(dot(dot(vr, t), vri), magz_eq)[0, 0]
+                liouvillian = compute_liouvillian(
+                    pb=pb,
+                    kex=kex,
+                    dw=dw,
+                    r_nxy=r_nxy,
+                    dr_nxy=dr_nxy,
+                    r_nz=r_nz,
+                    cs_offset=wg,
+                    w1=w1
+                )
 
-        return magz_a
+                s, vr = eig(liouvillian)
+                vri = inv(vr)
 
-    def calc_observable(i0=0.0, **kwargs):
+                sl1 = [2, 5]
+                sl2 = [i for i, w in enumerate(s.imag) if abs(w) < 1.0e-6]
+                sl3 = [2]
+
+                vri = vri[sc.ix_(sl2, sl1)].real
+                t = diag(exp(s[sl2].real * time_t1))
+                vr = vr[sc.ix_(sl3, sl2)].real
+
+                magz_a = dot(dot(dot(vr, t), vri), magz_eq)[0, 0]
+
+            observables.append(magz_a)
+
+        return sc.asarray(observables)
+
+    def calc_observables(i0=0.0, **kwargs):
         """
-        Calculate the intensity in presence of exchange after a CEST block.
+        Calculate the intensities in presence of exchange after a CEST block.
 
         Parameters
         ----------
         i0 : float
             Initial intensity.
+        b1_offset : tuple of float
+            Frequency offsets of the applied B1 field in Hz.
+
+        Returns
+        -------
+        out : ndarray
+            Intensities after the CEST block
+
+        """
+
+        return i0 * _calc_observables(**kwargs)
+
+    def calc_derivatives(i0=0.0, **kwargs):
+        """
+        Calculate the derivatives of the intensities with respect to the
+        parameters for which a closed form is known.
 
         Returns
         -------
-        out : float
-            Intensity after the CEST block
+        out : dict
+            Derivatives of the intensities, keyed by parameter name
 
         """
 
-        return i0 * _calc_observable(**kwargs)
+        return {'i0': _calc_observables(**kwargs)}
 
-    return calc_observable
+    return calc_observables, calc_derivatives
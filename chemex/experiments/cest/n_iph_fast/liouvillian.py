@@ -1,5 +1,13 @@
-from chemex.bases.two_states.iph import R_IXY, DR_IXY, R_IZ, CS, DW, KAB, KBA, \
-    W1X
+from chemex.bases.two_states.iph import R_IXY, DR_IXY, R_IZ, CS, DW, \
+    compute_exchange_matrix, W1X
+from chemex.bases.assembly import make_compute_liouvillian
+
+
+# Terms of the Liouvillian that are linear in the parameters (the exchange
+# block is shared by the residues, see 'compute_exchange_matrix')
+_compute_linear_terms = make_compute_liouvillian(
+    R_IXY, DR_IXY, R_IZ, CS, DW, W1X
+)
 
 
 def compute_liouvillian(pb=0.0, kex=0.0, dw=0.0, r_nz=1.5, r_nxy=5.0,
@@ -39,18 +47,7 @@ def compute_liouvillian(pb=0.0, kex=0.0, dw=0.0, r_nz=1.5, r_nxy=5.0,
 
     """
 
-    kab = kex * pb
-    kba = kex - kab
-
-    liouvillian = (
-        R_IXY * r_nxy +
-        DR_IXY * dr_nxy +
-        R_IZ * r_nz +
-        CS * cs_offset +
-        DW * dw +
-        w1 * W1X +
-        KAB * kab +
-        KBA * kba
-    )
+    liouvillian = _compute_linear_terms(r_nxy, dr_nxy, r_nz, cs_offset, dw, w1)
+    liouvillian = liouvillian + compute_exchange_matrix(pb, kex)
 
     return liouvillian
@@ -7,6 +7,7 @@ from matplotlib.ticker import MaxNLocator, NullFormatter
 from matplotlib.backends.backend_pdf import PdfPages
 
 from chemex.parsing import parse_assignment
+from chemex.experiments.base_data_point import get_par
 
 
 dark_gray = '0.13'
@@ -78,25 +79,26 @@ def compute_profiles(data_grouped, par, par_names, par_fixed):
 
         b1_ppm_exp, mag_cal, mag_exp, mag_err = zip(*sorted(profile_exp))
 
-        profile_cal = []
-
         b1_offset_min, b1_offset_max = set_lim(
             [b1_offset_min, b1_offset_max], 0.02
         )
 
         data_pt = profile[0]
 
-        for b1_offset in sp.linspace(b1_offset_min, b1_offset_max, 500):
-            ppm_to_rads = data_pt.par['ppm_to_rads']
-            carrier_ppm = data_pt.par['carrier']
-            b1_ppm = (2.0 * sp.pi * b1_offset) / ppm_to_rads + carrier_ppm
+        ppm_to_rads = data_pt.par['ppm_to_rads']
+        carrier_ppm = data_pt.par['carrier']
 
-            data_pt.update_b1_offset(b1_offset)
-            data_pt.calc_val(par, par_names, par_fixed)
+        b1_offsets = sp.linspace(b1_offset_min, b1_offset_max, 500)
+        b1_ppms = (2.0 * sp.pi * b1_offsets) / ppm_to_rads + carrier_ppm
 
-            profile_cal.append([b1_ppm, data_pt.cal])
+        # The whole fitted curve is back-calculated in a single call
+        kwargs = dict(
+            (short_name, get_par(long_name, par, par_names, par_fixed))
+            for short_name, long_name in data_pt.short_long_par_names
+        )
+        mags = data_pt.calc_observables(b1_offset=tuple(b1_offsets), **kwargs)
 
-        b1_ppm_fit, mag_fit = zip(*sorted(profile_cal))
+        b1_ppm_fit, mag_fit = zip(*sorted(zip(b1_ppms, mags)))
 
         profiles.setdefault((index, resonance_id), []).append(
             [b1_ppm_exp, mag_cal, mag_exp, mag_err, b1_ppm_fit, mag_fit]
@@ -1,16 +1,15 @@
+import functools
 import os
 
 import scipy as sc
 import scipy.stats as st
 import scipy.linalg as la
-import scipy.signal as si
-import scipy.interpolate as ip
 
 from chemex import utils
 
 
 def read_data(cfg, working_dir, global_parameters, res_incl=None,
-              res_excl=None):
+              res_excl=None, jobs=1):
 
     # Reads the path to get the intensities
     exp_data_dir = utils.normalize_path(
@@ -19,6 +18,7 @@ def read_data(cfg, working_dir, global_parameters, res_incl=None,
     )
 
     data_points = list()
+    profiles = list()
 
     experiment_name = name_experiment(global_parameters)
 
@@ -40,7 +40,18 @@ def read_data(cfg, working_dir, global_parameters, res_incl=None,
 
         # Get the r2 values from the fuda files containing intensities
         abs_path_filename = os.path.join(exp_data_dir, filename)
-        data_points += read_a_cest_profile(abs_path_filename, parameters)
+        profiles.append((abs_path_filename, parameters))
+
+    # The profile files are read (and their uncertainties estimated) over
+    # 'jobs' processes, the data points being then made in the order of the
+    # files
+    tasks = [functools.partial(load_a_cest_profile, filename)
+             for filename, _ in profiles]
+
+    for (filename, parameters), (data, uncertainty) in zip(
+            profiles, utils.run_tasks(tasks, jobs)):
+        data_points += make_cest_data_points(filename, parameters, data,
+                                             uncertainty)
 
     # Adjust the minimal uncertainty
     # data_points = adjust_min_int_uncertainty(data_points)
@@ -80,12 +91,27 @@ def name_experiment(global_parameters=None):
 def read_a_cest_profile(filename, parameters):
     """Reads in the fuda file and spit out the intensities"""
 
+    data, uncertainty = load_a_cest_profile(filename)
+
+    return make_cest_data_points(filename, parameters, data, uncertainty)
+
+
+def load_a_cest_profile(filename):
+    """Reads in the fuda file and estimates the uncertainty of the intensities
+    from the baseline (the data are sorted by offset)"""
+
     data = sc.loadtxt(filename, dtype=[('b1_offset', '<f8'),
                                        ('intensity', '<f8'),
                                        ('intensity_err', '<f8')])
 
     uncertainty = estimate_uncertainty(data)
 
+    return data, uncertainty
+
+
+def make_cest_data_points(filename, parameters, data, uncertainty):
+    """Makes the data points of the profile read in the fuda file"""
+
     data_points = []
 
     exp_type = parameters['experiment_type'].replace('_cest', '')
@@ -156,49 +182,84 @@ def norm_int(data_int):
     return new_data_int
 
 
+# Finite difference operators (normalized) and percentiles used to estimate
+# the noise of the profiles
+_FDA = [sc.array(a_fda) / la.norm(a_fda) for a_fda in
+        [[1, -1],
+         [1, -2, 1],
+         [1, -3, 3, -1],
+         [1, -4, 6, -4, 1],
+         [1, -5, 10, -10, 5, -1],
+         [1, -6, 15, -20, 15, -6, 1]]]
+
+_PERC = sc.array([0.05] + list(sc.arange(0.1, 0.40, 0.025)))
+_Z = st.norm.ppf(1.0 - _PERC)
+
+
+def _interp(x_new, x, y):
+    """Linear interpolation of the values 'y' (shape (..., len(x))) sampled on
+    the increasing grid 'x' at the points 'x_new', computed as
+    scipy.interpolate.interp1d does, for all the rows of 'y' at once."""
+
+    hi = sc.clip(sc.searchsorted(x, x_new), 1, len(x) - 1)
+    lo = hi - 1
+
+    slope = (y[..., hi] - y[..., lo]) / (x[hi] - x[lo])
+
+    return slope * (x_new - x[lo]) + y[..., lo]
+
+
 def estimate_noise(x):
-    n = len(x)
+    """
+    Estimates the standard deviation of the noise of 'x' from the spread of
+    its finite differences of order 1 to 6.
 
-    fda = [[1, -1],
-           [1, -2, 1],
-           [1, -3, 3, -1],
-           [1, -4, 6, -4, 1],
-           [1, -5, 10, -10, 5, -1],
-           [1, -6, 15, -20, 15, -6, 1]]
-    fda = [sc.array(a_fda) / la.norm(a_fda) for a_fda in fda]
+    Parameters
+    ----------
+    x : ndarray
+        Intensities of a profile, shape (n,), or of several profiles of the
+        same length, shape (..., n).
 
-    perc = sc.array([0.05] + list(sc.arange(0.1, 0.40, 0.025)))
-    z = st.norm.ppf(1.0 - perc)
+    Returns
+    -------
+    out : float or ndarray
+        Standard deviation of the noise of each profile, shape (...).
+
+    """
+
+    x = sc.asarray(x, dtype=float)
+    n = x.shape[-1]
 
     sigma_est = []
 
-    for fdai in fda:
+    for fdai in _FDA:
 
-        noisedata = si.convolve(x, fdai, mode='valid')
-        ntrim = len(noisedata)
+        ntrim = n - len(fdai) + 1
 
         if ntrim >= 2:
 
-            noisedata.sort()
+            # Valid part of the convolution of x with fdai, along the last axis
+            # (summed in the same order as scipy.signal.convolve, so that the
+            # estimates are the same to the last digit)
+            noisedata = sum(
+                coef * x[..., index:ntrim + index]
+                for index, coef in enumerate(fdai[::-1])
+            )
+            noisedata.sort(axis=-1)
 
             p = 0.5 + sc.arange(1, ntrim + 1)
             p /= ntrim + 0.5
 
-            q = []
+            # Only the percentiles within the range of 'p' are used
+            inside = (_PERC >= p[0]) & (1.0 - _PERC <= p[-1])
+            perc, z = _PERC[inside], _Z[inside]
 
-            f = ip.interp1d(p, noisedata, 'linear')
+            q = (_interp(1.0 - perc, p, noisedata) -
+                 _interp(perc, p, noisedata)) / (2.0 * z)
 
-            for a_perc, a_z in zip(perc, z):
-                try:
-                    val = (f(1.0 - a_perc) - f(a_perc)) / (2.0 * a_z)
-                    q.append(val)
-                except ValueError:
-                    pass
+            sigma_est.append(sc.median(q, axis=-1))
 
-            sigma_est.append(sc.median(q))
-
-    noisevar = sc.median(sigma_est) ** 2
+    noisevar = sc.median(sigma_est, axis=0) ** 2
     noisevar /= (1.0 + 15.0 * (n + 1.225) ** -1.245)
 
     return sc.sqrt(noisevar)
-
@@ -0,0 +1,238 @@
+"""
+Closed-form back-calculation of 15N CPMG profiles for a 2-site (A <-> B)
+exchanging system with perfect refocusing pulses.
+
+The transverse magnetization of each state is described by the complex
+amplitude I+ = Ix + i*Iy, so that the evolution during the delays is given by
+a 2x2 complex Liouvillian and the 180 degree pulses by a complex conjugation.
+The matrix exponentials and the powers of the CPMG cycle propagator are then
+written in closed form with the eigenvalues of these 2x2 matrices (this is
+the exact expression of Baldwin, J. Magn. Reson. 244, 114-124 (2014)), which
+is evaluated for all the points and all the residues at once with plain array
+operations.
+"""
+
+from scipy import (asarray, broadcast_arrays, where, exp, log1p, sqrt, conj,
+                   matmul, stack, errstate, maximum)
+
+from ....caching import lru_cache
+from ...propagators import expm1_complex, exprel
+
+
+def _expm_2x2(l11, l12, l21, l22, time):
+    """
+    Computes the exponential of the 2x2 matrices [[l11, l12], [l21, l22]] *
+    time in closed form.
+
+    The exponential is written with the eigenvalues mean +/- delta of the
+    matrices, factoring out the one with the largest real part, so that it
+    neither overflows nor loses precision when the eigenvalues are close.
+
+    """
+
+    mean = 0.5 * (l11 + l22)
+    delta = sqrt((0.5 * (l11 - l22)) ** 2 + l12 * l21)
+
+    exp_max = exp((mean + delta) * time)
+    p_cosh = exp_max * (1.0 + 0.5 * expm1_complex(-2.0 * delta * time))
+    p_sinh = exp_max * time * exprel(-2.0 * delta * time)
+
+    return stack([
+        stack([p_cosh + p_sinh * (l11 - mean), p_sinh * l12], axis=-1),
+        stack([p_sinh * l21, p_cosh + p_sinh * (l22 - mean)], axis=-1),
+    ], axis=-2)
+
+
+def compute_intensities(pb=0.0, kex=0.0, dw=0.0, r_ixy=5.0, dr_ixy=0.0,
+                        time_t2=0.0, ncyc=()):
+    """
+    Computes the intensities of state A after the CPMG block
+    [t_cp - 180 - 2t_cp - 180 - t_cp]*ncyc, assuming an initial intensity of
+    1.0 and the carrier on the resonance of state A.
+
+    All the arguments can be arrays and are broadcast against each other,
+    e.g. parameters of shape (n_residues, 1) and 'ncyc' of shape (n_points,)
+    give the intensities of all the profiles, shape (n_residues, n_points).
+
+    Parameters
+    ----------
+    pb : float or ndarray
+        Fractional population of state B,
+        0.0 for 0%, 1.0 for 100%
+    kex : float or ndarray
+        Exchange rate between state A and B in /s.
+    dw : float or ndarray
+        Chemical shift difference between states A and B in rad/s.
+    r_ixy : float or ndarray
+        Transverse relaxation rate of state a in /s.
+    dr_ixy : float or ndarray
+        Transverse relaxation rate difference between states a and b in /s.
+    time_t2 : float or ndarray
+        Time of the CPMG block in s.
+    ncyc : int or ndarray
+        Number of cycles.
+
+    Returns
+    -------
+    out : ndarray
+        Intensities after the CPMG block
+
+    """
+
+    pb, kex, dw, r_ixy, dr_ixy, time_t2, ncyc = broadcast_arrays(*[
+        asarray(argument, dtype=float)
+        for argument in (pb, kex, dw, r_ixy, dr_ixy, time_t2, ncyc)
+    ])
+
+    pa = 1.0 - pb
+    kab = kex * pb
+    kba = kex - kab
+
+    # Liouvillian of I+{A,B}, the relaxation rate common to both states being
+    # accounted for at the end
+    l11, l12, l21, l22 = -kab, kba, kab, -kba - dr_ixy + 1j * dw
+
+    # The reference planes (ncyc = 0) are not affected by the CPMG block
+    n = where(ncyc > 0, ncyc, 1.0)
+    t_cp = time_t2 / (4.0 * n)
+
+    # Propagator of one cycle: the two 180 degree pulses conjugate the
+    # evolution during 2t_cp
+    p_cp = _expm_2x2(l11, l12, l21, l22, t_cp)
+    p_2cp = _expm_2x2(l11, l12, l21, l22, 2.0 * t_cp)
+    p_cycle = matmul(p_cp, matmul(conj(p_2cp), p_cp))
+
+    m11, m12 = p_cycle[..., 0, 0], p_cycle[..., 0, 1]
+    m21, m22 = p_cycle[..., 1, 0], p_cycle[..., 1, 1]
+
+    # Eigenvalues of the cycle propagator, |eig_max| >= |eig_min|
+    half_trace = 0.5 * (m11 + m22)
+    determinant = m11 * m22 - m12 * m21
+    delta = sqrt(half_trace ** 2 - determinant)
+    delta = where((conj(half_trace) * delta).real < 0.0, -delta, delta)
+    eig_max = half_trace + delta
+    eig_min = determinant / eig_max
+
+    # Cayley-Hamilton: p_cycle^n = eig_max^(n-1) * (f_n * p_cycle - eig_min *
+    # f_(n-1)), with f_n = (1 - q^n) / (1 - q) and q = eig_min / eig_max
+    # (q underflows to 0 for fast exchange: log(q) is then bounded, q^n
+    # being 0 anyway)
+    with errstate(divide='ignore'):
+        log_q = log1p(-2.0 * delta / eig_max)
+    log_q = maximum(log_q.real, -700.0) + 1j * log_q.imag
+    f_n = n * exprel(n * log_q) / exprel(log_q)
+    f_n1 = (n - 1.0) * exprel((n - 1.0) * log_q) / exprel(log_q)
+    scaling = eig_max ** (n - 1.0)
+
+    mag_a = scaling * ((f_n * m11 - eig_min * f_n1) * pa + f_n * m12 * pb)
+
+    intensities = exp(-r_ixy * time_t2) * mag_a.real
+
+    return where(ncyc > 0, intensities, pa)
+
+
+@lru_cache()
+def make_calc_observables(time_t2=0.0, ppm_to_rads=1.0, _id=None):
+    """
+    Factory to make "calc_observables" function to calculate the intensities in
+    presence of exchange after a CPMG block.
+
+    Parameters
+    ----------
+    time_t2 : float
+        Time of the CPMG block
+    ppm_to_rads : float
+        Conversion factor from ppm to rad/s
+    id : tuple
+        Some type of identification for caching optimization
+
+    Returns
+    -------
+    out : tuple of function
+        Calculate intensity after the CPMG block,
+        and the derivatives of the intensities known in closed form
+
+    """
+
+    @lru_cache(5)
+    def _calc_observables(pb=0.0, kex=0.0, dw=0.0, r_ixy=5.0, dr_ixy=0.0,
+                          ncyc=()):
+        """
+        Calculate the intensity in presence of exchange during a cpmg-type pulse
+        train.
+
+        Parameters
+        ----------
+        pb : float
+            Fractional population of state B,
+            0.0 for 0%, 1.0 for 100%
+        kex : float
+            Exchange rate between state A and B in /s.
+        dw : float
+            Chemical shift difference between states A and B in ppm.
+        r_ixy : float
+            Transverse relaxation rate of state a in /s.
+        dr_ixy : float
+            Transverse relaxation rate difference between states a and b in /s.
+        ncyc : tuple of int
+            Number of cycles of each point of the profile.
+
+        Returns
+        -------
+        out : ndarray
+            Intensities after the CPMG block
+
+        """
+
+        return compute_intensities(pb=pb, kex=kex, dw=dw * ppm_to_rads,
+                                   r_ixy=r_ixy, dr_ixy=dr_ixy,
+                                   time_t2=time_t2, ncyc=ncyc)
+
+    def calc_observables(i0=0.0, **kwargs):
+        """
+        Calculate the intensities of all the points of a profile in presence
+        of exchange after a CPMG block.
+
+        Parameters
+        ----------
+        i0 : float
+            Initial intensity.
+        ncyc : tuple of int
+            Number of cycles of each point of the profile.
+
+        Returns
+        -------
+        out : ndarray
+            Intensities after the CPMG block
+
+        """
+
+        return i0 * _calc_observables(**kwargs)
+
+    def calc_derivatives(i0=0.0, **kwargs):
+        """
+        Calculate the derivatives of the intensities with respect to the
+        parameters for which a closed form is known.
+
+        The relaxation rate common to both states only scales the
+        intensities after the CPMG block by exp(-r_ixy * time_t2), so that
+        their derivative with respect to r_ixy is -time_t2 times the
+        intensities (the reference planes do not depend on it). The other
+        exchange parameters are left to finite differences.
+
+        Returns
+        -------
+        out : dict
+            Derivatives of the intensities, keyed by parameter name
+
+        """
+
+        intensities = _calc_observables(**kwargs)
+        not_reference = asarray(kwargs.get('ncyc', ())) > 0
+
+        return {
+            'i0': intensities,
+            'r_ixy': -time_t2 * i0 * intensities * not_reference,
+        }
+
+    return calc_observables, calc_derivatives
@@ -0,0 +1,20 @@
+parse_line = "15N - Standard CPMG (closed-form 2-state solution)"
+
+description = """\
+Analyzes 15N chemical exchange in the presence of a CPMG block. Refocusing
+pulses are assumed to be perfect, as in 'fast_cpmg', but the intensities are
+calculated with the exact closed-form solution of the 2-state problem instead
+of the propagation of the 4x4, single spin matrix:
+
+[ Nx(a), Ny(a), Nx(b), Ny(b) ]
+
+This makes it well suited to quick initial fits and grid searches, the
+resulting parameters being then used as starting values for the fits with
+the more complete models (e.g. 'n_cw_cpmg' or 'n_trosy_cpmg')."""
+
+reference = {
+    'journal': 'J. Magn. Reson.',
+    'year': 2014,
+    'volume': 244,
+    'pages': '114-124'
+}
@@ -5,12 +5,14 @@ Created on Aug 15, 2011
 """
 
 # Python Modules
-from scipy import pi, dot
-from scipy.linalg import expm2 as expm
+from scipy import pi, dot, asarray
 from numpy.linalg import matrix_power
 
 # Local Modules
 from chemex.caching import lru_cache
+from chemex.experiments.propagators import (compute_propagators,
+                                            compute_batch_propagators,
+                                            compute_echo_trains)
 from .liouvillian import \
     compute_2hzcz_eq, \
     compute_liouvillians, \
@@ -20,9 +22,9 @@ from chemex.bases.two_states.iph_aph import P180_S
 
 
 @lru_cache()
-def make_calc_observable(pw=0.0, time_t2=0.0, ppm_to_rads=1.0, carrier=0.0, taub=2.68e-3, _id=None):
+def make_calc_observables(pw=0.0, time_t2=0.0, ppm_to_rads=1.0, carrier=0.0, taub=2.68e-3, _id=None):
     """
-    Factory to make "calc_observable" function to calculate the intensity in presence
+    Factory to make "calc_observables" function to calculate the intensities in presence
     of exchange after the CPMG-type pulse train.
 
     Parameters
@@ -42,8 +44,9 @@ def make_calc_observable(pw=0.0, time_t2=0.0, ppm_to_rads=1.0, carrier=0.0, taub
 
     Returns
     -------
-    out : function
-        Function for calculating intensity after the CPMG train pulse
+    out : tuple of function
+        Function for calculating intensity after the CPMG train pulse,
+        and the derivatives of the intensities known in closed form
 
     """
 
@@ -69,11 +72,10 @@ def make_calc_observable(pw=0.0, time_t2=0.0, ppm_to_rads=1.0, carrier=0.0, taub
             w1=w1
         )
 
-        p_neg = expm(l_free * -2.0 * pw / pi)
-        p_taub = expm(l_free * taub)
-        p_90px = expm((l_free + l_w1x) * pw)
-        p_90py = expm((l_free + l_w1y) * pw)
-        p_90mx = expm((l_free - l_w1x) * pw)
+        p_neg, p_taub = compute_propagators(
+            l_free, [-2.0 * pw / pi, taub])
+        p_90px, p_90py, p_90mx = compute_batch_propagators(
+            [l_free + l_w1x, l_free + l_w1y, l_free - l_w1x], pw)
         p_180px = matrix_power(p_90px, 2)
         p_180py = matrix_power(p_90py, 2)
 
@@ -83,9 +85,9 @@ def make_calc_observable(pw=0.0, time_t2=0.0, ppm_to_rads=1.0, carrier=0.0, taub
 
         return l_free, ps
 
-    @lru_cache(100)
-    def _calc_observable(pb=0.0, kex=0.0, dw=0.0, r_cxy=5.0, dr_cxy=0.0, r_cz=1.5,
-                         r_2hzcz=0.0, etaxy=0.0, etaz=0.0, j_hc=0.0, cs=0.0, ncyc=0):
+    @lru_cache(5)
+    def _calc_observables(pb=0.0, kex=0.0, dw=0.0, r_cxy=5.0, dr_cxy=0.0, r_cz=1.5,
+                          r_2hzcz=0.0, etaxy=0.0, etaz=0.0, j_hc=0.0, cs=0.0, ncyc=()):
         """
         Calculate the intensity in presence of exchange during a cpmg-type pulse train.
                 _______________________________________________________________________
@@ -142,42 +144,71 @@ def make_calc_observable(pw=0.0, time_t2=0.0, ppm_to_rads=1.0, carrier=0.0, taub
 
         mag_eq = compute_2hzcz_eq(pb)
 
-        if ncyc == 0:
+        ncyc_cp = sorted(set(ncyc) - set([0]))
+        t_cps = [time_t2 / (4.0 * a_ncyc) - pw for a_ncyc in ncyc_cp]
+        p_frees = compute_propagators(l_free, t_cps)
+        p_cpxs = dict(zip(ncyc_cp, compute_echo_trains(p_frees, p_180px, ncyc_cp)))
+        p_cpys = dict(zip(ncyc_cp, compute_echo_trains(p_frees, p_180py, ncyc_cp)))
 
-            # The +/- phase cycling of the first 90 and the receiver is taken care
-            # by setting the thermal equilibrium to 0
-            mag = -reduce(dot, [p_90py, p_element, p_90px, mag_eq])
+        observables = {}
 
-        else:
+        # The points sharing the same number of cycles (e.g. the reference
+        # planes, ncyc = 0) are only calculated once
+        for a_ncyc in set(ncyc):
 
-            t_cp = time_t2 / (4.0 * ncyc) - pw
-            p_free = expm(l_free * t_cp)
-            p_cpx = matrix_power(p_free.dot(p_180px).dot(p_free), ncyc)
-            p_cpy = matrix_power(p_free.dot(p_180py).dot(p_free), ncyc)
+            if a_ncyc == 0:
 
-            mag = -reduce(dot, [p_90py, p_neg, p_cpx, p_element, p_cpy, p_neg, p_90px, mag_eq])
+                # The +/- phase cycling of the first 90 and the receiver is taken care
+                # by setting the thermal equilibrium to 0
+                mag = -reduce(dot, [p_90py, p_element, p_90px, mag_eq])
 
-        magz_a, _magz_b = get_cz(mag)
+            else:
 
-        return magz_a
+                p_cpx = p_cpxs[a_ncyc]
+                p_cpy = p_cpys[a_ncyc]
 
-    def calc_observable(i0=0.0, **kwargs):
+                mag = -reduce(dot, [p_90py, p_neg, p_cpx, p_element, p_cpy, p_neg, p_90px, mag_eq])
+
+            magz_a, _magz_b = get_cz(mag)
+
+            observables[a_ncyc] = magz_a
+
+        return asarray([observables[a_ncyc] for a_ncyc in ncyc])
+
+    def calc_observables(i0=0.0, **kwargs):
         """
-        Calculate the intensity in presence of exchange after the CPMG pulse train.
+        Calculate the intensities of all the points of a profile in presence
+        of exchange after a CPMG block.
 
         Parameters
         ----------
         i0 : float
             Initial intensity.
+        ncyc : tuple of int
+            Number of cycles of each point of the profile.
 
         Returns
         -------
-        out : float
-            Intensity after the CPMG block
+        out : ndarray
+            Intensities after the CPMG block
+
+        """
+
+        return i0 * _calc_observables(**kwargs)
+
+    def calc_derivatives(i0=0.0, **kwargs):
+        """
+        Calculate the derivatives of the intensities with respect to the
+        parameters for which a closed form is known.
+
+        Returns
+        -------
+        out : dict
+            Derivatives of the intensities, keyed by parameter name
 
         """
 
-        return i0 * _calc_observable(**kwargs)
+        return {'i0': _calc_observables(**kwargs)}
 
-    return calc_observable
+    return calc_observables, calc_derivatives
 
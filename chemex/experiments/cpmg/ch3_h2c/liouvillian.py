@@ -8,7 +8,15 @@ from scipy import zeros, asarray, pi
 
 from chemex.bases.two_states.iph_aph import \
     R_IXY, R_2SZIXY, DR_XY, R_IZ, R_2SZIZ, CS, DW, \
-    J, ETAXY, ETAZ, KAB, KBA, W1X, W1Y
+    J, ETAXY, ETAZ, compute_exchange_matrix, W1X, W1Y
+from chemex.bases.assembly import make_compute_liouvillian
+
+
+# Terms of the Liouvillian that are linear in the parameters (the exchange
+# block is shared by the residues, see 'compute_exchange_matrix')
+_compute_linear_terms = make_compute_liouvillian(
+    R_IXY, R_2SZIXY, DR_XY, R_IZ, R_2SZIZ, CS, DW, J, ETAXY, ETAZ
+)
 
 
 def compute_liouvillians(pb=0.0, kex=0.0, dw=0.0, r_cxy=5.0, dr_cxy=0.0,
@@ -58,23 +66,13 @@ def compute_liouvillians(pb=0.0, kex=0.0, dw=0.0, r_cxy=5.0, dr_cxy=0.0,
 
     """
 
-    kab = kex * pb
-    kba = kex - kab
-
     r_2hzcxy = r_cxy + r_2hzcz - r_cz
 
-    l_free = R_IXY * r_cxy
-    l_free += R_2SZIXY * r_2hzcxy
-    l_free += DR_XY * dr_cxy
-    l_free += R_IZ * r_cz
-    l_free += R_2SZIZ * r_2hzcz
-    l_free += CS * cs_offset
-    l_free += DW * dw
-    l_free += J * pi * j_hc
-    l_free += ETAXY * etaxy
-    l_free += ETAZ * etaz
-    l_free += KAB * kab
-    l_free += KBA * kba
+    l_free = _compute_linear_terms(
+        r_cxy, r_2hzcxy, dr_cxy, r_cz, r_2hzcz, cs_offset, dw, pi * j_hc,
+        etaxy, etaz
+    )
+    l_free = l_free + compute_exchange_matrix(pb, kex)
 
     l_w1x, l_w1y = w1 * asarray([W1X, W1Y])
 
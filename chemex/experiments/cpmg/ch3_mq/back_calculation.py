@@ -5,11 +5,11 @@ Created on Feb 23, 2012
 @author: Guillaume Bouvignies
 """
 
-from scipy import dot, diag
+from scipy import dot, diag, asarray
 from scipy.linalg import expm
-from numpy.linalg import matrix_power
 
 from chemex.caching import lru_cache
+from chemex.experiments.propagators import compute_propagators, compute_echo_trains
 from chemex.constants import xi_ratio
 from .liouvillian import \
     compute_2hxcy_eq, \
@@ -29,9 +29,9 @@ P180_CY = diag([-1.0, +1.0, -1.0, +1.0, -1.0, +1.0, -1.0, +1.0], 0)
 
 
 @lru_cache()
-def make_calc_observable(time_t2=0.0, ppm_to_rads_h=1.0, ppm_to_rads_c=1.0, smallflg='Y', _id=None):
+def make_calc_observables(time_t2=0.0, ppm_to_rads_h=1.0, ppm_to_rads_c=1.0, smallflg='Y', _id=None):
     """
-    Factory to make "calc_observable" function to calculate the intensity in presence
+    Factory to make "calc_observables" function to calculate the intensities in presence
     of exchange after a CEST block.
 
     Parameters
@@ -47,8 +47,9 @@ def make_calc_observable(time_t2=0.0, ppm_to_rads_h=1.0, ppm_to_rads_c=1.0, smal
 
     Returns
     -------
-    out : function
-        Calculate intensity after the CEST block
+    out : tuple of function
+        Calculate intensity after the CEST block,
+        and the derivatives of the intensities known in closed form
 
     """
 
@@ -56,8 +57,8 @@ def make_calc_observable(time_t2=0.0, ppm_to_rads_h=1.0, ppm_to_rads_c=1.0, smal
 
         make_propagators = lru_cache(1)(compute_liouvillian)
 
-        @lru_cache(100)
-        def _calc_observable(pb=0.0, kex=0.0, dwh=0.0, dwc=0.0, r_2hxycxy=5.0, dr_2hxycxy=0.0, ncyc=0):
+        @lru_cache(5)
+        def _calc_observables(pb=0.0, kex=0.0, dwh=0.0, dwc=0.0, r_2hxycxy=5.0, dr_2hxycxy=0.0, ncyc=()):
             """
             Calculate the intensity in presence of exchange during a cpmg-type pulse
             train. Based on the sequence "hmqc_CH3_exchange_bigprotein_600_lek_v2.c".
@@ -103,20 +104,31 @@ def make_calc_observable(time_t2=0.0, ppm_to_rads_h=1.0, ppm_to_rads_c=1.0, smal
 
             mag_eq = compute_2hxcy_eq(pb)
 
-            if ncyc == 0:
-                mag = mag_eq
+            ncyc_cp = sorted(set(ncyc) - set([0]))
+            t_cps = [time_t2 / (4.0 * a_ncyc) for a_ncyc in ncyc_cp]
+            p_frees = compute_propagators(l_free, t_cps)
+            p_cpys = dict(zip(ncyc_cp, compute_echo_trains(p_frees, P180_CY, ncyc_cp)))
 
-            else:
+            observables = {}
 
-                t_cp = time_t2 / (4.0 * ncyc)
-                p_free = expm(l_free * t_cp)
-                p_cpy = matrix_power(p_free.dot(P180_CY).dot(p_free), ncyc)
+            # The points sharing the same number of cycles (e.g. the reference
+            # planes, ncyc = 0) are only calculated once
+            for a_ncyc in set(ncyc):
 
-                mag = reduce(dot, [p_cpy, P180_HX, p_cpy, mag_eq])
+                if a_ncyc == 0:
+                    mag = mag_eq
 
-            magz_a, _ = get_2hxcy(mag)
+                else:
 
-            return magz_a
+                    p_cpy = p_cpys[a_ncyc]
+
+                    mag = reduce(dot, [p_cpy, P180_HX, p_cpy, mag_eq])
+
+                magz_a, _ = get_2hxcy(mag)
+
+                observables[a_ncyc] = magz_a
+
+            return asarray([observables[a_ncyc] for a_ncyc in ncyc])
 
     else:
 
@@ -131,8 +143,8 @@ def make_calc_observable(time_t2=0.0, ppm_to_rads_h=1.0, ppm_to_rads_c=1.0, smal
 
             return l_free, p_zeta
 
-        @lru_cache(100)
-        def _calc_observable(pb=0.0, kex=0.0, dwh=0.0, dwc=0.0, r_2hxycxy=5.0, dr_2hxycxy=0.0, ncyc=0):
+        @lru_cache(5)
+        def _calc_observables(pb=0.0, kex=0.0, dwh=0.0, dwc=0.0, r_2hxycxy=5.0, dr_2hxycxy=0.0, ncyc=()):
             """
             Calculate the intensity in presence of exchange during a cpmg-type pulse
             train. Based on the sequence "hmqc_CH3_exchange_bigprotein_600_lek_v2.c".
@@ -178,39 +190,67 @@ def make_calc_observable(time_t2=0.0, ppm_to_rads_h=1.0, ppm_to_rads_c=1.0, smal
 
             mag_eq = compute_2hxcy_eq(pb)
 
-            if ncyc == 0:
+            ncyc_cp = sorted(set(ncyc) - set([0]))
+            t_cps = [time_t2 / (4.0 * a_ncyc) for a_ncyc in ncyc_cp]
+            p_frees = compute_propagators(l_free, t_cps)
+            p_cpys = dict(zip(ncyc_cp, compute_echo_trains(p_frees, P180_CY, ncyc_cp)))
+
+            observables = {}
+
+            # The points sharing the same number of cycles (e.g. the reference
+            # planes, ncyc = 0) are only calculated once
+            for a_ncyc in set(ncyc):
+
+                if a_ncyc == 0:
+
+                    mag = reduce(dot, [p_zeta, P180_HX, P180_CX, p_zeta, mag_eq])
 
-                mag = reduce(dot, [p_zeta, P180_HX, P180_CX, p_zeta, mag_eq])
+                else:
 
-            else:
+                    p_cpy = p_cpys[a_ncyc]
 
-                t_cp = time_t2 / (4.0 * ncyc)
-                p_free = expm(l_free * t_cp)
-                p_cpy = matrix_power(p_free.dot(P180_CY).dot(p_free), ncyc)
+                    mag = reduce(dot, [p_cpy, P180_HX, p_cpy, p_zeta, P180_HX, P180_CX, p_zeta, mag_eq])
 
-                mag = reduce(dot, [p_cpy, P180_HX, p_cpy, p_zeta, P180_HX, P180_CX, p_zeta, mag_eq])
+                magz_a, _ = get_2hxcy(mag)
 
-            magz_a, _ = get_2hxcy(mag)
+                observables[a_ncyc] = -magz_a
 
-            return -magz_a
+            return asarray([observables[a_ncyc] for a_ncyc in ncyc])
 
 
-    def calc_observable(i0=0.0, **kwargs):
+    def calc_observables(i0=0.0, **kwargs):
         """
-        Calculate the intensity in presence of exchange after a CEST block.
+        Calculate the intensities of all the points of a profile in presence
+        of exchange after a CPMG block.
 
         Parameters
         ----------
         i0 : float
             Initial intensity.
+        ncyc : tuple of int
+            Number of cycles of each point of the profile.
+
+        Returns
+        -------
+        out : ndarray
+            Intensities after the CPMG block
+
+        """
+
+        return i0 * _calc_observables(**kwargs)
+
+    def calc_derivatives(i0=0.0, **kwargs):
+        """
+        Calculate the derivatives of the intensities with respect to the
+        parameters for which a closed form is known.
 
         Returns
         -------
-        out : float
-            Intensity after the CEST block
+        out : dict
+            Derivatives of the intensities, keyed by parameter name
 
         """
 
-        return i0 * _calc_observable(**kwargs)
+        return {'i0': _calc_observables(**kwargs)}
 
-    return calc_observable
+    return calc_observables, calc_derivatives
@@ -12,8 +12,7 @@ from scipy import pi
 from chemex.parsing import parse_assignment
 from chemex.experiments.base_data_point import BaseDataPoint
 from chemex.constants import xi_ratio
-from .back_calculation import make_calc_observable
-from ..plotting import plot_data
+from .back_calculation import make_calc_observables
 
 
 
@@ -41,7 +40,7 @@ class DataPoint(BaseDataPoint):
 
     def __init__(self, val, err, par):
         BaseDataPoint.__init__(self, val, err, par, PAR_DICT['par_conv'],
-                               plot_data)
+                               'cpmg')
 
         self.par['ppm_to_rads_h'] = TWO_PI * self.par['h_larmor_frq']
         self.par['ppm_to_rads_c'] = TWO_PI * self.par['h_larmor_frq'] * RATIO
@@ -61,12 +60,12 @@ class DataPoint(BaseDataPoint):
 
         args = (
             self.par[arg]
-            for arg in getargspec(make_calc_observable.__wrapped__).args
+            for arg in getargspec(make_calc_observables.__wrapped__).args
         )
 
-        self.calc_observable = make_calc_observable(*args)
+        self.calc_observables, self.calc_derivatives = make_calc_observables(*args)
 
-        self.kwargs_default = {'ncyc': self.par['ncyc']}
+        self.kwargs_profile = {'ncyc': self.par['ncyc']}
 
         self.short_long_par_names = (
             ('pb', ('pb', temperature)),
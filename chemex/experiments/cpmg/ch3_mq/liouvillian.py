@@ -7,7 +7,15 @@ Created on Feb 22, 2012
 
 from scipy import mat, zeros
 
-from chemex.bases.two_states.mq import R_2HXYCXY, DR_2HXYCXY, DWI, DWS, KAB, KBA
+from chemex.bases.two_states.mq import R_2HXYCXY, DR_2HXYCXY, DWI, DWS, compute_exchange_matrix
+from chemex.bases.assembly import make_compute_liouvillian
+
+
+# Terms of the Liouvillian that are linear in the parameters (the exchange
+# block is shared by the residues, see 'compute_exchange_matrix')
+_compute_linear_terms = make_compute_liouvillian(
+    R_2HXYCXY, DR_2HXYCXY, DWI, DWS
+)
 
 
 def compute_liouvillian(pb=0.0, kex=0.0, dwc=0.0, dwh=0.0, r_2hxycxy=10.0, dr_2hxycxy=0.0):
@@ -42,15 +50,8 @@ def compute_liouvillian(pb=0.0, kex=0.0, dwc=0.0, dwh=0.0, r_2hxycxy=10.0, dr_2h
 
     """
 
-    kab = kex * pb
-    kba = kex * (1.0 - pb)
-
-    l_free = R_2HXYCXY * r_2hxycxy
-    l_free += DR_2HXYCXY * dr_2hxycxy
-    l_free += DWI * dwh
-    l_free += DWS * dwc
-    l_free += KAB * kab
-    l_free += KBA * kba
+    l_free = _compute_linear_terms(r_2hxycxy, dr_2hxycxy, dwh, dwc)
+    l_free = l_free + compute_exchange_matrix(pb, kex)
 
     return l_free
 
@@ -4,11 +4,13 @@ Created on Nov 12, 2014
 @author: Mike Latham
 """
 
-from scipy import pi, dot, diag
-from scipy.linalg import expm2 as expm
+from scipy import pi, dot, diag, asarray
 from numpy.linalg import matrix_power
 
 from chemex.caching import lru_cache
+from chemex.experiments.propagators import (compute_propagators,
+                                            compute_batch_propagators,
+                                            compute_echo_trains)
 from .liouvillian import compute_2coznz_eq, compute_liouvillians, get_2coznz
 
 
@@ -16,9 +18,9 @@ P180X = diag(4 * [+1.0, -1.0, +1.0])
 
 
 @lru_cache()
-def make_calc_observable(pwco90=0.0, time_t2=0.0, time_equil=0.0, taucc=0.0, ppm_to_rads=1.0, sidechain_flg='N', carrier=0.0, _id=None):
+def make_calc_observables(pwco90=0.0, time_t2=0.0, time_equil=0.0, taucc=0.0, ppm_to_rads=1.0, sidechain_flg='N', carrier=0.0, _id=None):
     """
-    Factory to make "calc_observable" function to calculate the intensity in presence
+    Factory to make "calc_observables" function to calculate the intensities in presence
     of exchange after a CPMG block.
 
     Parameters
@@ -34,8 +36,9 @@ def make_calc_observable(pwco90=0.0, time_t2=0.0, time_equil=0.0, taucc=0.0, ppm
 
     Returns
     -------
-    out : function
-        Calculate intensity after the CPMG block
+    out : tuple of function
+        Calculate intensity after the CPMG block,
+        and the derivatives of the intensities known in closed form
 
     """
 
@@ -52,11 +55,10 @@ def make_calc_observable(pwco90=0.0, time_t2=0.0, time_equil=0.0, taucc=0.0, ppm
                                                     j_nco=j_nco, dj_nco=dj_nco,
                                                     cs_offset=cs_offset, w1=w1)
 
-        p_equil = expm(l_free * time_equil)
-        p_taucc = expm(l_free * taucc)
-        p_neg = expm(l_free * -2.0 * pwco90 / pi)
-        p_90py = expm((l_free + l_w1y) * pwco90)
-        p_90my = expm((l_free - l_w1y) * pwco90)
+        p_equil, p_taucc, p_neg = compute_propagators(
+            l_free, [time_equil, taucc, -2.0 * pwco90 / pi])
+        p_90py, p_90my = compute_batch_propagators(
+            [l_free + l_w1y, l_free - l_w1y], pwco90)
         p_180px = P180X  # Perfect 180 for CPMG blocks
         p_180py = matrix_power(p_90py, 2)
         p_180my = matrix_power(p_90py, 2)
@@ -66,10 +68,10 @@ def make_calc_observable(pwco90=0.0, time_t2=0.0, time_equil=0.0, taucc=0.0, ppm
 
         return l_free, ps
 
-    @lru_cache(100)
-    def _calc_observable(pb=0.0, kex=0.0, dw=0.0, r_coxy=5.0, dr_coxy=0.0, r_nz=1.5,
-                         r_2coznz=0.0, etaxy=0.0, etaz=0.0, j_nco=0.0, dj_nco=0.0,
-                         cs=0.0, ncyc=0):
+    @lru_cache(5)
+    def _calc_observables(pb=0.0, kex=0.0, dw=0.0, r_coxy=5.0, dr_coxy=0.0, r_nz=1.5,
+                          r_2coznz=0.0, etaxy=0.0, etaz=0.0, j_nco=0.0, dj_nco=0.0,
+                          cs=0.0, ncyc=()):
         """
         Calculate the intensity in presence of exchange during a cpmg-type pulse train.
                
@@ -120,45 +122,73 @@ def make_calc_observable(pwco90=0.0, time_t2=0.0, time_equil=0.0, taucc=0.0, ppm
             p_flip = reduce(dot, [p_90my, p_taucc, 0.5*(p_180py + p_180my),
                                   p_taucc, p_90py])
 
-        if ncyc == 0:
+        ncyc_cp = sorted(set(ncyc) - set([0]))
+        t_cps = [time_t2 / (4.0 * a_ncyc) for a_ncyc in ncyc_cp]
+        p_frees = compute_propagators(l_free, t_cps)
+        p_cpxs = dict(zip(ncyc_cp, compute_echo_trains(p_frees, p_180px, ncyc_cp)))
 
-            # The +/- phase cycling of the first 90 and the receiver is taken care
-            # by setting the thermal equilibrium to 0
-            #I = reduce(dot, [p_equil, p_90py, 0.5 * (p_180py + p_180my), p_90py, p_equil, mag_eq])
-            mag = reduce(dot,
-                         [p_equil, p_90py, p_flip, p_90py, p_equil, mag_eq])
+        observables = {}
 
-        else:
+        # The points sharing the same number of cycles (e.g. the reference
+        # planes, ncyc = 0) are only calculated once
+        for a_ncyc in set(ncyc):
+
+            if a_ncyc == 0:
+
+                # The +/- phase cycling of the first 90 and the receiver is taken care
+                # by setting the thermal equilibrium to 0
+                #I = reduce(dot, [p_equil, p_90py, 0.5 * (p_180py + p_180my), p_90py, p_equil, mag_eq])
+                mag = reduce(dot,
+                             [p_equil, p_90py, p_flip, p_90py, p_equil, mag_eq])
+
+            else:
 
-            t_cp = time_t2 / (4.0 * ncyc)
-            p_free = expm(l_free * t_cp)
-            p_cpx = matrix_power(p_free.dot(p_180px).dot(p_free), ncyc)
+                p_cpx = p_cpxs[a_ncyc]
 
-            mag = reduce(dot, [p_equil, p_90py, p_neg, p_cpx, p_neg,
-                             p_flip, p_neg, p_cpx, p_neg, p_90py,
-                             p_equil, mag_eq])
+                mag = reduce(dot, [p_equil, p_90py, p_neg, p_cpx, p_neg,
+                                 p_flip, p_neg, p_cpx, p_neg, p_90py,
+                                 p_equil, mag_eq])
 
-        magz_a, _magz_b = get_2coznz(mag)
+            magz_a, _magz_b = get_2coznz(mag)
 
-        return magz_a
+            observables[a_ncyc] = magz_a
 
-    def calc_observable(i0=0.0, **kwargs):
+        return asarray([observables[a_ncyc] for a_ncyc in ncyc])
+
+    def calc_observables(i0=0.0, **kwargs):
         """
-        Calculate the intensity in presence of exchange after a CPMG block.
+        Calculate the intensities of all the points of a profile in presence
+        of exchange after a CPMG block.
 
         Parameters
         ----------
         i0 : float
             Initial intensity.
+        ncyc : tuple of int
+            Number of cycles of each point of the profile.
 
         Returns
         -------
-        out : float
-            Intensity after the CPMG block
+        out : ndarray
+            Intensities after the CPMG block
+
+        """
+
+        return i0 * _calc_observables(**kwargs)
+
+    def calc_derivatives(i0=0.0, **kwargs):
+        """
+        Calculate the derivatives of the intensities with respect to the
+        parameters for which a closed form is known.
+
+        Returns
+        -------
+        out : dict
+            Derivatives of the intensities, keyed by parameter name
 
         """
 
-        return i0 * _calc_observable(**kwargs)
+        return {'i0': _calc_observables(**kwargs)}
 
-    return calc_observable
+    return calc_observables, calc_derivatives
 
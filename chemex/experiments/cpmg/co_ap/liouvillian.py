@@ -6,8 +6,16 @@ Created on Nov 12, 2014
 
 from scipy import zeros, asarray, pi
 
-from chemex.bases.two_states.iph_aph import (R_IXY, R_2SZIXY, DR_XY, R_IZ, R_2SZIZ, CS, DW, J, DJ, ETAXY, ETAZ, KAB,
-                                             KBA, W1X, W1Y)
+from chemex.bases.two_states.iph_aph import (R_IXY, R_2SZIXY, DR_XY, R_IZ, R_2SZIZ, CS, DW, J, DJ, ETAXY, ETAZ, compute_exchange_matrix,
+                                             W1X, W1Y)
+from chemex.bases.assembly import make_compute_liouvillian
+
+
+# Terms of the Liouvillian that are linear in the parameters (the exchange
+# block is shared by the residues, see 'compute_exchange_matrix')
+_compute_linear_terms = make_compute_liouvillian(
+    R_IXY, R_2SZIXY, DR_XY, R_IZ, R_2SZIZ, CS, DW, J, DJ, ETAXY, ETAZ
+)
 
 
 def compute_liouvillians(pb=0.0, kex=0.0, dw=0.0, r_coxy=5.0, dr_coxy=0.0, r_nz=1.5, r_2coznz=5.0, etaxy=0.0, etaz=0.0,
@@ -58,27 +66,14 @@ def compute_liouvillians(pb=0.0, kex=0.0, dw=0.0, r_coxy=5.0, dr_coxy=0.0, r_nz=
 
     """
 
-    kab = kex * pb
-    kba = kex - kab
-
     r_2coxynz = r_coxy - r_nz
     r_coz = r_2coznz - r_nz
 
-    l_free = (
-        R_IXY * r_coxy +
-        R_2SZIXY * r_2coxynz +
-        DR_XY * dr_coxy +
-        R_IZ * r_coz +
-        R_2SZIZ * r_2coznz +
-        CS * cs_offset +
-        DW * dw +
-        J * pi * j_nco +
-        DJ * pi * dj_nco +
-        ETAXY * etaxy +
-        ETAZ * etaz +
-        KAB * kab +
-        KBA * kba
+    l_free = _compute_linear_terms(
+        r_coxy, r_2coxynz, dr_coxy, r_coz, r_2coznz, cs_offset, dw, pi * j_nco,
+        pi * dj_nco, etaxy, etaz
     )
+    l_free = l_free + compute_exchange_matrix(pb, kex)
 
     l_w1x, l_w1y = w1 * asarray([W1X, W1Y])
 
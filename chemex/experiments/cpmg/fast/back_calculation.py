@@ -1,15 +1,23 @@
-from numpy.linalg import matrix_power
-from scipy.linalg import expm
+from scipy import asarray, zeros, matmul, newaxis, broadcast_to
 
+from ....bases.assembly import stack_parameters
 from ....bases.two_states.fast import P_180Y
 from ....caching import lru_cache
-from .liouvillian import compute_iy_eq, compute_liouvillians, get_iy
+from ...propagators import (compute_propagators, compute_echo_trains,
+                            compute_propagator_derivatives,
+                            compute_echo_train_derivatives)
+from .liouvillian import (compute_iy_eq, compute_liouvillians,
+                          compute_liouvillian_derivatives, get_iy)
+
+
+# Parameters of the derivatives computed by 'calc_derivatives'
+DERIVATIVE_NAMES = ('pb', 'kex', 'dw', 'r_ixy', 'dr_ixy')
 
 
 @lru_cache()
-def make_calc_observable(time_t2=0.0, ppm_to_rads=1.0, _id=None):
+def make_calc_observables(time_t2=0.0, ppm_to_rads=1.0, _id=None):
     """
-    Factory to make "calc_observable" function to calculate the intensity in
+    Factory to make "calc_observables" function to calculate the intensities in
     presence of exchange after a CPMG block.
 
     Parameters
@@ -23,14 +31,15 @@ def make_calc_observable(time_t2=0.0, ppm_to_rads=1.0, _id=None):
 
     Returns
     -------
-    out : function
-        Calculate intensity after the CEST block
+    out : tuple of function
+        Calculate intensity after the CEST block,
+        and the derivatives of the intensities known in closed form
 
     """
 
-    @lru_cache(100)
-    def _calc_observable(pb=0.0, kex=0.0, dw=0.0, r_ixy=5.0, dr_ixy=0.0,
-                         ncyc=0):
+    @lru_cache(5)
+    def _calc_observables(pb=0.0, kex=0.0, dw=0.0, r_ixy=5.0, dr_ixy=0.0,
+                          ncyc=()):
         """
         Calculate the intensity in presence of exchange during a cpmg-type pulse
         train.
@@ -62,50 +71,203 @@ def make_calc_observable(time_t2=0.0, ppm_to_rads=1.0, _id=None):
 
         mag_eq = compute_iy_eq(pb)
 
-        if ncyc == 0:
+        l_free = compute_liouvillians(
+            pb=pb,
+            kex=kex,
+            dw=dw,
+            r_ixy=r_ixy,
+            dr_ixy=dr_ixy
+        )
+
+        ncyc_cp = sorted(set(ncyc) - set([0]))
+        t_cps = [time_t2 / (4.0 * a_ncyc) for a_ncyc in ncyc_cp]
+        p_frees = compute_propagators(l_free, t_cps)
+        p_cps = dict(zip(
+            ncyc_cp,
+            compute_echo_trains(p_frees, P_180Y, [2 * a_ncyc for a_ncyc in ncyc_cp])
+        ))
+
+        observables = {}
 
-            mag = mag_eq
+        # The points sharing the same number of cycles (e.g. the reference
+        # planes, ncyc = 0) are only calculated once
+        for a_ncyc in set(ncyc):
 
-        else:
+            if a_ncyc == 0:
 
-            l_free = compute_liouvillians(
-                pb=pb,
-                kex=kex,
-                dw=dw,
-                r_ixy=r_ixy,
-                dr_ixy=dr_ixy
-            )
+                mag = mag_eq
 
-            t_cp = time_t2 / (4.0 * ncyc)
-            p_free = expm(l_free * t_cp)
+            else:
 
-            mag = matrix_power(
-                p_free
-                .dot(P_180Y)
-                .dot(p_free),
-                2 * ncyc
-            ).dot(mag_eq)
+                mag = p_cps[a_ncyc].dot(mag_eq)
 
-        magy_a, _ = get_iy(mag)
+            magy_a, _ = get_iy(mag)
 
-        return magy_a
+            observables[a_ncyc] = magy_a
 
-    def calc_observable(i0=0.0, **kwargs):
+        return asarray([observables[a_ncyc] for a_ncyc in ncyc])
+
+    @lru_cache(5)
+    def _calc_derivatives(pb=0.0, kex=0.0, dw=0.0, r_ixy=5.0, dr_ixy=0.0,
+                          ncyc=()):
         """
-        Calculate the intensity in presence of exchange after a CPMG block.
+        Calculate the derivatives of the intensities after the CPMG block
+        (assuming an initial intensity of 1.0) with respect to the parameters
+        in 'DERIVATIVE_NAMES', dw being in ppm.
+
+        Returns
+        -------
+        out : ndarray
+            Derivatives of the intensities, shape (5, len(ncyc))
+
+        """
+
+        mag_eq = compute_iy_eq(pb)
+
+        # The equilibrium magnetization is linear in pb
+        d_mag_eqs = zeros((len(DERIVATIVE_NAMES),) + mag_eq.shape)
+        d_mag_eqs[0] = compute_iy_eq(1.0) - compute_iy_eq(0.0)
+
+        l_free = compute_liouvillians(
+            pb=pb,
+            kex=kex,
+            dw=dw * ppm_to_rads,
+            r_ixy=r_ixy,
+            dr_ixy=dr_ixy
+        )
+        d_l_frees = compute_liouvillian_derivatives(pb, kex, ppm_to_rads)
+
+        ncyc_cp = sorted(set(ncyc) - set([0]))
+        t_cps = [time_t2 / (4.0 * a_ncyc) for a_ncyc in ncyc_cp]
+        p_frees, d_p_frees = compute_propagator_derivatives(l_free, d_l_frees, t_cps)
+        p_cps, d_p_cps = compute_echo_train_derivatives(
+            p_frees, d_p_frees, P_180Y, [2 * a_ncyc for a_ncyc in ncyc_cp]
+        )
+
+        derivatives = {0: get_iy(d_mag_eqs.transpose(1, 2, 0))[0]}
+
+        for index, a_ncyc in enumerate(ncyc_cp):
+            d_mags = matmul(d_p_cps[:, index], mag_eq) + matmul(p_cps[index], d_mag_eqs)
+            derivatives[a_ncyc] = get_iy(d_mags.transpose(1, 2, 0))[0]
+
+        return asarray([derivatives[a_ncyc] for a_ncyc in ncyc]).T
+
+    def calc_observables(i0=0.0, **kwargs):
+        """
+        Calculate the intensities of all the points of a profile in presence
+        of exchange after a CPMG block.
 
         Parameters
         ----------
         i0 : float
             Initial intensity.
+        ncyc : tuple of int
+            Number of cycles of each point of the profile.
 
         Returns
         -------
-        out : float
-            Intensity after the CEST block
+        out : ndarray
+            Intensities after the CPMG block
+
+        """
+
+        return i0 * _calc_observables(**kwargs)
 
+    def calc_derivatives(i0=0.0, **kwargs):
         """
+        Calculate the derivatives of the intensities with respect to the
+        parameters for which a closed form is known.
+
+        Returns
+        -------
+        out : dict
+            Derivatives of the intensities, keyed by parameter name
+
+        """
+
+        derivatives = dict(zip(DERIVATIVE_NAMES, i0 * _calc_derivatives(**kwargs)))
+        derivatives['i0'] = _calc_observables(**kwargs)
+
+        return derivatives
+
+    # The profiles of the residues sharing this setup can be back-calculated
+    # together (see 'base_profile.fill_profile_caches')
+    calc_observables.unscaled = _calc_observables
+    calc_observables.calc_batch = make_calc_observables_batch(time_t2, ppm_to_rads)
+
+    return calc_observables, calc_derivatives
+
+
+@lru_cache()
+def make_calc_observables_batch(time_t2=0.0, ppm_to_rads=1.0):
+    """
+    Factory to make the function calculating the intensities of the profiles
+    of several residues at once (see 'make_calc_observables').
+
+    Parameters
+    ----------
+    time_t2 : float
+        Time of the CPMG block
+
+    Returns
+    -------
+    out : function
+        Calculate the intensities of several profiles, their Liouvillians
+        being stacked and exponentiated in a single call
+
+    """
+
+    def calc_observables_batch(kwargs_list):
+        """
+        Calculate the intensities of several profiles after the CPMG block,
+        assuming an initial intensity of 1.0.
+
+        Parameters
+        ----------
+        kwargs_list : list of dict
+            Parameters of each profile, as taken by '_calc_observables'.
+
+        Returns
+        -------
+        out : list of ndarray
+            Intensities after the CPMG block, one array per profile
+
+        """
+
+        pb, kex, dw, r_ixy, dr_ixy = stack_parameters(
+            kwargs_list, ('pb', 'kex', 'dw', 'r_ixy', 'dr_ixy'))
+        ncycs = [kwargs['ncyc'] for kwargs in kwargs_list]
+
+        # The equilibrium magnetization is linear in pb
+        mag_eq_0 = compute_iy_eq(0.0)
+        mag_eqs = mag_eq_0 + asarray(pb).reshape(-1, 1, 1) * (compute_iy_eq(1.0) - mag_eq_0)
+        mag_eqs = broadcast_to(mag_eqs, (len(kwargs_list),) + mag_eq_0.shape)
+
+        l_frees = compute_liouvillians(
+            pb=pb,
+            kex=kex,
+            dw=dw * ppm_to_rads,
+            r_ixy=r_ixy,
+            dr_ixy=dr_ixy
+        )
+        l_frees = broadcast_to(l_frees, (len(kwargs_list),) + l_frees.shape[-2:])
+
+        observables = {0: get_iy(mag_eqs.transpose(1, 2, 0))[0]}
+
+        ncyc_cp = sorted(set().union(*ncycs) - set([0]))
+
+        if ncyc_cp:
+            t_cps = [time_t2 / (4.0 * a_ncyc) for a_ncyc in ncyc_cp]
+            p_frees = compute_propagators(l_frees, t_cps)
+            p_cps = compute_echo_trains(p_frees, P_180Y,
+                                        [2 * a_ncyc for a_ncyc in ncyc_cp])
+            mags = matmul(p_cps, mag_eqs[:, newaxis])
+            magys = get_iy(mags.transpose(2, 3, 1, 0))[0]
+            observables.update(zip(ncyc_cp, magys))
 
-        return i0 * _calc_observable(**kwargs)
+        return [
+            asarray([observables[a_ncyc][index] for a_ncyc in ncyc])
+            for index, ncyc in enumerate(ncycs)
+        ]
 
-    return calc_observable
+    return calc_observables_batch
@@ -4,9 +4,17 @@ Created on Sep 1, 2011
 @author: guillaume
 """
 
-from scipy import zeros
+from scipy import zeros, asarray
 
-from chemex.bases.two_states.fast import R_IXY, DR_IXY, DW, KAB, KBA
+from chemex.bases.two_states.fast import (
+    R_IXY, DR_IXY, DW, KAB, KBA, compute_exchange_matrix
+)
+from chemex.bases.assembly import make_compute_liouvillian
+
+
+# Terms of the Liouvillian that are linear in the parameters (the exchange
+# block is shared by the residues, see 'compute_exchange_matrix')
+_compute_linear_terms = make_compute_liouvillian(R_IXY, DR_IXY, DW)
 
 
 def compute_liouvillians(pb=0.0, kex=0.0, dw=0.0,
@@ -46,18 +54,43 @@ def compute_liouvillians(pb=0.0, kex=0.0, dw=0.0,
 
     """
 
-    kab = kex * pb
-    kba = kex - kab
-
-    l_free = R_IXY * r_ixy
-    l_free += DR_IXY * dr_ixy
-    l_free += DW * dw
-    l_free += KAB * kab
-    l_free += KBA * kba
+    l_free = _compute_linear_terms(r_ixy, dr_ixy, dw)
+    l_free = l_free + compute_exchange_matrix(pb, kex)
 
     return l_free
 
 
+def compute_liouvillian_derivatives(pb=0.0, kex=0.0, ppm_to_rads=1.0):
+    """
+    Compute the derivatives of the Liouvillian with respect to the parameters.
+
+    Parameters
+    ----------
+    pb : float
+        Fractional population of state B.
+        0.0 for 0%, 1.0 for 100%.
+    kex : float
+        Exchange rate between state A and B in /s.
+    ppm_to_rads : float
+        Conversion factor from ppm to rad/s.
+
+    Returns
+    -------
+    out: ndarray
+        Derivatives of the Liouvillian with respect to pb, kex, dw (in ppm),
+        r_ixy and dr_ixy, shape (5, 4, 4).
+
+    """
+
+    return asarray([
+        kex * (KAB - KBA),
+        pb * KAB + (1.0 - pb) * KBA,
+        ppm_to_rads * DW,
+        R_IXY,
+        DR_IXY,
+    ])
+
+
 def compute_iy_eq(pb):
     """
     Returns the equilibrium magnetization vector.
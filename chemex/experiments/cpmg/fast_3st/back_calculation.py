@@ -4,18 +4,19 @@ Created on Aug 15, 2011
 @author: guillaume
 """
 
-from numpy.linalg import matrix_power
-from scipy.linalg import expm
+from scipy import asarray, matmul, newaxis, broadcast_to
 
+from chemex.bases.assembly import stack_parameters
 from chemex.bases.three_states.fast import P_180Y
 from chemex.caching import lru_cache
+from chemex.experiments.propagators import compute_propagators, compute_echo_trains
 from .liouvillian import compute_iy_eq, compute_liouvillians, get_iy
 
 
 @lru_cache()
-def make_calc_observable(time_t2=0.0, ppm_to_rads=1.0, _id=None):
+def make_calc_observables(time_t2=0.0, ppm_to_rads=1.0, _id=None):
     """
-    Factory to make "calc_observable" function to calculate the intensity in
+    Factory to make "calc_observables" function to calculate the intensities in
     presence of exchange after a CPMG block.
 
     Parameters
@@ -29,15 +30,16 @@ def make_calc_observable(time_t2=0.0, ppm_to_rads=1.0, _id=None):
 
     Returns
     -------
-    out : function
-        Calculate intensity after the CEST block
+    out : tuple of function
+        Calculate intensity after the CEST block,
+        and the derivatives of the intensities known in closed form
 
     """
 
-    @lru_cache(100)
-    def _calc_observable(pb=0.0, pc=0.0, kex_ab=0.0, kex_bc=0.0, kex_ac=0.0,
-                         dw_ab=0.0, dw_ac=0.0, r_ixy=5.0, dr_ixy_ab=0.0,
-                         dr_ixy_ac=0.0, ncyc=0):
+    @lru_cache(5)
+    def _calc_observables(pb=0.0, pc=0.0, kex_ab=0.0, kex_bc=0.0, kex_ac=0.0,
+                          dw_ab=0.0, dw_ac=0.0, r_ixy=5.0, dr_ixy_ab=0.0,
+                          dr_ixy_ac=0.0, ncyc=()):
         """
         Calculate the intensity in presence of exchange during a cpmg-type pulse
         train.
@@ -83,55 +85,171 @@ def make_calc_observable(time_t2=0.0, ppm_to_rads=1.0, _id=None):
 
         mag_eq = compute_iy_eq(pb, pc)
 
-        if ncyc == 0:
+        l_free = compute_liouvillians(
+            pb=pb,
+            pc=pc,
+            kex_ab=kex_ab,
+            kex_bc=kex_bc,
+            kex_ac=kex_ac,
+            dw_ab=dw_ab,
+            dw_ac=dw_ac,
+            r_ixy=r_ixy,
+            dr_ixy_ab=dr_ixy_ab,
+            dr_ixy_ac=dr_ixy_ac
+        )
+
+        ncyc_cp = sorted(set(ncyc) - set([0]))
+        t_cps = [time_t2 / (4.0 * a_ncyc) for a_ncyc in ncyc_cp]
+        p_frees = compute_propagators(l_free, t_cps)
+        p_cps = dict(zip(
+            ncyc_cp,
+            compute_echo_trains(p_frees, P_180Y, [2 * a_ncyc for a_ncyc in ncyc_cp])
+        ))
+
+        observables = {}
 
-            mag = mag_eq
+        # The points sharing the same number of cycles (e.g. the reference
+        # planes, ncyc = 0) are only calculated once
+        for a_ncyc in set(ncyc):
 
-        else:
+            if a_ncyc == 0:
 
-            l_free = compute_liouvillians(
-                pb=pb,
-                pc=pc,
-                kex_ab=kex_ab,
-                kex_bc=kex_bc,
-                kex_ac=kex_ac,
-                dw_ab=dw_ab,
-                dw_ac=dw_ac,
-                r_ixy=r_ixy,
-                dr_ixy_ab=dr_ixy_ab,
-                dr_ixy_ac=dr_ixy_ac
-            )
+                mag = mag_eq
 
-            t_cp = time_t2 / (4.0 * ncyc)
-            p_free = expm(l_free * t_cp)
+            else:
 
-            mag = matrix_power(
-                p_free
-                .dot(P_180Y)
-                .dot(p_free),
-                2 * ncyc
-            ).dot(mag_eq)
+                mag = p_cps[a_ncyc].dot(mag_eq)
 
-        magy_a, _, _ = get_iy(mag)
+            magy_a, _, _ = get_iy(mag)
 
-        return magy_a
+            observables[a_ncyc] = magy_a
 
-    def calc_observable(i0=0.0, **kwargs):
+        return asarray([observables[a_ncyc] for a_ncyc in ncyc])
+
+    def calc_observables(i0=0.0, **kwargs):
         """
-        Calculate the intensity in presence of exchange after a CEST block.
+        Calculate the intensities of all the points of a profile in presence
+        of exchange after a CPMG block.
 
         Parameters
         ----------
         i0 : float
             Initial intensity.
+        ncyc : tuple of int
+            Number of cycles of each point of the profile.
 
         Returns
         -------
-        out : float
-            Intensity after the CPMG block
+        out : ndarray
+            Intensities after the CPMG block
 
         """
 
-        return i0 * _calc_observable(**kwargs)
+        return i0 * _calc_observables(**kwargs)
+
+    def calc_derivatives(i0=0.0, **kwargs):
+        """
+        Calculate the derivatives of the intensities with respect to the
+        parameters for which a closed form is known.
+
+        Returns
+        -------
+        out : dict
+            Derivatives of the intensities, keyed by parameter name
+
+        """
+
+        return {'i0': _calc_observables(**kwargs)}
+
+    # The profiles of the residues sharing this setup can be back-calculated
+    # together (see 'base_profile.fill_profile_caches')
+    calc_observables.unscaled = _calc_observables
+    calc_observables.calc_batch = make_calc_observables_batch(time_t2, ppm_to_rads)
+
+    return calc_observables, calc_derivatives
+
+
+@lru_cache()
+def make_calc_observables_batch(time_t2=0.0, ppm_to_rads=1.0):
+    """
+    Factory to make the function calculating the intensities of the profiles
+    of several residues at once (see 'make_calc_observables').
+
+    Parameters
+    ----------
+    time_T2 : float
+        Time of the CPMG block.
+
+    Returns
+    -------
+    out : function
+        Calculate the intensities of several profiles, their Liouvillians
+        being stacked and exponentiated in a single call
+
+    """
+
+    def calc_observables_batch(kwargs_list):
+        """
+        Calculate the intensities of several profiles after the CPMG block,
+        assuming an initial intensity of 1.0.
+
+        Parameters
+        ----------
+        kwargs_list : list of dict
+            Parameters of each profile, as taken by '_calc_observables'.
+
+        Returns
+        -------
+        out : list of ndarray
+            Intensities after the CPMG block, one array per profile
+
+        """
 
-    return calc_observable
+        (pb, pc, kex_ab, kex_bc, kex_ac, dw_ab, dw_ac, r_ixy, dr_ixy_ab,
+         dr_ixy_ac) = stack_parameters(
+            kwargs_list, ('pb', 'pc', 'kex_ab', 'kex_bc', 'kex_ac', 'dw_ab',
+                          'dw_ac', 'r_ixy', 'dr_ixy_ab', 'dr_ixy_ac'))
+        ncycs = [kwargs['ncyc'] for kwargs in kwargs_list]
+
+        # The equilibrium magnetization is linear in pb and pc
+        mag_eq_0 = compute_iy_eq(0.0, 0.0)
+        mag_eqs = (
+            mag_eq_0 +
+            asarray(pb).reshape(-1, 1, 1) * (compute_iy_eq(1.0, 0.0) - mag_eq_0) +
+            asarray(pc).reshape(-1, 1, 1) * (compute_iy_eq(0.0, 1.0) - mag_eq_0)
+        )
+        mag_eqs = broadcast_to(mag_eqs, (len(kwargs_list),) + mag_eq_0.shape)
+
+        l_frees = compute_liouvillians(
+            pb=pb,
+            pc=pc,
+            kex_ab=kex_ab,
+            kex_bc=kex_bc,
+            kex_ac=kex_ac,
+            dw_ab=dw_ab * ppm_to_rads,
+            dw_ac=dw_ac * ppm_to_rads,
+            r_ixy=r_ixy,
+            dr_ixy_ab=dr_ixy_ab,
+            dr_ixy_ac=dr_ixy_ac
+        )
+        l_frees = broadcast_to(l_frees, (len(kwargs_list),) + l_frees.shape[-2:])
+
+        observables = {0: get_iy(mag_eqs.transpose(1, 2, 0))[0]}
+
+        ncyc_cp = sorted(set().union(*ncycs) - set([0]))
+
+        if ncyc_cp:
+            t_cps = [time_t2 / (4.0 * a_ncyc) for a_ncyc in ncyc_cp]
+            p_frees = compute_propagators(l_frees, t_cps)
+            p_cps = compute_echo_trains(p_frees, P_180Y,
+                                        [2 * a_ncyc for a_ncyc in ncyc_cp])
+            mags = matmul(p_cps, mag_eqs[:, newaxis])
+            magys = get_iy(mags.transpose(2, 3, 1, 0))[0]
+            observables.update(zip(ncyc_cp, magys))
+
+        return [
+            asarray([observables[a_ncyc][index] for a_ncyc in ncyc])
+            for index, ncyc in enumerate(ncycs)
+        ]
+
+    return calc_observables_batch
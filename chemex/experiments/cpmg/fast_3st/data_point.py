@@ -11,8 +11,7 @@ from scipy import pi
 from chemex.constants import xi_ratio
 from chemex.experiments.base_data_point import BaseDataPoint
 from chemex.parsing import parse_assignment
-from ..plotting import plot_data
-from .back_calculation import make_calc_observable
+from .back_calculation import make_calc_observables
 
 
 PAR_DICT = {
@@ -34,7 +33,7 @@ class DataPoint(BaseDataPoint):
     def __init__(self, val, err, par):
 
         BaseDataPoint.__init__(self, val, err, par, PAR_DICT['par_conv'],
-                               plot_data)
+                               'cpmg')
 
         temperature = self.par['temperature']
         resonance_id = self.par['resonance_id']
@@ -61,11 +60,11 @@ class DataPoint(BaseDataPoint):
 
         args = (
             self.par[arg]
-            for arg in getargspec(make_calc_observable.__wrapped__).args
+            for arg in getargspec(make_calc_observables.__wrapped__).args
         )
-        self.calc_observable = make_calc_observable(*args)
+        self.calc_observables, self.calc_derivatives = make_calc_observables(*args)
 
-        self.kwargs_default = {'ncyc': self.par['ncyc']}
+        self.kwargs_profile = {'ncyc': self.par['ncyc']}
 
         self.short_long_par_names = (
             ('i0', ('i0', resonance_id, experiment_name)),
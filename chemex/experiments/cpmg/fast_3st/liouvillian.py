@@ -6,7 +6,15 @@ Created on Sep 1, 2011
 
 from scipy import zeros
 
-from chemex.bases.three_states.fast import R_IXY, DR_IXY_AB, DR_IXY_AC, DW_AB, DW_AC, KAB, KBA, KBC, KCB, KAC, KCA
+from chemex.bases.three_states.fast import R_IXY, DR_IXY_AB, DR_IXY_AC, DW_AB, DW_AC, compute_exchange_matrix
+from chemex.bases.assembly import make_compute_liouvillian
+
+
+# Terms of the Liouvillian that are linear in the parameters (the exchange
+# block is shared by the residues, see 'compute_exchange_matrix')
+_compute_linear_terms = make_compute_liouvillian(
+    R_IXY, DR_IXY_AB, DR_IXY_AC, DW_AB, DW_AC
+)
 
 
 def compute_liouvillians(pb=0.0, pc=0.0, kex_ab=0.0, kex_bc=0.0, kex_ac=0.0, dw_ab=0.0, dw_ac=0.0,
@@ -55,28 +63,8 @@ def compute_liouvillians(pb=0.0, pc=0.0, kex_ab=0.0, kex_bc=0.0, kex_ac=0.0, dw_
 
     """
 
-    pa = 1.0 - pb - pc
-
-    kab = kex_ab * pb / (pa + pb)
-    kba = kex_ab * pa / (pa + pb)
-
-    kbc = kex_bc * pc / (pb + pc)
-    kcb = kex_bc * pb / (pb + pc)
-
-    kac = kex_ac * pc / (pa + pc)
-    kca = kex_ac * pa / (pa + pc)
-
-    l_free = R_IXY * r_ixy
-    l_free += DR_IXY_AB * dr_ixy_ab
-    l_free += DR_IXY_AC * dr_ixy_ac
-    l_free += DW_AB * dw_ab
-    l_free += DW_AC * dw_ac
-    l_free += KAB * kab
-    l_free += KBA * kba
-    l_free += KBC * kbc
-    l_free += KCB * kcb
-    l_free += KAC * kac
-    l_free += KCA * kca
+    l_free = _compute_linear_terms(r_ixy, dr_ixy_ab, dr_ixy_ac, dw_ab, dw_ac)
+    l_free = l_free + compute_exchange_matrix(pb, pc, kex_ab, kex_bc, kex_ac)
 
     return l_free
 
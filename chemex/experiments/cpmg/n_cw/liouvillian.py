@@ -8,7 +8,13 @@ Created on Sep 1, 2011
 from scipy import zeros, asarray
 
 from chemex.bases.two_states.iph import \
-    R_IXY, DR_IXY, R_IZ, CS, DW, KAB, KBA, W1X, W1Y
+    R_IXY, DR_IXY, R_IZ, CS, DW, compute_exchange_matrix, W1X, W1Y
+from chemex.bases.assembly import make_compute_liouvillian
+
+
+# Terms of the Liouvillian that are linear in the parameters (the exchange
+# block is shared by the residues, see 'compute_exchange_matrix')
+_compute_linear_terms = make_compute_liouvillian(R_IXY, DR_IXY, R_IZ, CS, DW)
 
 
 def compute_liouvillians(pb=0.0, kex=0.0, dw=0.0,
@@ -49,16 +55,8 @@ def compute_liouvillians(pb=0.0, kex=0.0, dw=0.0,
 
     """
 
-    kab = kex * pb
-    kba = kex - kab
-
-    l_free = R_IXY * r_nxy
-    l_free += DR_IXY * dr_nxy
-    l_free += R_IZ * r_nz
-    l_free += CS * cs_offset
-    l_free += DW * dw
-    l_free += KAB * kab
-    l_free += KBA * kba
+    l_free = _compute_linear_terms(r_nxy, dr_nxy, r_nz, cs_offset, dw)
+    l_free = l_free + compute_exchange_matrix(pb, kex)
 
     l_w1x, l_w1y = w1 * asarray([W1X, W1Y])
 
@@ -5,23 +5,26 @@ Created on Aug 15, 2011
 """
 
 # Python Modules
-from scipy import pi, dot
-from scipy.linalg import expm
+from scipy import pi, dot, asarray
 from numpy.linalg import matrix_power
 
 # Local Modules
 from chemex.caching import lru_cache
+from chemex.experiments.propagators import (compute_propagators,
+                                            compute_batch_propagators,
+                                            compute_echo_trains)
 from .liouvillian import (compute_2hznz_eq,
                           compute_liouvillians,
+                          compute_free_subspaces,
                           get_trz)
 from chemex.bases.two_states.iph_aph import P180_S
 
 
 @lru_cache()
-def make_calc_observable(pw=0.0, time_t2=0.0, time_equil=0.0, ppm_to_rads=1.0, carrier=0.0,
+def make_calc_observables(pw=0.0, time_t2=0.0, time_equil=0.0, ppm_to_rads=1.0, carrier=0.0,
                          taub=2.68e-3, _id=None):
     """
-    Factory to make "calc_observable" function to calculate the intensity in presence
+    Factory to make "calc_observables" function to calculate the intensities in presence
     of exchange after a CEST block.
 
     Parameters
@@ -37,11 +40,16 @@ def make_calc_observable(pw=0.0, time_t2=0.0, time_equil=0.0, ppm_to_rads=1.0, c
 
     Returns
     -------
-    out : function
-        Calculate intensity after the CEST block
+    out : tuple of function
+        Calculate intensity after the CEST block,
+        and the derivatives of the intensities known in closed form
 
     """
 
+    # The free precession does not mix the transverse and the longitudinal
+    # elements: its propagators are computed block by block
+    subspaces = compute_free_subspaces()
+
     @lru_cache(1)
     def make_propagators(pb=0.0, kex=0.0, dw=0.0, r_nxy=5.0, dr_nxy=0.0,
                          r_nz=1.5, r_2hznz=0.0, etaxy=0.0, etaz=0.0,
@@ -55,13 +63,10 @@ def make_calc_observable(pw=0.0, time_t2=0.0, time_equil=0.0, ppm_to_rads=1.0, c
                                                     j_hn=j_hn, dj_hn=dj_hn,
                                                     cs_offset=cs_offset, w1=w1)
 
-        p_equil = expm(l_free * time_equil)
-        p_neg = expm(l_free * -2.0 * pw / pi)
-        p_taub = expm(l_free * (taub - 2.0 * pw - 2.0 * pw / pi))
-        p_90px = expm((l_free + l_w1x) * pw)
-        p_90py = expm((l_free + l_w1y) * pw)
-        p_90mx = expm((l_free - l_w1x) * pw)
-        p_90my = expm((l_free - l_w1y) * pw)
+        p_equil, p_neg, p_taub = compute_propagators(
+            l_free, [time_equil, -2.0 * pw / pi, taub - 2.0 * pw - 2.0 * pw / pi])
+        p_90px, p_90py, p_90mx, p_90my = compute_batch_propagators(
+            [l_free + l_w1x, l_free + l_w1y, l_free - l_w1x, l_free - l_w1y], pw)
         p_180px = matrix_power(p_90px, 2)
         p_180py = matrix_power(p_90py, 2)
 
@@ -72,10 +77,10 @@ def make_calc_observable(pw=0.0, time_t2=0.0, time_equil=0.0, ppm_to_rads=1.0, c
 
         return l_free, ps
 
-    @lru_cache(100)
-    def _calc_observable(pb=0.0, kex=0.0, dw=0.0, r_nxy=5.0, dr_nxy=0.0, r_nz=1.5,
-                         r_2hznz=0.0, etaxy=0.0, etaz=0.0, j_hn=0.0, dj_hn=0.0,
-                         cs=0.0, ncyc=0):
+    @lru_cache(5)
+    def _calc_observables(pb=0.0, kex=0.0, dw=0.0, r_nxy=5.0, dr_nxy=0.0, r_nz=1.5,
+                          r_2hznz=0.0, etaxy=0.0, etaz=0.0, j_hn=0.0, dj_hn=0.0,
+                          cs=0.0, ncyc=()):
         """
         Calculate the intensity in presence of exchange during a cpmg-type pulse train.
                 _______________________________________________________________________
@@ -120,45 +125,74 @@ def make_calc_observable(pw=0.0, time_t2=0.0, time_equil=0.0, ppm_to_rads=1.0, c
 
         mag_eq = compute_2hznz_eq(pb)
 
-        if ncyc == 0:
+        ncyc_cp = sorted(set(ncyc) - set([0]))
+        t_cps = [time_t2 / (4.0 * a_ncyc) - pw for a_ncyc in ncyc_cp]
+        p_frees = compute_propagators(l_free, t_cps, subspaces)
+        p_cpxs = dict(zip(ncyc_cp, compute_echo_trains(p_frees, p_180px, ncyc_cp)))
+        p_cpys = dict(zip(ncyc_cp, compute_echo_trains(p_frees, p_180py, ncyc_cp)))
+
+        observables = {}
+
+        # The points sharing the same number of cycles (e.g. the reference
+        # planes, ncyc = 0) are only calculated once
+        for a_ncyc in set(ncyc):
+
+            if a_ncyc == 0:
 
-            # The +/- phase cycling of the first 90 and the receiver is taken care
-            # by setting the thermal equilibrium to 0
-            mag = -reduce(dot, [p_equil, p_90py, p_element, p_90px, mag_eq])
+                # The +/- phase cycling of the first 90 and the receiver is taken care
+                # by setting the thermal equilibrium to 0
+                mag = -reduce(dot, [p_equil, p_90py, p_element, p_90px, mag_eq])
 
-        else:
+            else:
 
-            t_cp = time_t2 / (4.0 * ncyc) - pw
-            p_free = expm(l_free * t_cp)
-            p_cpx = matrix_power(p_free.dot(p_180px).dot(p_free), ncyc)
-            p_cpy = matrix_power(p_free.dot(p_180py).dot(p_free), ncyc)
-            p_element_pc = 0.5 * (p_90px.dot(p_element).dot(p_90py) +
-                                  p_90mx.dot(p_element).dot(p_90my))
+                p_cpx = p_cpxs[a_ncyc]
+                p_cpy = p_cpys[a_ncyc]
+                p_element_pc = 0.5 * (p_90px.dot(p_element).dot(p_90py) +
+                                      p_90mx.dot(p_element).dot(p_90my))
 
-            mag = -reduce(dot,
-                          [p_equil, p_90py, p_neg, p_cpx, p_neg, p_element_pc, p_neg, p_cpy, p_neg, p_90px, mag_eq])
+                mag = -reduce(dot,
+                              [p_equil, p_90py, p_neg, p_cpx, p_neg, p_element_pc, p_neg, p_cpy, p_neg, p_90px, mag_eq])
 
-        magz_a, _magz_b = get_trz(mag)
+            magz_a, _magz_b = get_trz(mag)
 
-        return magz_a
+            observables[a_ncyc] = magz_a
 
-    def calc_observable(i0=0.0, **kwargs):
+        return asarray([observables[a_ncyc] for a_ncyc in ncyc])
+
+    def calc_observables(i0=0.0, **kwargs):
         """
-        Calculate the intensity in presence of exchange after a CEST block.
+        Calculate the intensities of all the points of a profile in presence
+        of exchange after a CPMG block.
 
         Parameters
         ----------
         i0 : float
             Initial intensity.
+        ncyc : tuple of int
+            Number of cycles of each point of the profile.
 
         Returns
         -------
-        out : float
-            Intensity after the CEST block
+        out : ndarray
+            Intensities after the CPMG block
+
+        """
+
+        return i0 * _calc_observables(**kwargs)
+
+    def calc_derivatives(i0=0.0, **kwargs):
+        """
+        Calculate the derivatives of the intensities with respect to the
+        parameters for which a closed form is known.
+
+        Returns
+        -------
+        out : dict
+            Derivatives of the intensities, keyed by parameter name
 
         """
 
-        return i0 * _calc_observable(**kwargs)
+        return {'i0': _calc_observables(**kwargs)}
 
-    return calc_observable
+    return calc_observables, calc_derivatives
 
@@ -15,7 +15,15 @@ from chemex.constants import gamma
 from chemex.bases.two_states.iph_aph import (R_IXY, R_2SZIXY, DR_XY,
                                              R_IZ, R_2SZIZ, CS, DW,
                                              J, DJ, ETAXY, ETAZ,
-                                             KAB, KBA, W1X, W1Y)
+                                             compute_exchange_matrix, W1X, W1Y)
+from chemex.bases.assembly import make_compute_liouvillian, find_invariant_subspaces
+
+
+# Terms of the Liouvillian that are linear in the parameters (the exchange
+# block is shared by the residues, see 'compute_exchange_matrix')
+_compute_linear_terms = make_compute_liouvillian(
+    R_IXY, R_2SZIXY, DR_XY, R_IZ, R_2SZIZ, CS, DW, J, DJ, ETAXY, ETAZ
+)
 
 
 def compute_liouvillians(pb=0.0, kex=0.0, dw=0.0, r_nxy=5.0, dr_nxy=0.0,
@@ -67,30 +75,28 @@ def compute_liouvillians(pb=0.0, kex=0.0, dw=0.0, r_nxy=5.0, dr_nxy=0.0,
 
     """
 
-    kab = kex * pb
-    kba = kex - kab
-
     r_2hznxy = r_nxy + r_2hznz - r_nz
 
-    l_free = R_IXY * r_nxy
-    l_free += R_2SZIXY * r_2hznxy
-    l_free += DR_XY * dr_nxy
-    l_free += R_IZ * r_nz
-    l_free += R_2SZIZ * r_2hznz
-    l_free += CS * cs_offset
-    l_free += DW * dw
-    l_free += J * pi * j_hn
-    l_free += DJ * pi * dj_hn
-    l_free += ETAXY * etaxy
-    l_free += ETAZ * etaz
-    l_free += KAB * kab
-    l_free += KBA * kba
+    l_free = _compute_linear_terms(
+        r_nxy, r_2hznxy, dr_nxy, r_nz, r_2hznz, cs_offset, dw, pi * j_hn,
+        pi * dj_hn, etaxy, etaz
+    )
+    l_free = l_free + compute_exchange_matrix(pb, kex)
 
     l_w1x, l_w1y = w1 * asarray([W1X, W1Y])
 
     return l_free, l_w1x, l_w1y
 
 
+def compute_free_subspaces():
+    """Indexes of the subspaces left invariant by the free-precession
+    Liouvillian: the transverse and the longitudinal elements (8 and 4 out of
+    the 12 elements), which are exponentiated separately."""
+
+    return find_invariant_subspaces(_compute_linear_terms.stack,
+                                    compute_exchange_matrix.stack)
+
+
 def compute_2hznz_eq(pb):
     mag_eq = zeros((12, 1))
     mag_eq[5, 0] += (1.0 - pb)
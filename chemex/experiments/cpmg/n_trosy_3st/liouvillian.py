@@ -10,7 +10,16 @@ from scipy import zeros, asarray, pi
 
 from chemex.bases.three_states.iph_aph import \
     R_IXY, R_2SZIXY, DR_IXY_AB, DR_IXY_AC, R_IZ, R_2SZIZ, CS, DW_AB, DW_AC, \
-    J, DJ_AB, DJ_AC, ETAXY, ETAZ, KAB, KBA, KBC, KCB, KAC, KCA, W1X, W1Y
+    J, DJ_AB, DJ_AC, ETAXY, ETAZ, compute_exchange_matrix, W1X, W1Y
+from chemex.bases.assembly import make_compute_liouvillian
+
+
+# Terms of the Liouvillian that are linear in the parameters (the exchange
+# block is shared by the residues, see 'compute_exchange_matrix')
+_compute_linear_terms = make_compute_liouvillian(
+    R_IXY, DR_IXY_AB, DR_IXY_AC, R_2SZIZ, R_IZ, R_2SZIXY, CS, DW_AB, DW_AC, J,
+    DJ_AB, DJ_AC, ETAXY, ETAZ
+)
 
 
 # Functions
@@ -78,39 +87,13 @@ def compute_liouvillians(
 
     """
 
-    pa = 1.0 - pb - pc
-
-    kab = kex_ab * pb / (pa + pb)
-    kba = kex_ab * pa / (pa + pb)
-
-    kbc = kex_bc * pc / (pb + pc)
-    kcb = kex_bc * pb / (pb + pc)
-
-    kac = kex_ac * pc / (pa + pc)
-    kca = kex_ac * pa / (pa + pc)
-
     r_2hznxy = r_nxy + r_2hznz - r_nz
 
-    l_free = R_IXY * r_nxy
-    l_free += DR_IXY_AB * dr_nxy_ab
-    l_free += DR_IXY_AC * dr_nxy_ac
-    l_free += R_2SZIZ * r_2hznz
-    l_free += R_IZ * r_nz
-    l_free += R_2SZIXY * r_2hznxy
-    l_free += CS * cs_offset
-    l_free += DW_AB * dw_ab
-    l_free += DW_AC * dw_ac
-    l_free += J * pi * j_hn
-    l_free += DJ_AB * pi * dj_hn_ab
-    l_free += DJ_AC * pi * dj_hn_ac
-    l_free += ETAXY * etaxy
-    l_free += ETAZ * etaz
-    l_free += KAB * kab
-    l_free += KBA * kba
-    l_free += KBC * kbc
-    l_free += KCB * kcb
-    l_free += KAC * kac
-    l_free += KCA * kca
+    l_free = _compute_linear_terms(
+        r_nxy, dr_nxy_ab, dr_nxy_ac, r_2hznz, r_nz, r_2hznxy, cs_offset, dw_ab,
+        dw_ac, pi * j_hn, pi * dj_hn_ab, pi * dj_hn_ac, etaxy, etaz
+    )
+    l_free = l_free + compute_exchange_matrix(pb, pc, kex_ab, kex_bc, kex_ac)
 
     l_w1x, l_w1y = w1 * asarray([W1X, W1Y])
 
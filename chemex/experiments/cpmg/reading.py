@@ -6,6 +6,7 @@ Created on Mar 30, 2011
 
 __updated__ = "2013-10-17"
 
+import functools
 import os
 
 import scipy as sc
@@ -13,12 +14,14 @@ import scipy as sc
 from chemex import utils
 
 
-def read_data(cfg, working_dir, global_parameters, res_incl=None, res_excl=None):
+def read_data(cfg, working_dir, global_parameters, res_incl=None, res_excl=None,
+              jobs=1):
     # Reads the path to get the intensities
     exp_data_dir = utils.normalize_path(working_dir,
                                         cfg.get('path', 'exp_data_dir'))
 
     data_points = list()
+    profiles = list()
 
     experiment_name = name_experiment(global_parameters)
 
@@ -39,7 +42,18 @@ def read_data(cfg, working_dir, global_parameters, res_incl=None, res_excl=None)
         parameters['resonance_id'] = resonance_id
 
         abs_path_filename = os.path.join(exp_data_dir, filename)
-        data_points += read_a_cpmg_profile(abs_path_filename, parameters)
+        profiles.append((abs_path_filename, parameters))
+
+    # The profile files are read (and their uncertainties estimated) over
+    # 'jobs' processes, the data points being then made in the order of the
+    # files
+    tasks = [functools.partial(load_a_cpmg_profile, filename)
+             for filename, _ in profiles]
+
+    for (filename, parameters), (data, uncertainty_from_duplicates) in zip(
+            profiles, utils.run_tasks(tasks, jobs)):
+        data_points += make_cpmg_data_points(filename, parameters, data,
+                                             uncertainty_from_duplicates)
 
     # Adjust the minimal uncertainty
     data_points = adjust_min_int_uncertainty(data_points)
@@ -70,9 +84,23 @@ def name_experiment(global_parameters=None):
 def read_a_cpmg_profile(filename, parameters):
     """Reads in the fuda file and spit out the intensities"""
 
+    data, uncertainty_from_duplicates = load_a_cpmg_profile(filename)
+
+    return make_cpmg_data_points(filename, parameters, data,
+                                 uncertainty_from_duplicates)
+
+
+def load_a_cpmg_profile(filename):
+    """Reads in the fuda file and estimates the uncertainty of the intensities
+    from the duplicate measurements"""
+
     data = sc.loadtxt(filename, dtype=[('ncyc', '<f8'), ('intensity', '<f8'), ('intensity_err', '<f8')])
 
-    uncertainty_from_duplicates = estimate_uncertainty_from_duplicates(data)
+    return data, estimate_uncertainty_from_duplicates(data)
+
+
+def make_cpmg_data_points(filename, parameters, data, uncertainty_from_duplicates):
+    """Makes the data points of the profile read in the fuda file"""
 
     data_points = list()
 
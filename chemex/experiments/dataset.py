@@ -0,0 +1,63 @@
+"""Container of the experimental data points, stored profile by profile."""
+
+from scipy import flatnonzero
+
+from chemex.experiments.base_profile import make_profiles
+
+
+class Dataset(object):
+    """
+    Experimental dataset.
+
+    The data points are stored in profiles (see 'Profile'), whose values,
+    uncertainties and experimental variables are arrays, so that the memory
+    and the time needed to copy or resample the dataset grow with the number
+    of points and not with the number of Python objects. Iterating over the
+    dataset yields views of the data points, for writing and plotting.
+    """
+
+    def __init__(self, profiles=()):
+        """Constructor"""
+
+        self.profiles = list(profiles)
+
+    @classmethod
+    def from_data_points(cls, data_points):
+        """Makes a dataset out of a sequence of data points."""
+
+        return cls(make_profiles(data_points))
+
+    def __len__(self):
+        """Number of data points in the dataset"""
+
+        return sum(len(profile) for profile in self.profiles)
+
+    def __iter__(self):
+        """Iterates over the views of the data points of the dataset"""
+
+        for profile in self.profiles:
+            for data_point in profile.data_points:
+                yield data_point
+
+    def copy(self):
+        """Makes a copy of the dataset (only the arrays are copied)."""
+
+        return Dataset(profile.copy() for profile in self.profiles)
+
+    def select(self, condition):
+        """
+        Makes a new dataset with the data points for which 'condition' (a
+        function of the view of a data point) is true.
+        """
+
+        profiles = []
+
+        for profile in self.profiles:
+            indexes = flatnonzero([condition(data_point) for data_point in profile.data_points])
+
+            if len(indexes) == len(profile):
+                profiles.append(profile)
+            elif len(indexes):
+                profiles.append(profile.take(indexes))
+
+        return Dataset(profiles)
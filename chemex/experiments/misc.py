@@ -12,7 +12,11 @@ from chemex.utils import header1, header2
 SIGN = array([1.0, -1.0])
 
 
-@lru_cache()
+# The cache is shared by all the residues: it holds one entry per residue and
+# static field for each set of parameters, so that the shifts are only
+# computed again for the residues whose parameters changed (e.g. once per
+# residue for a Jacobian column of 'kex', none for a column of 'r_nz')
+@lru_cache(4096)
 def correct_chemical_shift(pb=0.0, kex=0.0, dw=0.0, r_ixy=0.0, dr_ixy=0.0):
     """Corrects major and minor peak positions in presence of exchange."""
 
@@ -1,4 +1,13 @@
-import matplotlib as mpl
+"""
+Plotting of the experimental and fitted profiles.
+
+The data points only name the family of their experiment ('cpmg', 'cest',
+'shift'), the plotting module of which ('chemex.experiments.<family>.plotting')
+is imported the first time the family is plotted. Matplotlib is thus only
+imported (and set up) when plots are actually made.
+"""
+
+import importlib
 
 
 dark_gray = '0.13'
@@ -58,9 +67,34 @@ style_dict = {
                         'Bitstream Vera Sans', 'sans-serif'],
 }
 
-mpl.rcParams.update(base_context)
-mpl.rcParams.update(style_dict)
-mpl.use('Agg')
+# Plotting functions of the experiment families, imported on demand
+_plot_functions = dict()
+
+
+def setup_matplotlib():
+    """Imports matplotlib and sets the style and the (non-interactive)
+    backend of the plots"""
+
+    import matplotlib as mpl
+
+    mpl.rcParams.update(base_context)
+    mpl.rcParams.update(style_dict)
+    mpl.use('Agg')
+
+
+def get_plot_function(family):
+    """Returns the function plotting the profiles of the experiment 'family'"""
+
+    if family not in _plot_functions:
+        if not _plot_functions:
+            setup_matplotlib()
+
+        module = importlib.import_module(
+            'chemex.experiments.{:s}.plotting'.format(family)
+        )
+        _plot_functions[family] = module.plot_data
+
+    return _plot_functions[family]
 
 
 def plot_data(data, par, par_names, par_fixed, output_dir='./'):
@@ -71,9 +105,8 @@ def plot_data(data, par, par_names, par_fixed, output_dir='./'):
     for data_point in data:
         subsets.setdefault(data_point.plot_data, []).append(data_point)
 
-    for plot, dataset in subsets.items():
+    for family, dataset in subsets.items():
+        plot = get_plot_function(family)
         plot(dataset, par, par_names, par_fixed, output_dir)
 
     return
-
-
@@ -0,0 +1,419 @@
+"""Propagators shared by the back-calculations of the different experiments."""
+
+import numpy as np
+from numpy.linalg import eig, inv, cond, svd
+from scipy.linalg import expm, expm_frechet
+
+# Above this condition number, the eigenvectors of a Liouvillian are considered
+# too close to linear dependence (e.g. at an exceptional point of the exchange
+# process) and the propagators are computed with 'expm' instead. The relative
+# error of the propagators obtained from the eigendecomposition grows as
+# cond(eigenvectors) * eps, so it stays below about 1e-11, far below the
+# relative steps (about 1e-5) of the finite-difference Jacobian
+MAX_COND = 1.0e5
+
+
+def expm1_complex(z):
+    """Computes exp(z) - 1 for complex 'z' without the loss of precision of
+    exp(z) - 1 when z is close to 0."""
+
+    x, y = z.real, z.imag
+
+    return np.expm1(x) * np.cos(y) - 2.0 * np.sin(0.5 * y) ** 2 + 1j * np.exp(x) * np.sin(y)
+
+
+def exprel(z):
+    """Computes (exp(z) - 1) / z for complex 'z', which tends to 1 when z
+    tends to 0."""
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(z == 0.0, 1.0, expm1_complex(z) / np.where(z == 0.0, 1.0, z))
+
+
+def compute_propagators(liouvillian, times, subspaces=None):
+    """
+    Computes the propagators expm(liouvillian * time) for all the delays in
+    'times' with a single eigendecomposition of the Liouvillian.
+
+    The propagators are accurate to about cond(eigenvectors) * eps relative to
+    their norm, i.e. 1e-11 at most (see 'MAX_COND'); beyond that, 'expm' is
+    used.
+
+    Parameters
+    ----------
+    liouvillian : ndarray
+        Liouvillian, shape (d, d), or stack of Liouvillians (e.g. one per
+        residue), shape (..., d, d).
+    times : sequence of float
+        Delays in s.
+    subspaces : list of ndarray, optional
+        Indexes of the subspaces the Liouvillian is block diagonal in (see
+        'find_invariant_subspaces'). The blocks are then decomposed instead of
+        the whole Liouvillian, e.g. the 8x8 transverse and 4x4 longitudinal
+        blocks of a 12x12 free-precession Liouvillian.
+
+    Returns
+    -------
+    out : ndarray
+        Propagators, shape (n, d, d), or (..., n, d, d) for a stack of
+        Liouvillians.
+
+    """
+
+    times = np.asarray(times, dtype=float)
+
+    if subspaces is not None and len(subspaces) > 1:
+        return _compute_block_propagators(np.asarray(liouvillian), times,
+                                          subspaces)
+
+    if np.ndim(liouvillian) > 2:
+        return _compute_stacked_propagators(np.asarray(liouvillian), times)
+
+    eigenvalues, eigenvectors = eig(liouvillian)
+
+    if cond(eigenvectors) > MAX_COND:
+        return np.asarray([expm(liouvillian * time) for time in times])
+
+    exp_eigenvalues = np.exp(np.outer(times, eigenvalues))
+    propagators = np.dot(eigenvectors * exp_eigenvalues[:, np.newaxis, :],
+                         inv(eigenvectors))
+
+    if np.isrealobj(liouvillian):
+        propagators = propagators.real
+
+    return propagators
+
+
+def _compute_stacked_propagators(liouvillians, times):
+    """Computes the propagators of a stack of Liouvillians, shape (..., d, d),
+    for all the delays in 'times' with one batched eigendecomposition."""
+
+    shape = liouvillians.shape
+    liouvillians = liouvillians.reshape((-1,) + shape[-2:])
+
+    eigenvalues, eigenvectors = eig(liouvillians)
+
+    exp_eigenvalues = np.exp(eigenvalues[:, np.newaxis, :] * times[:, np.newaxis])
+    propagators = np.matmul(
+        eigenvectors[:, np.newaxis] * exp_eigenvalues[:, :, np.newaxis, :],
+        inv(eigenvectors)[:, np.newaxis]
+    )
+
+    if np.isrealobj(liouvillians):
+        propagators = propagators.real
+
+    singular_values = svd(eigenvectors, compute_uv=False)
+    ill_conditioned = singular_values[:, 0] > MAX_COND * singular_values[:, -1]
+
+    for index in np.flatnonzero(ill_conditioned):
+        propagators[index] = [expm(liouvillians[index] * time) for time in times]
+
+    return propagators.reshape(shape[:-2] + (len(times),) + shape[-2:])
+
+
+def _compute_block_propagators(liouvillian, times, subspaces):
+    """Computes the propagators of a block-diagonal Liouvillian (or stack of
+    Liouvillians) block by block. The blocks are padded with zeros to the size
+    of the largest one and decomposed in one batched call, which costs less
+    than one call per block at these small sizes."""
+
+    size = max(len(subspace) for subspace in subspaces)
+    batch_shape = liouvillian.shape[:-2]
+
+    blocks = np.zeros(batch_shape + (len(subspaces), size, size),
+                      dtype=liouvillian.dtype)
+
+    for index, subspace in enumerate(subspaces):
+        blocks[..., index, :len(subspace), :len(subspace)] = (
+            liouvillian[..., subspace[:, np.newaxis], subspace])
+
+    block_propagators = _compute_stacked_propagators(blocks, times)
+
+    propagators = np.zeros(batch_shape + times.shape + liouvillian.shape[-2:],
+                           dtype=block_propagators.dtype)
+
+    for index, subspace in enumerate(subspaces):
+        propagators[..., subspace[:, np.newaxis], subspace] = (
+            block_propagators[..., index, :, :len(subspace), :len(subspace)])
+
+    return propagators
+
+
+def compute_propagator_derivatives(liouvillian, d_liouvillians, times):
+    """
+    Computes the propagators expm(liouvillian * time) for all the delays in
+    'times' and their derivatives with respect to the parameters of the
+    Liouvillian.
+
+    The derivatives (Frechet derivatives of the exponential in the direction
+    of the derivatives of the Liouvillian) are obtained from the same
+    eigendecomposition as the propagators, with the divided differences of
+    the exponentials of the eigenvalues. As in 'compute_propagators', the
+    Liouvillians whose eigenvectors are ill-conditioned (see 'MAX_COND') are
+    handled with 'expm_frechet' instead.
+
+    Parameters
+    ----------
+    liouvillian : ndarray
+        Liouvillian, shape (d, d).
+    d_liouvillians : ndarray
+        Derivatives of the Liouvillian with respect to the parameters,
+        shape (k, d, d).
+    times : sequence of float
+        Delays in s.
+
+    Returns
+    -------
+    propagators : ndarray
+        Propagators, shape (n, d, d).
+    d_propagators : ndarray
+        Derivatives of the propagators, shape (k, n, d, d).
+
+    """
+
+    times = np.asarray(times, dtype=float)
+    d_liouvillians = np.asarray(d_liouvillians)
+
+    eigenvalues, eigenvectors = eig(liouvillian)
+
+    if cond(eigenvectors) > MAX_COND:
+
+        propagators = np.asarray([expm(liouvillian * time) for time in times])
+        d_propagators = np.asarray([
+            [expm_frechet(liouvillian * time, d_liouvillian * time,
+                          compute_expm=False)
+             for time in times]
+            for d_liouvillian in d_liouvillians
+        ])
+
+        return propagators, d_propagators.reshape(
+            (len(d_liouvillians), len(times)) + np.shape(liouvillian))
+
+    inv_eigenvectors = inv(eigenvectors)
+
+    exp_eigenvalues = np.exp(np.outer(times, eigenvalues))
+    propagators = np.dot(eigenvectors * exp_eigenvalues[:, np.newaxis, :],
+                         inv_eigenvectors)
+
+    # Divided differences (exp(li * t) - exp(lj * t)) / (li - lj), written
+    # with the eigenvalue of largest real part factored out so that they
+    # neither overflow nor lose precision when li and lj are close
+    l_i, l_j = eigenvalues[:, np.newaxis], eigenvalues[np.newaxis, :]
+    l_max = np.where(l_i.real >= l_j.real, l_i, l_j)
+    l_min = l_i + l_j - l_max
+    times_ = times[:, np.newaxis, np.newaxis]
+    divided_differences = (np.exp(l_max * times_) * times_ *
+                           exprel((l_min - l_max) * times_))
+
+    # Derivatives of the Liouvillian in its eigenbasis
+    d_liouvillians_eig = np.matmul(np.matmul(inv_eigenvectors, d_liouvillians),
+                                   eigenvectors)
+
+    d_propagators = np.matmul(
+        np.matmul(eigenvectors,
+                  d_liouvillians_eig[:, np.newaxis] * divided_differences),
+        inv_eigenvectors
+    )
+
+    if np.isrealobj(liouvillian) and np.isrealobj(d_liouvillians):
+        propagators = propagators.real
+        d_propagators = d_propagators.real
+
+    return propagators, d_propagators
+
+
+def matrix_powers(matrices, exponents):
+    """
+    Raises each matrix of a stack to its own integer power.
+
+    The powers are obtained by binary exponentiation carried out on the whole
+    stack at once, so that the number of matrix products grows with the
+    logarithm of the largest exponent only.
+
+    Parameters
+    ----------
+    matrices : ndarray
+        Stack of matrices, shape (..., n, d, d).
+    exponents : sequence of int
+        Non-negative exponents, one per matrix (along the n axis).
+
+    Returns
+    -------
+    out : ndarray
+        Stack of matrix powers, shape (..., n, d, d).
+
+    """
+
+    bases = np.array(matrices)
+    exponents = np.array(exponents, dtype=int)
+
+    powers = np.empty_like(bases)
+    powers[:] = np.identity(bases.shape[-1])
+
+    while exponents.any():
+
+        odd = (exponents & 1).astype(bool)
+        powers[..., odd, :, :] = np.matmul(powers[..., odd, :, :],
+                                           bases[..., odd, :, :])
+
+        exponents >>= 1
+
+        if exponents.any():
+            bases = np.matmul(bases, bases)
+
+    return powers
+
+
+def compute_echo_trains(p_frees, p_180, ncycs):
+    """
+    Computes the propagators of the CPMG echo trains [t_cp - 180 - t_cp]*ncyc
+    for all the points of a profile.
+
+    Parameters
+    ----------
+    p_frees : ndarray
+        Free-precession propagators during t_cp, shape (..., n, d, d), as
+        returned by 'compute_propagators'.
+    p_180 : ndarray
+        Propagator of the refocusing pulse, shape (d, d), or stack of
+        propagators broadcasting against 'p_frees', e.g. (m, 1, d, d) for one
+        pulse per residue of a batch.
+    ncycs : sequence of int
+        Number of echoes of each train.
+
+    Returns
+    -------
+    out : ndarray
+        Propagators of the echo trains, shape (..., n, d, d).
+
+    """
+
+    p_echoes = np.matmul(np.matmul(p_frees, p_180), p_frees)
+
+    return matrix_powers(p_echoes, ncycs)
+
+
+def compute_echo_train_derivatives(p_frees, d_p_frees, p_180, ncycs):
+    """
+    Computes the propagators of the CPMG echo trains [t_cp - 180 - t_cp]*ncyc
+    and their derivatives with respect to the parameters of the free
+    precession Liouvillian.
+
+    The power of an echo E and its derivative are the upper left and upper
+    right blocks of the same power of the block matrix [[E, dE], [0, E]].
+
+    Parameters
+    ----------
+    p_frees : ndarray
+        Free-precession propagators during t_cp, shape (n, d, d).
+    d_p_frees : ndarray
+        Derivatives of the free-precession propagators, shape (k, n, d, d), as
+        returned by 'compute_propagator_derivatives'. k may be 0.
+    p_180 : ndarray
+        Propagator of the refocusing pulse, shape (d, d).
+    ncycs : sequence of int
+        Number of echoes of each train.
+
+    Returns
+    -------
+    p_trains : ndarray
+        Propagators of the echo trains, shape (n, d, d).
+    d_p_trains : ndarray
+        Derivatives of the propagators of the echo trains, shape (k, n, d, d).
+
+    """
+
+    p_frees, d_p_frees = np.asarray(p_frees), np.asarray(d_p_frees)
+    size = p_frees.shape[-1]
+
+    if len(d_p_frees) == 0:
+        return (compute_echo_trains(p_frees, p_180, ncycs),
+                np.zeros((0,) + p_frees.shape, dtype=p_frees.dtype))
+
+    p_echoes = np.matmul(np.matmul(p_frees, p_180), p_frees)
+    d_p_echoes = (np.matmul(np.matmul(d_p_frees, p_180), p_frees) +
+                  np.matmul(np.matmul(p_frees, p_180), d_p_frees))
+
+    blocks = np.zeros(d_p_echoes.shape[:-2] + (2 * size, 2 * size),
+                      dtype=d_p_echoes.dtype)
+    blocks[..., :size, :size] = p_echoes
+    blocks[..., size:, size:] = p_echoes
+    blocks[..., :size, size:] = d_p_echoes
+
+    powers = matrix_powers(blocks, ncycs)
+
+    return powers[0, ..., :size, :size], powers[..., :size, size:]
+
+
+def compute_batch_propagators(liouvillians, time):
+    """
+    Computes the propagators expm(liouvillian * time) for a whole stack of
+    Liouvillians with one batched eigendecomposition.
+
+    As in 'compute_propagators', the Liouvillians whose eigenvectors have a
+    condition number above 'MAX_COND' are exponentiated with 'expm', so that
+    the propagators are accurate to about 1e-11 relative to their norm.
+
+    Parameters
+    ----------
+    liouvillians : ndarray
+        Liouvillians, shape (..., d, d).
+    time : float
+        Delay in s.
+
+    Returns
+    -------
+    out : ndarray
+        Propagators, same shape as 'liouvillians'.
+
+    """
+
+    liouvillians = np.asarray(liouvillians)
+    shape = liouvillians.shape
+    liouvillians = liouvillians.reshape((-1,) + shape[-2:])
+
+    eigenvalues, eigenvectors = eig(liouvillians)
+
+    propagators = np.einsum(
+        'nij,njk->nik',
+        eigenvectors * np.exp(eigenvalues * time)[:, np.newaxis, :],
+        inv(eigenvectors)
+    )
+
+    if np.isrealobj(liouvillians):
+        propagators = propagators.real
+
+    singular_values = svd(eigenvectors, compute_uv=False)
+    ill_conditioned = singular_values[:, 0] > MAX_COND * singular_values[:, -1]
+
+    for index in np.flatnonzero(ill_conditioned):
+        propagators[index] = expm(liouvillians[index] * time)
+
+    return propagators.reshape(shape)
+
+
+def compute_averaged_propagators(liouvillians, weights, time):
+    """
+    Computes the weighted sums of the propagators of a stack of Liouvillians,
+    e.g. to average over the B1 inhomogeneity samples and the components of a
+    multiplet for each B1 offset of a CEST profile.
+
+    Parameters
+    ----------
+    liouvillians : ndarray
+        Liouvillians, shape (n, m, d, d).
+    weights : ndarray
+        Weights of the Liouvillians, shape (n, m).
+    time : float
+        Delay in s.
+
+    Returns
+    -------
+    out : ndarray
+        Averaged propagators, shape (n, d, d).
+
+    """
+
+    propagators = compute_batch_propagators(liouvillians, time)
+
+    return np.einsum('nm,nmij->nij', weights, propagators)
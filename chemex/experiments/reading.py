@@ -2,17 +2,62 @@
 
 import pkgutil
 import ConfigParser
+import hashlib
+import importlib
 import os
 import os.path
 import sys
+import tempfile
 
+import scipy as sc
 
-def read_file_exp(input_file, res_incl=None, res_excl=None):
+from chemex import caching, utils
+
+# Version of the format of the dataset cache files, to be increased whenever
+# the way the datasets are stored changes (a change of the code reading them
+# is caught by the hash of the sources)
+DATA_CACHE_VERSION = 3
+
+# Directory of the dataset cache (see 'set_data_cache')
+_data_cache_dir = None
+
+
+def set_data_cache(directory):
+    """
+    Stores the datasets read from the "experiment" files in 'directory', one
+    file per experiment file (and residue selection), so that later runs
+    rebuild the data points from it instead of parsing the data files again.
+
+    A cached dataset is only used while the code of the package, the
+    experiment file and all the data files it lists are unchanged. A file
+    whose modification time and size are unchanged is not read again;
+    otherwise it is only considered changed if the SHA-1 hash of its
+    contents differs (e.g. a file touched or copied over with the same
+    contents).
+
+    """
+
+    global _data_cache_dir
+
+    utils.make_dir(directory)
+    _data_cache_dir = directory
+
+
+def read_file_exp(input_file, res_incl=None, res_excl=None, jobs=1):
     """Reads the "experiment" file containing the experimental parameters
-    and the location of the data files"""
+    and the location of the data files (which are read over 'jobs'
+    processes)"""
 
     data = None
 
+    cache_filename = get_data_cache_filename(input_file, res_incl, res_excl)
+
+    if cache_filename is not None:
+        data = load_data_cache(cache_filename)
+
+        if data is not None:
+            return data
+
     # Get the directory of the input file
     working_dir = os.path.dirname(input_file)
 
@@ -37,7 +82,7 @@ def read_file_exp(input_file, res_incl=None, res_excl=None):
         exp_par = get_exp_par(cfg)
 
         # Reads experimental measurements
-        data = get_data(cfg, working_dir, exp_par, res_incl, res_excl)
+        data = get_data(cfg, working_dir, exp_par, res_incl, res_excl, jobs)
 
     except ConfigParser.NoSectionError:
         exit("\nIn {:s}, {:s}!\n".format(input_file, sys.exc_info()[1]))
@@ -45,6 +90,10 @@ def read_file_exp(input_file, res_incl=None, res_excl=None):
     except KeyboardInterrupt:
         exit("\n -- ChemEx killed while reading experiment and data files\n")
 
+    if cache_filename is not None and data:
+        filenames = [input_file] + get_data_filenames(cfg, working_dir)
+        save_data_cache(cache_filename, data, filenames)
+
     return data
 
 
@@ -70,7 +119,8 @@ def get_exp_par(cfg):
     return experimental_parameters
 
 
-def get_data(cfg, working_dir, global_parameters, res_incl=None, res_excl=None):
+def get_data(cfg, working_dir, global_parameters, res_incl=None, res_excl=None,
+             jobs=1):
     """Reads experimental measurements"""
 
     exp_type = global_parameters['experiment_type']
@@ -98,6 +148,229 @@ def get_data(cfg, working_dir, global_parameters, res_incl=None, res_excl=None):
     )
 
     data = reading.read_data(cfg, working_dir, global_parameters, res_incl,
-                             res_excl)
+                             res_excl, jobs)
 
     return data
+
+
+def get_data_filenames(cfg, working_dir):
+    """Lists the data files of an "experiment" file"""
+
+    if not (cfg.has_option('path', 'exp_data_dir') and
+            cfg.has_section('data')):
+        return []
+
+    exp_data_dir = utils.normalize_path(working_dir,
+                                        cfg.get('path', 'exp_data_dir'))
+
+    return [os.path.join(exp_data_dir, filename)
+            for _, filename in cfg.items('data')]
+
+
+def get_data_cache_filename(input_file, res_incl=None, res_excl=None):
+    """Gives the name of the dataset cache file of an "experiment" file and
+    residue selection, None if there is no dataset cache"""
+
+    if _data_cache_dir is None:
+        return None
+
+    key = repr((DATA_CACHE_VERSION, caching.get_source_hash(),
+                os.path.abspath(input_file), res_incl, res_excl))
+
+    return os.path.join(_data_cache_dir,
+                        hashlib.sha1(key).hexdigest() + '.npz')
+
+
+def get_file_state(filename):
+    """Gives the modification time and size of a file, None if the file
+    does not exist"""
+
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+
+    return stat.st_mtime, stat.st_size
+
+
+def is_file_unchanged(filename, state, file_hash):
+    """Tells whether a file still has the state (modification time and size)
+    or, failing that, the hash of its contents it had when it was cached"""
+
+    if state is not None and get_file_state(filename) == tuple(state):
+        return True
+
+    return file_hash is not None and get_file_hash(filename) == file_hash
+
+
+def get_file_hash(filename):
+    """Gives the SHA-1 hash of the contents of a file, None if the file
+    cannot be read"""
+
+    sha1 = hashlib.sha1()
+
+    try:
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha1.update(chunk)
+    except (IOError, OSError):
+        return None
+
+    return sha1.hexdigest()
+
+
+def make_object_array(values):
+    """Makes a 1D array of objects (e.g. tuples) out of 'values'"""
+
+    array = sc.empty(len(values), dtype=object)
+
+    for index, value in enumerate(values):
+        array[index] = value
+
+    return array
+
+
+def index_values(column):
+    """Gives the distinct values of 'column' (in order of appearance) and the
+    index of the value of each of its items"""
+
+    values = []
+    indexes = {}
+
+    for value in column:
+        if value not in indexes:
+            indexes[value] = len(values)
+            values.append(value)
+
+    return sc.asarray([indexes[value] for value in column]), values
+
+
+def save_data_cache(cache_filename, data, filenames):
+    """
+    Stores a dataset in the dataset cache.
+
+    The values and uncertainties are stored as arrays, and so are the
+    parameters that differ between the data points (e.g. 'ncyc', 'b1_offset',
+    'intensity_ref', 'resonance_id'), one array per parameter. The parameters
+    shared by all the data points are stored once. The names of the
+    parameters of each data point are stored too, so that the data points are
+    rebuilt with their own parameters only.
+
+    """
+
+    data_point_classes = set(type(data_point) for data_point in data)
+
+    if len(data_point_classes) != 1:
+        return
+
+    data_point_class, = data_point_classes
+
+    keys, key_sets = index_values(
+        [tuple(sorted(data_point.par)) for data_point in data])
+
+    names = set()
+    for key_set in key_sets:
+        names.update(key_set)
+
+    shared = {}
+    columns = {}
+
+    for name in names:
+        column = [data_point.par[name] for data_point in data
+                  if name in data_point.par]
+
+        if all(value == column[0] for value in column):
+            shared[name] = column[0]
+            continue
+
+        array = sc.asarray(column)
+
+        if array.ndim == 1 and array.dtype.kind in 'biufS':
+            columns['par_' + name] = array
+            continue
+
+        # Other values (e.g. tuples) are stored once, the column holding the
+        # index of the value of each data point
+        columns['par_' + name], values = index_values(column)
+        columns['values_' + name] = make_object_array(values)
+
+    # The state is taken before the hash, so that a file modified in between
+    # is hashed again by the next run
+    hashes = [(filename, get_file_state(filename), get_file_hash(filename))
+              for filename in filenames]
+
+    # The file is written next to its final location and then renamed, so
+    # that concurrent runs never read a partially written file
+    file_descriptor, temporary_filename = tempfile.mkstemp(
+        dir=_data_cache_dir, suffix='.tmp')
+
+    try:
+        with os.fdopen(file_descriptor, 'wb') as f:
+            sc.savez(
+                f,
+                module=data_point_class.__module__,
+                hashes=make_object_array(hashes),
+                keys=keys,
+                key_sets=make_object_array(key_sets),
+                shared=sc.asarray(shared, dtype=object),
+                val=sc.asarray([data_point.val for data_point in data]),
+                err=sc.asarray([data_point.err for data_point in data]),
+                **columns
+            )
+        os.rename(temporary_filename, cache_filename)
+
+    except (IOError, OSError):
+        if os.path.exists(temporary_filename):
+            os.remove(temporary_filename)
+
+
+def load_data_cache(cache_filename):
+    """Rebuilds a dataset from the dataset cache, None if it is not cached or
+    if any of its files changed since it was cached"""
+
+    try:
+        cache = sc.load(cache_filename, allow_pickle=True)
+    except (IOError, OSError, ValueError):
+        return None
+
+    with cache:
+        if not all(is_file_unchanged(filename, state, file_hash)
+                   for filename, state, file_hash in cache['hashes']):
+            return None
+
+        data_point_class = importlib.import_module(
+            str(cache['module'])).DataPoint
+
+        shared = cache['shared'].item()
+        key_sets = [set(key_set) for key_set in cache['key_sets']]
+        names = [key_sets[key] for key in cache['keys'].tolist()]
+        columns = []
+
+        for name in cache.files:
+            if not name.startswith('par_'):
+                continue
+
+            name = name[len('par_'):]
+            column = cache['par_' + name].tolist()
+
+            if 'values_' + name in cache.files:
+                values = cache['values_' + name]
+                column = [values[index] for index in column]
+
+            columns.append((name, column))
+        vals = cache['val'].tolist()
+        errs = cache['err'].tolist()
+
+    # Each data point only gets the parameters it had when it was cached
+    pars = [dict((name, value) for name, value in shared.items()
+                 if name in point_names)
+            for point_names in names]
+
+    for name, column in columns:
+        values = iter(column)
+        for par, point_names in zip(pars, names):
+            if name in point_names:
+                par[name] = next(values)
+
+    return [data_point_class(val, err, par)
+            for val, err, par in zip(vals, errs, pars)]
@@ -4,7 +4,6 @@ from chemex.parsing import parse_assignment
 from chemex.experiments.base_data_point import BaseDataPoint
 from back_calculation import calc_observable
 from chemex.constants import xi_ratio
-from ..plotting import plot_data
 
 
 TWO_PI = 2.0 * pi
@@ -27,7 +26,7 @@ class DataPoint(BaseDataPoint):
 
     def __init__(self, val, err, par):
         BaseDataPoint.__init__(self, val, err, par, PAR_DICT['par_conv'],
-                               plot_data)
+                               'shift')
 
         self.par['ppm_to_rads_h'] = TWO_PI * self.par['h_larmor_frq']
         self.par['ppm_to_rads_n'] = TWO_PI * self.par['h_larmor_frq'] * RATIO
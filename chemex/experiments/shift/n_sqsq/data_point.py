@@ -4,7 +4,6 @@ from ....parsing import parse_assignment
 from ....experiments.base_data_point import BaseDataPoint
 from ....constants import xi_ratio
 from .back_calculation import calc_observable
-from ..plotting import plot_data
 
 
 TWO_PI = 2.0 * pi
@@ -27,7 +26,7 @@ class DataPoint(BaseDataPoint):
 
     def __init__(self, val, err, par):
         BaseDataPoint.__init__(self, val, err, par, PAR_DICT['par_conv'],
-                               plot_data)
+                               'shift')
 
         self.par['ppm_to_rads_n_1'] = \
             TWO_PI * self.par['h_larmor_frq_1'] * RATIO
@@ -4,6 +4,7 @@ Created on Mar 30, 2011
 @author: guillaume
 """
 
+import functools
 import os
 
 import scipy as sc
@@ -11,7 +12,8 @@ import scipy as sc
 from chemex import utils
 
 
-def read_data(cfg, working_dir, global_parameters, res_incl=None, res_excl=None):
+def read_data(cfg, working_dir, global_parameters, res_incl=None, res_excl=None,
+              jobs=1):
     """Read the shifts"""
 
     # Reads the path to get the shifts
@@ -19,6 +21,7 @@ def read_data(cfg, working_dir, global_parameters, res_incl=None, res_excl=None)
                                         cfg.get('path', 'exp_data_dir'))
 
     data_points = list()
+    files = list()
 
     experiment_name = name_experiment(global_parameters)
 
@@ -32,7 +35,15 @@ def read_data(cfg, working_dir, global_parameters, res_incl=None, res_excl=None)
         parameters['experiment_name'] = experiment_name
 
         abs_path_filename = os.path.join(exp_data_dir, val)
-        data_points += read_a_shift_file(abs_path_filename, parameters, res_incl, res_excl)
+        files.append((abs_path_filename, parameters))
+
+    # The files are read over 'jobs' processes, the data points being then
+    # made in the order of the files
+    tasks = [functools.partial(load_a_shift_file, filename)
+             for filename, _ in files]
+
+    for (_, parameters), data in zip(files, utils.run_tasks(tasks, jobs)):
+        data_points += make_shift_data_points(parameters, data, res_incl, res_excl)
 
     return data_points
 
@@ -56,7 +67,18 @@ def name_experiment(global_parameters=None):
 def read_a_shift_file(filename, parameters, res_incl=None, res_excl=None):
     """Reads in the fuda file and spit out the intensities"""
 
-    data = sc.loadtxt(filename, dtype=[('resonance_id', 'S10'), ('shift_ppb', 'f8'), ('shift_ppb_err', 'f8')])
+    return make_shift_data_points(parameters, load_a_shift_file(filename),
+                                  res_incl, res_excl)
+
+
+def load_a_shift_file(filename):
+    """Reads in the fuda file"""
+
+    return sc.loadtxt(filename, dtype=[('resonance_id', 'S10'), ('shift_ppb', 'f8'), ('shift_ppb_err', 'f8')])
+
+
+def make_shift_data_points(parameters, data, res_incl=None, res_excl=None):
+    """Makes the data points of the shifts read in the fuda file"""
 
     data_points = list()
 
@@ -4,20 +4,27 @@ import itertools
 import os.path
 import ConfigParser
 import sys
+from collections import OrderedDict
+from functools import partial
 
 import scipy as sp
+import scipy.linalg
+import scipy.sparse
+import scipy.sparse.linalg
 import scipy.optimize as opt
 
 from chemex import utils
 from chemex import chi2
 from chemex import writing
 from chemex.experiments import misc
+from chemex.experiments.dataset import Dataset
 
 
 product = itertools.product
 
 
-def run_fit(fit_filename, par, par_indexes, par_fixed, data):
+def run_fit(fit_filename, par, par_indexes, par_fixed, data, jobs=1,
+            sparse=False):
     fit_par_file = ConfigParser.SafeConfigParser()
 
     utils.header1("Fit")
@@ -55,60 +62,105 @@ def run_fit(fit_filename, par, par_indexes, par_fixed, data):
         independent_clusters = find_independent_clusters(data, par,
                                                          par_indexes,
                                                          par_fixed)
-        independent_clusters_no = len(independent_clusters)
 
-        par_err = list(par)
+        par, par_err = fit_clusters(par, par_indexes, par_fixed, data,
+                                    independent_clusters, jobs,
+                                    sparse=sparse)
 
-        if independent_clusters_no > 1:
+        print("\nFinal Chi2        : {:.3e}".format(
+            chi2.calc_chi2(par, par_indexes, par_fixed, data)))
+        print("Final Reduced Chi2: {:.3e}".format(
+            chi2.calc_reduced_chi2(par, par_indexes, par_fixed, data)))
 
-            for i, independent_cluster in enumerate(independent_clusters, 1):
+    return par, par_err, par_indexes, par_fixed
 
-                print('\nChi2 / Reduced Chi2 (cluster {}/{}):'
-                      .format(i, independent_clusters_no))
 
-                c_data, c_par, c_par_indexes = independent_cluster
-                c_par, c_par_err, _c_reduced_chi2 = local_minimization(
-                    c_par,
-                    c_par_indexes,
-                    par_fixed,
-                    c_data,
-                    verbose=True
-                )
+def fit_clusters(par, par_indexes, par_fixed, data, independent_clusters,
+                 jobs=1, verbose=True, sparse=False):
+    """
+    Fits the independent clusters one by one (or in parallel with more than
+    one job) and merges the fitted values and errors back into 'par'.
+    """
 
-                for par_name in c_par_indexes:
-                    index = par_indexes[par_name]
-                    par[index] = c_par[c_par_indexes[par_name]]
-                    par_err[index] = c_par_err[c_par_indexes[par_name]]
+    independent_clusters_no = len(independent_clusters)
 
-        else:
+    if independent_clusters_no <= 1:
+        if verbose:
             print("\nChi2 / Reduced Chi2:")
-            par, par_err, reduced_chi2 = local_minimization(par, par_indexes,
-                                                            par_fixed, data)
+        par, par_err, _reduced_chi2 = local_minimization(par, par_indexes,
+                                                         par_fixed, data,
+                                                         verbose, sparse)
+        return par, par_err
 
-        print("\nFinal Chi2        : {:.3e}".format(
-            chi2.calc_chi2(par, par_indexes, par_fixed, data)))
-        print("Final Reduced Chi2: {:.3e}".format(
-            chi2.calc_reduced_chi2(par, par_indexes, par_fixed, data)))
+    par = sp.array(par)
+    par_err = sp.array(par)
 
-    return par, par_err, par_indexes, par_fixed
+    tasks = [
+        partial(fit_cluster, independent_cluster, par_fixed,
+                i, independent_clusters_no, verbose, sparse)
+        for i, independent_cluster in enumerate(independent_clusters, 1)
+    ]
+
+    results = utils.run_tasks(tasks, jobs)
+
+    for independent_cluster, (c_par, c_par_err) in zip(
+            independent_clusters, results):
+
+        _c_data, _c_par, c_par_indexes = independent_cluster
 
+        for par_name in c_par_indexes:
+            index = par_indexes[par_name]
+            par[index] = c_par[c_par_indexes[par_name]]
+            par_err[index] = c_par_err[c_par_indexes[par_name]]
 
-def local_minimization(par, par_indexes, par_fixed, data, verbose=True):
+    return par, par_err
+
+
+def fit_cluster(independent_cluster, par_fixed, index, independent_clusters_no,
+                verbose=True, sparse=False):
     """
-    Minimize the residuals using the Levenberg-Marquard algorithm.
+    Fits one of the independent clusters found by 'find_independent_clusters'.
+    """
+
+    if verbose:
+        print('\nChi2 / Reduced Chi2 (cluster {}/{}):'
+              .format(index, independent_clusters_no))
+
+    c_data, c_par, c_par_indexes = independent_cluster
+    c_par, c_par_err, _c_reduced_chi2 = local_minimization(
+        c_par,
+        c_par_indexes,
+        par_fixed,
+        c_data,
+        verbose=verbose,
+        sparse=sparse
+    )
+
+    return c_par, c_par_err
+
+
+def local_minimization(par, par_indexes, par_fixed, data, verbose=True,
+                       sparse=False):
+    """
+    Minimize the residuals using the Levenberg-Marquard algorithm, or a
+    trust-region algorithm working on the sparse Jacobian if 'sparse' is set.
     """
 
     func = chi2.make_calc_residuals(verbose=verbose)
-    args = (par_indexes, par_fixed, data)
+    args = (par_indexes, par_fixed, data.profiles)
 
     try:
-        out = opt.leastsq(func, par, args=args,
-                          full_output=True,
-                          ftol=1e-9,
-                          xtol=1e-9,
-                          maxfev=100000,
-                          epsfcn=1e-10,
-                          factor=0.1)
+        if sparse:
+            out = sparse_leastsq(func, par, args=args)
+        else:
+            out = opt.leastsq(func, par, args=args,
+                              Dfun=chi2.calc_jacobian,
+                              full_output=True,
+                              ftol=1e-9,
+                              xtol=1e-9,
+                              maxfev=100000,
+                              epsfcn=1e-10,
+                              factor=0.1)
 
     except TypeError:
         sys.stderr.write(' -- Error encountered during minimization:\n')
@@ -129,7 +181,7 @@ def local_minimization(par, par_indexes, par_fixed, data, verbose=True):
 
     if (data_nb > par_nb) and pcov is not None:
         pcov = pcov * reduced_chi2
-        par_err = sp.sqrt(sp.diag(pcov))
+        par_err = sp.sqrt(pcov.diagonal())
 
     else:
         par_err = par
@@ -137,6 +189,66 @@ def local_minimization(par, par_indexes, par_fixed, data, verbose=True):
     return par, par_err, reduced_chi2
 
 
+def sparse_leastsq(func, par, args=()):
+    """
+    Minimize the residuals with 'least_squares' using the sparse Jacobian
+    of the residuals, so that the cost of the iterations of large global fits
+    grows linearly with the number of residues instead of quadratically.
+
+    Returns the same output as 'leastsq' with 'full_output' set, except for
+    the covariance matrix of which only the diagonal is computed (see
+    'calc_sparse_covariance').
+    """
+
+    if not hasattr(opt, 'least_squares'):
+        exit("\nThe sparse solver requires scipy 0.17 or later.\n")
+
+    result = opt.least_squares(func, par, args=args,
+                               jac=chi2.calc_sparse_jacobian,
+                               method='trf',
+                               tr_solver='lsmr',
+                               x_scale='jac',
+                               ftol=1e-9,
+                               xtol=1e-9,
+                               max_nfev=100000)
+
+    pcov = calc_sparse_covariance(result.jac)
+
+    infodict = {'nfev': result.nfev, 'fvec': result.fun}
+
+    return result.x, pcov, infodict, result.message, result.status
+
+
+def calc_sparse_covariance(jacobian, chunk_size=256):
+    """
+    Calculates the variances of the parameters (the diagonal of the inverse
+    of J^T.J) from the sparse LU factorization of J^T.J, solving for a chunk
+    of columns of the identity matrix at a time. Neither J^T.J nor its inverse
+    is ever stored as a dense matrix.
+
+    Returns the variances as a sparse diagonal matrix, None if J^T.J is
+    singular.
+    """
+
+    hessian = jacobian.T.dot(jacobian).tocsc()
+    size = hessian.shape[0]
+
+    try:
+        factorization = scipy.sparse.linalg.splu(hessian)
+    except RuntimeError:
+        return None
+
+    variances = sp.empty(size)
+
+    for start in range(0, size, chunk_size):
+        indexes = sp.arange(start, min(start + chunk_size, size))
+        identity = sp.zeros((size, len(indexes)))
+        identity[indexes, sp.arange(len(indexes))] = 1.0
+        variances[indexes] = factorization.solve(identity)[indexes, sp.arange(len(indexes))]
+
+    return scipy.sparse.diags(variances, 0)
+
+
 def fix_par(items, par, par_indexes, par_fixed):
     """
     Fix (or not) fit variables according to what set in the protocol file.
@@ -150,18 +262,17 @@ def fix_par(items, par, par_indexes, par_fixed):
         'fix': (fitted_pars, params_fix)
     }
 
+    par_names_index = utils.index_par_names(fitted_pars | params_fix)
+
     for param_1, state in items:
 
         param_1_str = param_1.replace(' ', '').split(',')
         pool_start, pool_end = options[state]
 
-        for param_2 in list(pool_start):
-
-            param_2_str = [str(_) for _ in param_2]
+        params_2 = utils.match_par_names(par_names_index, param_1_str) & pool_start
 
-            if set(param_1_str) <= set(param_2_str):
-                pool_start.remove(param_2)
-                pool_end.add(param_2)
+        pool_start.difference_update(params_2)
+        pool_end.update(params_2)
 
     par_indexes_updated = dict()
     par_updated = list()
@@ -180,57 +291,97 @@ def fix_par(items, par, par_indexes, par_fixed):
     return par_updated, par_indexes_updated, par_fixed_updated
 
 
-def get_params_fit(data_pt, params_fix):
-    """Returns the fitted parameters a specific data point depends on."""
+def get_params_fit(profile, params_fix):
+    """Returns the fitted parameters a specific profile depends on."""
 
-    data_pt_params = (
+    profile_params = (
         (
-            data_pt.get_fitting_parameter_names() |
-            data_pt.get_fixed_parameter_names()
+            profile.get_fitting_parameter_names() |
+            profile.get_fixed_parameter_names()
         ) - params_fix
     )
 
-    return data_pt_params
+    return profile_params
 
 
 def find_independent_clusters(data, par, par_indexes, par_fixed):
     """
-    Finds clusters of data points that depend on independent sets of variables.
+    Finds clusters of profiles that depend on independent sets of variables.
     For example, if the population of the minor state and the exchange rate are
     set to 'fix', chances are that the fit can be decomposed
     residue-specifically.
+
+    The parameters are merged in a disjoint-set forest (union by size with
+    path compression), so that two clusters bridged by a later profile end
+    up in the same cluster, in near-linear time.
     """
 
     params_fix = set(par_fixed)
 
-    clusters = []
+    parents = OrderedDict()
+    sizes = {}
+    params_pts = []
 
-    for data_pt in data:
+    for profile in data.profiles:
 
-        params_pt = get_params_fit(data_pt, params_fix)
+        params_pt = list(get_params_fit(profile, params_fix))
+        params_pts.append(params_pt)
 
-        for data_cluster, params_cluster in clusters:
+        for param in params_pt:
+            if param not in parents:
+                parents[param] = param
+                sizes[param] = 1
 
-            if params_pt & params_cluster:
-                data_cluster.append(data_pt)
-                params_cluster.update(params_pt)
-                break
+        for param in params_pt[1:]:
+            root_1 = _find_root(parents, params_pt[0])
+            root_2 = _find_root(parents, param)
 
-        else:
-            clusters.append(([data_pt], params_pt))
+            if root_1 != root_2:
+                if sizes[root_1] < sizes[root_2]:
+                    root_1, root_2 = root_2, root_1
+                parents[root_2] = root_1
+                sizes[root_1] += sizes[root_2]
 
-    clusters_final = list()
+    # Profiles that do not depend on any fitted parameter do not belong to
+    # any cluster
+    clusters = OrderedDict()
+
+    for profile, params_pt in zip(data.profiles, params_pts):
+        if params_pt:
+            root = _find_root(parents, params_pt[0])
+            clusters.setdefault(root, ([], []))[0].append(profile)
 
-    for data_cluster, params_cluster in clusters:
+    for param in parents:
+        clusters[_find_root(parents, param)][1].append(param)
 
-        par_cluster = []
-        par_indexes_cluster = {}
+    par = sp.asarray(par)
+
+    clusters_final = list()
 
-        for index, param in enumerate(params_cluster):
-            par_cluster.append(par[par_indexes[param]])
-            par_indexes_cluster[param] = index
+    for data_cluster, params_cluster in clusters.values():
 
-        clusters_final.append((data_cluster, par_cluster, par_indexes_cluster))
+        indexes = [par_indexes[param] for param in params_cluster]
+        par_cluster = par[indexes]
+        par_indexes_cluster = dict(
+            (param, index) for index, param in enumerate(params_cluster))
+
+        clusters_final.append((Dataset(data_cluster), par_cluster,
+                               par_indexes_cluster))
 
     return clusters_final
 
+
+def _find_root(parents, param):
+    """Finds the root of 'param' in the disjoint-set forest 'parents' and
+    compresses the path on the way."""
+
+    root = param
+
+    while parents[root] != root:
+        root = parents[root]
+
+    while parents[param] != root:
+        parents[param], param = root, parents[param]
+
+    return root
+
@@ -3,6 +3,7 @@ import pkgutil
 import re
 import sys
 
+import chemex.caching
 import chemex.experiments
 import chemex.version
 
@@ -131,6 +132,79 @@ def arg_parse():
         help='No plots of the fits'
     )
 
+    parser_fit.add_argument(
+        '--jobs',
+        metavar='N',
+        type=int,
+        default=1,
+        help='Number of processes used to read the data files, to fit '
+             'independent clusters and bootstrap or Monte-Carlo replicas'
+    )
+
+    parser_fit.add_argument(
+        '--sparse',
+        action='store_true',
+        help='Use a solver working on the sparse Jacobian (faster for large '
+             'global fits)'
+    )
+
+    parser_fit.add_argument(
+        '--cache-stats',
+        action='store_true',
+        help='Print the hits, misses, evictions and time saved of the caches '
+             'of the back-calculations at the end of the fit'
+    )
+
+    parser_fit.add_argument(
+        '--cache-size',
+        metavar='PATTERN=SIZE',
+        nargs='+',
+        default=[],
+        help='Maximum size of the caches whose name matches PATTERN (e.g. '
+             '\'*.make_propagators=4\'), \'none\' for no limit'
+    )
+
+    parser_fit.add_argument(
+        '--cache-rtol',
+        metavar='PATTERN=RTOL',
+        nargs='+',
+        default=[],
+        help='Relative tolerance within which the caches whose name matches '
+             'PATTERN consider float arguments identical (e.g. '
+             '\'*._calc_observables=1e-12\'), off by default. RTOL must be '
+             'below 1e-05, the relative step of the finite differences'
+    )
+
+    parser_fit.add_argument(
+        '--disk-cache',
+        metavar='FILE',
+        help='File in which the back-calculated profiles are stored to be '
+             'reused by later runs of the same fit'
+    )
+
+    parser_fit.add_argument(
+        '--disk-cache-size',
+        metavar='MB',
+        type=float,
+        default=512.0,
+        help='Maximum size of the disk or shared cache (default: 512 MB)'
+    )
+
+    parser_fit.add_argument(
+        '--data-cache',
+        metavar='DIR',
+        help='Directory in which the datasets read from the experiment files '
+             'are stored, so that later runs skip the parsing of the data '
+             'files that did not change'
+    )
+
+    parser_fit.add_argument(
+        '--shared-cache',
+        action='store_true',
+        help='Share the back-calculated profiles between the worker processes '
+             'through a temporary file in shared memory (with --jobs)'
+    )
+
     group_residue_selec = parser_fit.add_mutually_exclusive_group()
 
     group_residue_selec.add_argument(
@@ -155,14 +229,18 @@ def arg_parse():
         '--mc',
         metavar='N',
         type=int,
-        help='Run N Monte-Carlo simulation'
+        help='Run N Monte-Carlo simulation (each in its own numbered '
+             'sub-directory, with all the fitted parameters in '
+             'montecarlo.fit)'
     )
 
     group_simulation.add_argument(
         '--bs',
         metavar='N',
         type=int,
-        help='Run N Bootstrap simulation'
+        help='Run N Bootstrap simulation (each in its own numbered '
+             'sub-directory, with all the fitted parameters in '
+             'bootstrap.fit)'
     )
 
     args = parser.parse_args()
@@ -173,9 +251,44 @@ def arg_parse():
         if args.res_excl:
             args.res_excl = [res.lower() for res in args.res_excl]
 
+        args.cache_size = parse_cache_settings(
+            parser, '--cache-size', args.cache_size,
+            lambda size: None if size.lower() == 'none' else int(size))
+        args.cache_rtol = parse_cache_settings(
+            parser, '--cache-rtol', args.cache_rtol, parse_rtol)
+
     return args
 
 
+def parse_cache_settings(parser, option, values, convert):
+    """Parses the PATTERN=VALUE arguments of the cache options"""
+
+    settings = []
+
+    for value in values:
+        pattern, _, setting = value.rpartition('=')
+        try:
+            if not pattern:
+                raise ValueError
+            settings.append((pattern, convert(setting)))
+        except ValueError:
+            parser.error("argument {}: invalid value: '{}'".format(option, value))
+
+    return settings
+
+
+def parse_rtol(value):
+    """Converts a relative tolerance of the caches, which must be below the
+    relative step of the finite differences"""
+
+    rtol = float(value)
+
+    if not 0.0 <= rtol < chemex.caching.FINITE_DIFFERENCE_STEP:
+        raise ValueError
+
+    return rtol
+
+
 # Functions to parse Sparky-like assignment
 # Functions have been adapted from Sparky source code
 
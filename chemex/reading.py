@@ -5,7 +5,8 @@ import sys
 
 import scipy as sp
 
-from chemex import parsing
+from chemex import parsing, utils
+from chemex.experiments.dataset import Dataset
 
 
 def create_par_list_to_fit(par_filename, data):
@@ -24,8 +25,8 @@ def create_par_list_to_fit(par_filename, data):
     par, par_fixed = read_par(par_filename, par, par_indexes, par_fixed)
 
     # Filter Data
-    data = [data_pt for data_pt in data if
-            not data_pt.filter(par, par_indexes, par_fixed)]
+    data = data.select(
+        lambda data_pt: not data_pt.filter(par, par_indexes, par_fixed))
 
     return par, par_indexes, par_fixed, data
 
@@ -40,9 +41,10 @@ def create_fitting_parameters_array(data):
     parameters_to_fit = set()
     parameters_to_fix = set()
 
-    for data_point in data:
-        parameters_to_fit.update(data_point.get_fitting_parameter_names())
-        parameters_to_fix.update(data_point.get_fixed_parameter_names())
+    # All the data points of a profile depend on the same parameters
+    for profile in data.profiles:
+        parameters_to_fit.update(profile.get_fitting_parameter_names())
+        parameters_to_fix.update(profile.get_fixed_parameter_names())
 
     par = sp.zeros(len(parameters_to_fit))
 
@@ -68,11 +70,10 @@ def trim_datasets_using_par(data, par_indexes):
 
     parameters_to_fit = set(par_indexes.keys())
 
-    trimmed_data = list()
-
-    for data_point in data:
-        if data_point.get_fitting_parameter_names() <= parameters_to_fit:
-            trimmed_data.append(data_point)
+    trimmed_data = Dataset(
+        profile for profile in data.profiles
+        if profile.get_fitting_parameter_names() <= parameters_to_fit
+    )
 
     return trimmed_data
 
@@ -210,16 +211,14 @@ def read_par(input_file, par, par_indexes, par_fixed):
                   .format(num_updates, num_items, section))
 
     # Set parameters values to the default
-    for par_name_1, val in starting_parameters:
+    par_names_index = utils.index_par_names(list(par_indexes) + list(par_fixed))
 
-        for par_name_2, index in par_indexes.items():
-            par_name_2_str = [str(_) for _ in par_name_2]
-            if set(par_name_1) <= set(par_name_2_str):
-                par[index] = float(val)
+    for par_name_1, val in starting_parameters:
 
-        for par_name_2 in par_fixed:
-            par_name_2_str = [str(_) for _ in par_name_2]
-            if set(par_name_1) <= set(par_name_2_str):
+        for par_name_2 in utils.match_par_names(par_names_index, par_name_1):
+            if par_name_2 in par_indexes:
+                par[par_indexes[par_name_2]] = float(val)
+            else:
                 par_fixed[par_name_2] = float(val)
 
     # Check that fitting parameters are all initialized
@@ -1,5 +1,13 @@
+import multiprocessing
 import os
 import sys
+from cStringIO import StringIO
+
+from chemex import caching
+
+# Tasks handed over to the worker processes of 'run_tasks'. They are inherited
+# by the workers when the pool is forked, so they do not need to be picklable.
+_tasks = []
 
 
 def make_dir(path=None):
@@ -35,10 +43,10 @@ def normalize_path(working_dir, filename):
 def include_selection(data, selection):
     """Makes a new dataset including points whose 'id' is in selection."""
 
-    new_data = [
-        a_data_point for a_data_point in data
-        if a_data_point.par.get('resonance_id', None) in selection
-    ]
+    new_data = data.select(
+        lambda a_data_point:
+        a_data_point.par.get('resonance_id', None) in selection
+    )
 
     return new_data
 
@@ -46,21 +54,101 @@ def include_selection(data, selection):
 def exclude_selection(data, selection):
     """Makes a new dataset excluding points whose id is in selection."""
 
-    new_data = [
-        a_data_point for a_data_point in data
-        if a_data_point.par.get('resonance_id', None) not in selection
-    ]
+    new_data = data.select(
+        lambda a_data_point:
+        a_data_point.par.get('resonance_id', None) not in selection
+    )
 
-    if new_data == data:
+    if len(new_data) == len(data):
         sys.stdout.write("\n No Data removed! Aborting ...\n")
         exit(1)
 
     return new_data
 
 
+def index_par_names(par_names):
+    """Makes an inverted index from the tokens of the parameter names (as
+    strings) to the parameter names containing them."""
+
+    index = {}
+
+    for par_name in par_names:
+        for token in par_name:
+            index.setdefault(str(token), set()).add(par_name)
+
+    return index
+
+
+def match_par_names(index, tokens):
+    """Returns the parameter names of the inverted 'index' containing all the
+    'tokens'."""
+
+    matches = sorted((index.get(token, set()) for token in set(tokens)), key=len)
+
+    if not matches:
+        return set()
+
+    return matches[0].intersection(*matches[1:])
+
+
 def header1(string):
     print("\n".join(["", "", string, "=" * len(string)]))
 
 
 def header2(string):
     print("\n".join(["", string, "-" * len(string)]))
+
+
+def _run_task(index):
+    """Runs a task in a worker process and captures what it prints and the
+    statistics of the caches."""
+
+    stdout, sys.stdout = sys.stdout, StringIO()
+    caching.reset_cache_stats()
+
+    try:
+        result, exit_status = _tasks[index](), None
+    except SystemExit as error:
+        result, exit_status = None, error.code
+    finally:
+        output, sys.stdout = sys.stdout.getvalue(), stdout
+
+    return result, output, exit_status, caching.get_cache_stats()
+
+
+def run_tasks(tasks, jobs=1):
+    """Runs the tasks (callables without arguments) and yields their results.
+
+    With more than one job, the tasks are distributed over a pool of worker
+    processes. Whatever a task prints is written once it has completed, so
+    that both the results and the output come in the order of 'tasks'.
+    """
+
+    global _tasks
+
+    tasks = list(tasks)
+    jobs = min(jobs, len(tasks))
+
+    if jobs <= 1:
+        for task in tasks:
+            yield task()
+        return
+
+    _tasks = tasks
+    sys.stdout.flush()
+    pool = multiprocessing.Pool(jobs)
+
+    try:
+        for result, output, exit_status, cache_stats in pool.imap(_run_task, range(len(tasks))):
+            sys.stdout.write(output)
+            sys.stdout.flush()
+            caching.merge_cache_stats(cache_stats)
+
+            if exit_status is not None:
+                exit(exit_status)
+
+            yield result
+
+    finally:
+        pool.terminate()
+        _tasks = []
@@ -40,8 +40,6 @@ def write_par(par, par_err, par_indexes, par_fixed, output_dir='./'):
 
     par_names = set(par_indexes) | set(par_fixed)
 
-    par_name_global = set(['KEX', 'KEX_AB', 'KEX_BC', 'KEX_AC', 'PB', 'PC'])
-
     par_dict = {}
 
     for name in par_names:
@@ -63,15 +61,37 @@ def write_par(par, par_err, par_indexes, par_fixed, output_dir='./'):
 
     for name, val in sorted(par_dict.items()):
 
-        name_list = list(name)
+        section, name_str = format_par_name(name)
 
-        if name_list[0].upper() in par_name_global:
-            name_str = ', '.join([str(_).upper() for _ in name_list])
-            section = 'global'
+        try:
+            cfg.add_section(section)
 
-        else:
-            name_str = str(name_list.pop(1)).upper()
-            section = ', '.join([str(_).upper() for _ in name_list])
+        except DuplicateSectionError:
+            pass
+
+        cfg.set(section, name_str, val)
+
+    with open(filename, 'w') as f:
+        cfg.write(f)
+
+
+def write_par_simulations(pars, par_indexes, output_dir='./',
+                          filename='simulations.fit'):
+    """Write the fitted parameters of all the bootstrap or Monte-Carlo
+    replicas into a single file"""
+
+    from ConfigParser import SafeConfigParser, DuplicateSectionError
+
+    filename = os.path.join(output_dir, filename)
+
+    print("  * {}".format(filename))
+
+    cfg = SafeConfigParser()
+    cfg.optionxform = str
+
+    for name, index in sorted(par_indexes.items()):
+
+        section, name_str = format_par_name(name)
 
         try:
             cfg.add_section(section)
@@ -79,11 +99,33 @@ def write_par(par, par_err, par_indexes, par_fixed, output_dir='./'):
         except DuplicateSectionError:
             pass
 
+        val = ' '.join('{: .5e}'.format(par[index]) for par in pars)
+
         cfg.set(section, name_str, val)
 
     with open(filename, 'w') as f:
         cfg.write(f)
 
+
+def format_par_name(name):
+    """Returns the section and the option names of a parameter as written in
+    the output parameter files"""
+
+    par_name_global = set(['KEX', 'KEX_AB', 'KEX_BC', 'KEX_AC', 'PB', 'PC'])
+
+    name_list = list(name)
+
+    if name_list[0].upper() in par_name_global:
+        name_str = ', '.join([str(_).upper() for _ in name_list])
+        section = 'global'
+
+    else:
+        name_str = str(name_list.pop(1)).upper()
+        section = ', '.join([str(_).upper() for _ in name_list])
+
+    return section, name_str
+
+
 def write_chi2(par, par_indexes, par_fixed, data, output_dir='./'):
     """
     Write reduced chi2
@@ -92,9 +134,9 @@ def write_chi2(par, par_indexes, par_fixed, data, output_dir='./'):
     data_nb = len(data)
     par_nb = len(par)
 
-    residuals = sc.asarray(
-        [data_point.calc_residual(par, par_indexes, par_fixed)
-         for data_point in data])
+    residuals = sc.concatenate(
+        [profile.calc_residuals(par, par_indexes, par_fixed)
+         for profile in data.profiles])
 
     _ks_value, ks_p_value = st.kstest(residuals, 'norm')
 